@@ -0,0 +1,149 @@
+import pygame
+from typing import Union, Dict
+import numpy as np
+
+from settings import *
+from particle_store import COLOR_LUT, speed_buckets
+
+def kinetic_temperature(velocities: np.ndarray, masses: Union[np.ndarray, float]) -> float:
+    """ Temperature measured from the kinetic energy of the particles, on the scale of Closed_System.temperature. """
+    if len(velocities) == 0:
+        return 0.0
+    # the velocities are generated with <v^2> = VELOCITY_SCALE^2 * 3kT/m (see generate_velocities)
+    mean_mass_speed_squared = np.mean(masses * np.einsum("ij,ij->i", velocities, velocities))
+    return float(mean_mass_speed_squared / (3 * BOLTZMANNS_CONSTANT * VELOCITY_SCALE ** 2))
+
+class Speed_Distribution:
+    """ Online histogram and moments of the particle speeds.
+
+    Every update() makes one vectorized pass over the velocities and folds the result into running statistics,
+    either an exponential moving average (decay is the weight of the newest step) or a sliding window of window_steps steps
+    kept as a running sum. The history is never recomputed.
+    """
+    def __init__(self, bins: int = SPEED_HISTOGRAM_BINS, max_speed: float = SPEED_HISTOGRAM_MAX_SPEED, decay: float = SPEED_DISTRIBUTION_DECAY,
+                 window_steps: Union[int, None] = SPEED_DISTRIBUTION_WINDOW) -> None:
+        self.bins: int = bins
+        self.max_speed: float = max_speed
+        self.bin_width: float = max_speed / bins
+        self.bin_edges: np.ndarray = np.linspace(0, max_speed, bins + 1)
+        self.decay: float = decay
+        self.window_steps: Union[int, None] = window_steps
+
+        # statistics per step: the histogram as fractions (the last bin also holds faster particles), then the means of s, s^2, s^3, s^4 and m s^2
+        self.statistics_size: int = bins + 5
+        self.statistics: np.ndarray = np.zeros(self.statistics_size)
+        if window_steps is not None:
+            self.window: np.ndarray = np.zeros((max(1, window_steps), self.statistics_size))
+            self.window_sum: np.ndarray = np.zeros(self.statistics_size)
+        self.slot: int = 0
+        self.steps: int = 0
+
+    def reset(self) -> None:
+        self.statistics.fill(0)
+        if self.window_steps is not None:
+            self.window.fill(0)
+            self.window_sum.fill(0)
+        self.slot = 0
+        self.steps = 0
+
+    def _step_statistics(self, velocities: np.ndarray, masses: Union[np.ndarray, float]) -> np.ndarray:
+        statistics = np.zeros(self.statistics_size)
+        number_of_particles = len(velocities)
+        if number_of_particles == 0:
+            return statistics
+
+        speeds_squared = np.einsum("ij,ij->i", velocities, velocities)
+        speeds = np.sqrt(speeds_squared)
+        bin_indices = np.minimum((speeds / self.bin_width).astype(np.int64), self.bins - 1)
+        statistics[:self.bins] = np.bincount(bin_indices, minlength=self.bins) / number_of_particles
+        statistics[self.bins:] = (speeds.mean(), speeds_squared.mean(), np.dot(speeds_squared, speeds) / number_of_particles,
+                                  np.dot(speeds_squared, speeds_squared) / number_of_particles, np.mean(masses * speeds_squared))
+        return statistics
+
+    def update(self, velocities: np.ndarray, masses: Union[np.ndarray, float]) -> None:
+        statistics = self._step_statistics(velocities, masses)
+
+        if self.window_steps is not None:
+            self.window_sum += statistics - self.window[self.slot]
+            self.window[self.slot] = statistics
+            self.slot = (self.slot + 1) % len(self.window)
+            self.statistics = self.window_sum / min(self.steps + 1, len(self.window))
+        elif self.steps == 0:
+            self.statistics[:] = statistics
+        else:
+            self.statistics += self.decay * (statistics - self.statistics)
+        self.steps += 1
+
+    @property
+    def histogram(self) -> np.ndarray:
+        """ Fraction of the particles in every speed bin. """
+        return self.statistics[:self.bins]
+
+    @property
+    def mean_speed(self) -> float:
+        return float(self.statistics[self.bins])
+
+    @property
+    def rms_speed(self) -> float:
+        return float(np.sqrt(self.statistics[self.bins + 1]))
+
+    @property
+    def kinetic_temperature(self) -> float:
+        return float(self.statistics[self.bins + 4] / (3 * BOLTZMANNS_CONSTANT * VELOCITY_SCALE ** 2))
+
+    @property
+    def kurtosis(self) -> float:
+        """ Kurtosis of the speeds (fourth central moment over the squared variance), from the running raw moments. """
+        mean, second, third, fourth = self.statistics[self.bins:self.bins + 4]
+        variance = second - mean ** 2
+        if variance <= 0:
+            return 0.0
+        fourth_central = fourth - 4 * mean * third + 6 * mean ** 2 * second - 3 * mean ** 4
+        return float(fourth_central / variance ** 2)
+
+    def maxwell_boltzmann_fractions(self) -> np.ndarray:
+        """ Fraction per bin of a 2D Maxwell-Boltzmann distribution with the measured mean squared speed. """
+        mean_speed_squared = self.statistics[self.bins + 1]
+        if mean_speed_squared <= 0:
+            return np.zeros(self.bins)
+        cumulative = 1 - np.exp(-self.bin_edges ** 2 / mean_speed_squared)
+        fractions = np.diff(cumulative)
+        fractions[-1] += 1 - cumulative[-1]
+        return fractions
+
+    def as_dict(self) -> Dict[str, Union[float, list]]:
+        return {
+            "steps": self.steps,
+            "mean_speed": self.mean_speed,
+            "rms_speed": self.rms_speed,
+            "kinetic_temperature": self.kinetic_temperature,
+            "kurtosis": self.kurtosis,
+            "bin_edges": self.bin_edges.tolist(),
+            "histogram": self.histogram.tolist(),
+            "maxwell_boltzmann": self.maxwell_boltzmann_fractions().tolist(),
+        }
+
+class Speed_Histogram_View:
+    """ Small bar chart of a Speed_Distribution, bars colored like the particles, with the Maxwell-Boltzmann curve on top. """
+    def __init__(self, distribution: Speed_Distribution, rect: pygame.Rect) -> None:
+        self.distribution: Speed_Distribution = distribution
+        self.rect: pygame.Rect = rect
+
+        bin_centers = (distribution.bin_edges[:-1] + distribution.bin_edges[1:]) / 2
+        self.bar_colors = [tuple(color) for color in COLOR_LUT[speed_buckets(np.column_stack((bin_centers, np.zeros(distribution.bins))))].tolist()]
+        self.bar_lefts: np.ndarray = rect.left + (np.arange(distribution.bins) * rect.width / distribution.bins).astype(np.int64)
+        self.bar_width: int = max(1, rect.width // distribution.bins)
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        histogram = self.distribution.histogram
+        reference = self.distribution.maxwell_boltzmann_fractions()
+        scale = self.rect.height / max(histogram.max(), reference.max(), 1e-9)
+
+        heights = (histogram * scale).astype(np.int64).tolist()
+        for left, height, color in zip(self.bar_lefts.tolist(), heights, self.bar_colors):
+            if height > 0:
+                render_surface.fill(color, (left, self.rect.bottom - height, self.bar_width, height))
+
+        points = list(zip((self.bar_lefts + self.bar_width // 2).tolist(), (self.rect.bottom - reference * scale).astype(np.int64).tolist()))
+        pygame.draw.lines(render_surface, (0,0,0), False, points)
+        pygame.draw.line(render_surface, (0,0,0), self.rect.bottomleft, self.rect.bottomright)
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Union, List, Callable, Dict
+
+# the benchmarks never open a real window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import numpy as np
+
+from settings import *
+from closed_system import Closed_System
+from particle import Particle
+
+# packing fraction of the default simulation (NUMBER_OF_PARTICLES in an 800 x 300 container), kept for every particle count
+REFERENCE_AREA_PER_PARTICLE = 800 * 300 / NUMBER_OF_PARTICLES
+
+# the benchmarks with a moving cap swing it between 10 and 7 meters over this many steps
+CAP_PERIOD_STEPS = 120
+
+def create_empty_system(number_of_particles: int, headless: bool = True, scale_container: bool = True, integrator: str = "time_step") -> Closed_System:
+    """ Returns a system without particles whose container is sized for number_of_particles (see create_system). """
+    scale = max(1.0, np.sqrt(number_of_particles * REFERENCE_AREA_PER_PARTICLE / (800 * 300))) if scale_container else 1.0
+    return Closed_System((0,0), closed_system_start_temperature=800, container_width=int(800 * scale), container_height=int(300 * scale),
+                         container_start_volume_meters=10, container_min_volume_meters=1.5, container_max_volume_meters=10, headless=headless,
+                         integrator=integrator)
+
+def create_system(number_of_particles: int, seed: int, headless: bool = True, scale_container: bool = True, integrator: str = "time_step") -> Closed_System:
+    """ Returns a system holding number_of_particles spread over its container.
+
+    With scale_container the container grows with the particle count so the density stays that of the default simulation,
+    otherwise it keeps the size of the window (particles then overlap, which only matters for the physics).
+    """
+    np.random.seed(seed)
+    system = create_empty_system(number_of_particles, headless, scale_container, integrator)
+    if scale_container:
+        system.add_particles(number_of_particles=number_of_particles)
+        return system
+
+    # more particles than the window holds cannot be placed without overlaps, they are spread uniformly instead
+    width, height = system.get_accessible_size()
+    bounds = system.container.get_container_bounds()
+    positions = np.random.uniform((bounds["left"] + PARTICLE_RADIUS, bounds["top"] + PARTICLE_RADIUS),
+                                  (bounds["left"] + PARTICLE_RADIUS + width, bounds["top"] + PARTICLE_RADIUS + height), (number_of_particles, 2))
+    system.particles.add(positions, system.calculate_velocity_array(system.temperature, number_of_particles), mass=PARTICLE_MASS, radius=PARTICLE_RADIUS)
+    return system
+
+def measure(run: Callable[[], None], setup: Union[Callable[[], None], None] = None, min_time: float = 0.5, max_repeats: int = 100000) -> float:
+    """ Calls run until min_time seconds of it have been measured and returns the calls per second. setup runs untimed before every call. """
+    # one untimed call first, so caches and lazily created sprites do not count
+    if setup is not None:
+        setup()
+    run()
+
+    elapsed = 0.0
+    repeats = 0
+    while repeats == 0 or (elapsed < min_time and repeats < max_repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed += time.perf_counter() - start
+        repeats += 1
+    return repeats / elapsed
+
+def benchmark_add_particles(number_of_particles: int, seed: int, min_time: float) -> float:
+    systems = []
+    def setup() -> None:
+        np.random.seed(seed)
+        systems[:] = [create_empty_system(number_of_particles)]
+    return measure(lambda: systems[0].add_particles(number_of_particles=number_of_particles), setup, min_time)
+
+def benchmark_update_particles(number_of_particles: int, seed: int, min_time: float) -> float:
+    system = create_system(number_of_particles, seed)
+    return measure(lambda: system.update_particles(1 / TARGET_FPS), min_time=min_time)
+
+def benchmark_update_particles_event_driven(number_of_particles: int, seed: int, min_time: float) -> float:
+    system = create_system(number_of_particles, seed, integrator="event_driven")
+    return measure(lambda: system.update_particles(1 / TARGET_FPS), min_time=min_time)
+
+def update_with_moving_cap(system: Closed_System) -> Callable[[], None]:
+    """ Returns a step of the system that first moves the cap along a cosine, so its velocity changes every step like in a drag. """
+    steps = [0]
+    def step() -> None:
+        steps[0] += 1
+        system.container.set_volume_meters(8.5 + 1.5 * float(np.cos(2 * np.pi * steps[0] / CAP_PERIOD_STEPS)))
+        system.update_particles(1 / TARGET_FPS)
+    return step
+
+def benchmark_update_particles_moving_cap(number_of_particles: int, seed: int, min_time: float) -> float:
+    return measure(update_with_moving_cap(create_system(number_of_particles, seed)), min_time=min_time)
+
+def benchmark_update_particles_event_driven_moving_cap(number_of_particles: int, seed: int, min_time: float) -> float:
+    return measure(update_with_moving_cap(create_system(number_of_particles, seed, integrator="event_driven")), min_time=min_time)
+
+def benchmark_particle_collision(number_of_particles: int, seed: int, min_time: float) -> float:
+    """ One step of the original per-particle collision loop: every Particle checked against every other. """
+    system = create_system(number_of_particles, seed)
+    particles = [Particle(tuple(position), tuple(velocity), PARTICLE_MASS, PARTICLE_RADIUS) for position, velocity in zip(system.particles.positions, system.particles.velocities)]
+    container_bounds = system.container.get_container_bounds()
+
+    def step() -> None:
+        for particle in particles:
+            particle.collision(container_bounds, particles)
+    return measure(step, min_time=min_time)
+
+def benchmark_update_particle_temperature(number_of_particles: int, seed: int, min_time: float) -> float:
+    system = create_system(number_of_particles, seed)
+    temperatures = [400, 800]
+
+    def change_temperature() -> None:
+        temperatures.reverse()
+        system.previous_temperature = system.temperature
+        system.temperature = temperatures[0]
+        system.update_particle_temperature()
+    return measure(change_temperature, min_time=min_time)
+
+def benchmark_render(number_of_particles: int, seed: int, min_time: float) -> float:
+    # drawn at the size of the window, into an offscreen surface of the display size
+    system = create_system(number_of_particles, seed, headless=False, scale_container=False)
+    system.particles.update_colors()
+    target_surface = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    return measure(lambda: system.render(target_surface), min_time=min_time)
+
+BENCHMARKS: Dict[str, Callable[[int, int, float], float]] = {
+    "add_particles": benchmark_add_particles,
+    "update_particles": benchmark_update_particles,
+    "update_particles_event_driven": benchmark_update_particles_event_driven,
+    "update_particles_moving_cap": benchmark_update_particles_moving_cap,
+    "update_particles_event_driven_moving_cap": benchmark_update_particles_event_driven_moving_cap,
+    "particle_collision": benchmark_particle_collision,
+    "update_particle_temperature": benchmark_update_particle_temperature,
+    "render": benchmark_render,
+}
+
+def run_benchmarks(counts: List[int], names: List[str], seed: int = 0, min_time: float = 0.5, legacy_max_particles: int = 1000) -> Dict[str, Dict[str, float]]:
+    """ Returns the calls per second of every benchmark for every particle count, keyed by name and then count. """
+    results = {}
+    for name in names:
+        results[name] = {}
+        for number_of_particles in counts:
+            # the original collision loop is quadratic in python, it is only run for small systems
+            if name == "particle_collision" and number_of_particles > legacy_max_particles:
+                continue
+            results[name][str(number_of_particles)] = BENCHMARKS[name](number_of_particles, seed, min_time)
+            sys.stdout.write(f"{name:<40} {number_of_particles:>8} particles {results[name][str(number_of_particles)]:>12.2f} /s\n")
+            sys.stdout.flush()
+    return results
+
+def find_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """ Lists every result slower than its baseline by more than the threshold (a fraction, e.g. 0.2 for 20 %). """
+    regressions = []
+    for name, rates in results.items():
+        for count, rate in rates.items():
+            baseline_rate = baseline.get(name, {}).get(count)
+            if baseline_rate and rate < baseline_rate * (1 - threshold):
+                regressions.append(f"{name} with {count} particles: {rate:.2f} /s, baseline {baseline_rate:.2f} /s ({rate / baseline_rate - 1:+.0%})")
+    return regressions
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the throughput of the physics and render paths at growing particle counts.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[NUMBER_OF_PARTICLES, 1000, 10000, 100000], help="particle counts to run")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random number generator")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds measured per benchmark and particle count")
+    parser.add_argument("--legacy-max-particles", type=int, default=1000, help="largest particle count for the original Particle.collision loop")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="JSON file with the results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.2, help="fail when a result is slower than the baseline by more than this fraction")
+    arguments = parser.parse_args(argv)
+
+    if not arguments.save_baseline and not os.path.exists(arguments.baseline):
+        # checked before measuring, a missing baseline would otherwise let every regression pass
+        sys.stderr.write(f"No baseline at {arguments.baseline}, run with --save-baseline to create one\n")
+        return 1
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    results = run_benchmarks(arguments.counts, arguments.benchmarks, arguments.seed, arguments.min_time, arguments.legacy_max_particles)
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as file:
+            file.write(json.dumps({"seed": arguments.seed, "results": results}, indent=4) + "\n")
+        sys.stdout.write(f"Baseline written to {arguments.baseline}\n")
+        return 0
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)["results"]
+    regressions = find_regressions(results, baseline, arguments.threshold)
+    for regression in regressions:
+        sys.stdout.write(f"REGRESSION {regression}\n")
+    if not regressions:
+        sys.stdout.write(f"No regressions past {arguments.threshold:.0%} against {arguments.baseline}\n")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
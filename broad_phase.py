@@ -0,0 +1,211 @@
+from typing import Tuple, Union, Dict
+import numpy as np
+
+from particle_store import Scratch_Buffers
+
+def _narrow_phase(positions: np.ndarray, radii: np.ndarray, candidates_i: np.ndarray, candidates_j: np.ndarray, scratch: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Keeps the candidate pairs that actually overlap (coincident pairs are skipped, like in Particle.collision). The
+    temporaries are kept in scratch, laid out like Spatial_Hash_Broad_Phase.scratch_layout, the returned pairs are new arrays. """
+    distance_vectors, gathered = scratch["distance_vectors"], scratch["gathered"]
+    distances_squared, min_distances, gathered_radii = scratch["distances_squared"], scratch["min_distances"], scratch["gathered_radii"]
+    overlapping, apart = scratch["overlapping"], scratch["apart"]
+
+    np.take(positions, candidates_i, axis=0, out=distance_vectors)
+    np.take(positions, candidates_j, axis=0, out=gathered)
+    distance_vectors -= gathered
+    np.einsum("ij,ij->i", distance_vectors, distance_vectors, out=distances_squared)
+    np.take(radii, candidates_i, out=min_distances)
+    np.take(radii, candidates_j, out=gathered_radii)
+    min_distances += gathered_radii
+
+    np.square(min_distances, out=min_distances)
+    np.less(distances_squared, min_distances, out=overlapping)
+    np.greater(distances_squared, 0, out=apart)
+    overlapping &= apart
+    overlapping_indices = np.flatnonzero(overlapping)
+    return candidates_i[overlapping_indices], candidates_j[overlapping_indices]
+
+class Brute_Force_Broad_Phase:
+    """ Tests every unordered pair of particles. O(N^2), kept as a reference to compare against. """
+    def __init__(self, block_elements: int = 2**20) -> None:
+        self.block_elements: int = block_elements
+        self.pairs_tested: int = 0
+        self.scratch_nbytes: int = 0
+
+    def find_pairs(self, positions: np.ndarray, radii: np.ndarray, container_bounds: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the index arrays (i, j), i < j, of every overlapping pair. """
+        number_of_particles = len(positions)
+        pairs_i = [np.zeros(0, dtype=np.intp)]
+        pairs_j = [np.zeros(0, dtype=np.intp)]
+
+        # keep each block of the distance matrix around block_elements entries
+        block_size = max(1, self.block_elements // max(1, number_of_particles))
+
+        for start in range(0, number_of_particles, block_size):
+            end = min(start + block_size, number_of_particles)
+            distance_vectors = positions[start:end, None, :] - positions[None, start:, :]
+            distances_squared = np.einsum("ijk,ijk->ij", distance_vectors, distance_vectors)
+            min_distances = radii[start:end, None] + radii[None, start:]
+
+            overlapping = (distances_squared < min_distances ** 2) & (distances_squared > 0)
+            # only keep j > i so every unordered pair is emitted once
+            overlapping &= np.arange(start, end)[:, None] < np.arange(start, number_of_particles)[None, :]
+
+            block_i, block_j = np.nonzero(overlapping)
+            pairs_i.append(block_i + start)
+            pairs_j.append(block_j + start)
+
+        self.pairs_tested = number_of_particles * (number_of_particles - 1) // 2
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+class _Grid:
+    """ Uniform grid of cell_size over the container bounds, with the given particles counting sorted by cell. Indices are into positions. """
+    def __init__(self, positions: np.ndarray, container_bounds: dict, cell_size: float) -> None:
+        self.cell_size: float = cell_size
+
+        # the grid is rebuilt from the current bounds every step, so it follows the cap when it is dragged
+        self.left, self.top = container_bounds["left"], container_bounds["top"]
+        self.columns: int = max(1, int(np.ceil((container_bounds["right"] - self.left) / cell_size)))
+        self.rows: int = max(1, int(np.ceil((container_bounds["bottom"] - self.top) / cell_size)))
+
+        self.cell_x, self.cell_y = self.cell_coordinates(positions)
+        cells = self.cell_y * self.columns + self.cell_x
+
+        # counting sort of the particles by cell
+        self.order: np.ndarray = np.argsort(cells, kind="stable")
+        self.cell_counts: np.ndarray = np.bincount(cells, minlength=self.columns * self.rows)
+        self.cell_starts: np.ndarray = np.cumsum(self.cell_counts) - self.cell_counts
+        self.sorted_rank: np.ndarray = np.empty(len(positions), dtype=np.intp)
+        self.sorted_rank[self.order] = np.arange(len(positions))
+
+    def cell_coordinates(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cell_x = np.clip(((positions[:, 0] - self.left) // self.cell_size).astype(np.intp), 0, self.columns - 1)
+        cell_y = np.clip(((positions[:, 1] - self.top) // self.cell_size).astype(np.intp), 0, self.rows - 1)
+        return cell_x, cell_y
+
+    def candidates(self, offsets: tuple, cell_x: np.ndarray, cell_y: np.ndarray, own: bool) -> Tuple[list, list]:
+        """ Candidate pairs (query index, grid index) of the queried particles, given by their cells, with the particles
+        of the grid in the cells at offsets. With own the queried particles are the grid's own, and within a cell each
+        one only pairs with the particles sorted after it. """
+        candidates_i = []
+        candidates_j = []
+        for offset_x, offset_y in offsets:
+            neighbour_x = cell_x + offset_x
+            neighbour_y = cell_y + offset_y
+            particles = np.nonzero((neighbour_x >= 0) & (neighbour_x < self.columns) & (neighbour_y >= 0) & (neighbour_y < self.rows))[0]
+            neighbour_cells = neighbour_y[particles] * self.columns + neighbour_x[particles]
+
+            begins = self.cell_starts[neighbour_cells]
+            ends = begins + self.cell_counts[neighbour_cells]
+            if own and offset_x == 0 and offset_y == 0:
+                begins = self.sorted_rank[particles] + 1
+
+            lengths = np.maximum(ends - begins, 0)
+            total = int(lengths.sum())
+            if total == 0:
+                continue
+
+            # expand every (particle, cell range) into explicit candidate pairs
+            run_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            sorted_positions = np.repeat(begins, lengths) + np.arange(total) - run_starts
+
+            candidates_i.append(np.repeat(particles, lengths))
+            candidates_j.append(self.order[sorted_positions])
+        return candidates_i, candidates_j
+
+class Spatial_Hash_Broad_Phase:
+    """ Uniform grid over the container. Only particles in the same or neighbouring cells are tested.
+
+    With particles of very different sizes one grid sized for the largest puts many small particles in each cell, so
+    the particles are split into levels whose radii differ by at most a factor of 2, each with its own grid. Pairs
+    within a level are found on its grid, pairs across levels from the smaller particle on the grid of the larger one.
+    """
+
+    # half of the 3x3 neighbourhood, so every pair of neighbouring cells is visited once
+    NEIGHBOUR_OFFSETS = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+    # the whole 3x3 neighbourhood, for particles that are not on the grid
+    ALL_NEIGHBOUR_OFFSETS = tuple((offset_x, offset_y) for offset_y in (-1, 0, 1) for offset_x in (-1, 0, 1))
+    # cells are never smaller than this many per particle would make them, so tiny particles do not blow up the grid
+    MAX_CELLS_PER_PARTICLE = 16
+
+    def __init__(self, cell_size: Union[float, None] = None) -> None:
+        self.cell_size: Union[float, None] = cell_size
+        self.pairs_tested: int = 0
+        self.levels: int = 1
+        # the candidate pairs and the narrow phase temporaries, kept between steps
+        self.scratch: Scratch_Buffers = Scratch_Buffers()
+
+    @property
+    def scratch_nbytes(self) -> int:
+        return self.scratch.nbytes
+
+    @staticmethod
+    def scratch_layout(positions: np.ndarray, radii: np.ndarray) -> tuple:
+        return (("candidates_i", (), np.intp), ("candidates_j", (), np.intp), ("distance_vectors", (2,), positions.dtype), ("gathered", (2,), positions.dtype),
+                ("distances_squared", (), positions.dtype), ("min_distances", (), radii.dtype), ("gathered_radii", (), radii.dtype),
+                ("overlapping", (), np.bool_), ("apart", (), np.bool_))
+
+    def find_pairs(self, positions: np.ndarray, radii: np.ndarray, container_bounds: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the index arrays (i, j) of every overlapping pair, each unordered pair once. """
+        number_of_particles = len(positions)
+        if number_of_particles < 2:
+            self.pairs_tested = 0
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        area = max((container_bounds["right"] - container_bounds["left"]) * (container_bounds["bottom"] - container_bounds["top"]), 0)
+        min_cell_size = max(np.sqrt(area / (self.MAX_CELLS_PER_PARTICLE * number_of_particles)), 1e-9)
+        smallest_radius = max(float(radii.min()), min_cell_size / 2)
+        if self.cell_size is None and float(radii.max()) > 2 * smallest_radius:
+            candidates_i, candidates_j = self._level_candidates(positions, radii, container_bounds, smallest_radius)
+        else:
+            # cells at least one particle diameter wide, so overlapping particles are always in neighbouring cells
+            cell_size = self.cell_size if self.cell_size is not None else 2 * max(float(radii.max()), min_cell_size / 2)
+            grid = _Grid(positions, container_bounds, cell_size)
+            candidates_i, candidates_j = grid.candidates(self.NEIGHBOUR_OFFSETS, grid.cell_x, grid.cell_y, own=True)
+            self.levels = 1
+
+        if not candidates_i:
+            self.pairs_tested = 0
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        self.pairs_tested = sum(len(block) for block in candidates_i)
+        scratch = self.scratch.get(self.pairs_tested, self.scratch_layout(positions, radii))
+        np.concatenate(candidates_i, out=scratch["candidates_i"])
+        np.concatenate(candidates_j, out=scratch["candidates_j"])
+
+        return _narrow_phase(positions, radii, scratch["candidates_i"], scratch["candidates_j"], scratch)
+
+    def _level_candidates(self, positions: np.ndarray, radii: np.ndarray, container_bounds: dict, smallest_radius: float) -> Tuple[list, list]:
+        # level k holds the radii from 2^k up to 2^(k + 1) times the smallest one
+        levels = np.maximum(np.floor(np.log2(radii / smallest_radius)), 0).astype(np.intp)
+        grids = []
+        for level in np.unique(levels):
+            members = np.flatnonzero(levels == level)
+            grids.append((members, _Grid(positions[members], container_bounds, 2 * float(radii[members].max()))))
+        self.levels = len(grids)
+
+        candidates_i = []
+        candidates_j = []
+        for index, (members, grid) in enumerate(grids):
+            level_i, level_j = grid.candidates(self.NEIGHBOUR_OFFSETS, grid.cell_x, grid.cell_y, own=True)
+            candidates_i += [members[block] for block in level_i]
+            candidates_j += [members[block] for block in level_j]
+
+            # a particle of a larger level is larger than this one, so the cells of its grid are at least the sum of their radii wide
+            for larger_members, larger_grid in grids[index + 1:]:
+                cell_x, cell_y = larger_grid.cell_coordinates(positions[members])
+                level_i, level_j = larger_grid.candidates(self.ALL_NEIGHBOUR_OFFSETS, cell_x, cell_y, own=False)
+                candidates_i += [members[block] for block in level_i]
+                candidates_j += [larger_members[block] for block in level_j]
+        return candidates_i, candidates_j
+
+BROAD_PHASES = {
+    "brute_force": Brute_Force_Broad_Phase,
+    "spatial_hash": Spatial_Hash_Broad_Phase,
+}
+
+def create_broad_phase(name: str) -> Union[Brute_Force_Broad_Phase, Spatial_Hash_Broad_Phase]:
+    """ Creates a broad phase by name ("brute_force" or "spatial_hash"). """
+    if name not in BROAD_PHASES:
+        raise ValueError(f"Unknown broad phase {name!r}, expected one of {sorted(BROAD_PHASES)}")
+    return BROAD_PHASES[name]()
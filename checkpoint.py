@@ -0,0 +1,67 @@
+from typing import Dict
+import numpy as np
+
+CHECKPOINT_MAGIC = b"GASCKPT1"
+CHECKPOINT_ALIGNMENT = 64
+CHECKPOINT_MAX_DIMENSIONS = 4
+
+# one entry of the table of contents that follows the magic and the entry count
+CHECKPOINT_ENTRY = np.dtype([
+    ("name", "S48"),
+    ("dtype", "S8"),
+    ("ndim", "<u8"),
+    ("shape", "<u8", (CHECKPOINT_MAX_DIMENSIONS,)),
+    ("offset", "<u8"),
+])
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """ Writes named arrays to a compact binary file: magic, entry count, table of contents, then the raw aligned array data. """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    entries = np.zeros(len(arrays), dtype=CHECKPOINT_ENTRY)
+    offset = len(CHECKPOINT_MAGIC) + 8 + entries.nbytes
+    for entry, (name, array) in zip(entries, arrays.items()):
+        if array.ndim > CHECKPOINT_MAX_DIMENSIONS:
+            raise ValueError(f"Array {name!r} has {array.ndim} dimensions, checkpoints hold at most {CHECKPOINT_MAX_DIMENSIONS}")
+        offset += -offset % CHECKPOINT_ALIGNMENT
+        entry["name"] = name.encode()
+        entry["dtype"] = array.dtype.str.encode()
+        entry["ndim"] = array.ndim
+        entry["shape"][:array.ndim] = array.shape
+        entry["offset"] = offset
+        offset += array.nbytes
+
+    with open(path, "wb") as file:
+        file.write(CHECKPOINT_MAGIC)
+        file.write(np.uint64(len(entries)).tobytes())
+        file.write(entries.tobytes())
+        for entry, array in zip(entries, arrays.values()):
+            file.write(b"\0" * (int(entry["offset"]) - file.tell()))
+            file.write(array.tobytes())
+
+def load_arrays(path: str) -> Dict[str, np.ndarray]:
+    """ Reads a file written by save_arrays with one bulk read. The returned arrays are views of that single buffer. """
+    data = np.fromfile(path, dtype=np.uint8)
+
+    header_size = len(CHECKPOINT_MAGIC) + 8
+    if len(data) < header_size or data[:len(CHECKPOINT_MAGIC)].tobytes() != CHECKPOINT_MAGIC:
+        raise ValueError(f"{path!r} is not a checkpoint file")
+    number_of_entries = int(data[len(CHECKPOINT_MAGIC):header_size].view("<u8")[0])
+    entries = data[header_size:header_size + number_of_entries * CHECKPOINT_ENTRY.itemsize].view(CHECKPOINT_ENTRY)
+
+    arrays = {}
+    for entry in entries:
+        dtype = np.dtype(entry["dtype"].decode())
+        shape = tuple(int(size) for size in entry["shape"][:int(entry["ndim"])])
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[entry["name"].decode()] = np.frombuffer(data, dtype=dtype, count=count, offset=int(entry["offset"])).reshape(shape)
+    return arrays
+
+def get_random_state() -> Dict[str, np.ndarray]:
+    """ Returns the state of numpy's global random generator as arrays. """
+    _, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {"random.keys": keys, "random.values": np.array((position, has_gauss, cached_gaussian), dtype=np.float64)}
+
+def set_random_state(arrays: Dict[str, np.ndarray]) -> None:
+    position, has_gauss, cached_gaussian = arrays["random.values"].tolist()
+    np.random.set_state(("MT19937", arrays["random.keys"], int(position), int(has_gauss), cached_gaussian))
@@ -1,32 +1,104 @@
 import pygame
-import pygame_gui
-from pygame import Vector2 as vector
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Dict
 import numpy as np
 
 from settings import *
 from container import Container
-from particle import Particle
-from ui.text import Text
+from particle_store import Particle_Store, WALLS, bytes_per_particle
+from broad_phase import create_broad_phase
+from event_engine import Event_Driven_Engine
+from pressure import Pressure_Gauge, ideal_gas_pressure
+from particle_renderer import Particle_Renderer, Density_Field_Renderer
+from trajectory import Trajectory_Recorder
+from checkpoint import save_arrays, load_arrays, get_random_state, set_random_state
+from profiler import Frame_Profiler, FRAME_PROFILER
+from analytics import Speed_Distribution, Speed_Histogram_View, kinetic_temperature
+from thermostat import Thermostat, create_thermostat
+from timestep import Substep_Controller, create_substep_controller
+from placement import place_particles
+from species import Species, Species_Table, species_kinetic_temperatures, partial_pressures
+
+def generate_velocities(temperature: Union[float, int], number_of_particles: int, mass: float = PARTICLE_MASS) -> np.ndarray:
+    """ Returns an (N, 2) array of velocities for the given temperature and particle mass, scaled to simulation units. """
+    # Calculate average speed
+    avg_speed = np.sqrt(3 * BOLTZMANNS_CONSTANT * temperature / mass)
+    
+    # Generate speeds from a Maxwell-Boltzmann distribution
+    speeds = np.random.normal(loc=avg_speed, scale=0.1 * avg_speed, size=number_of_particles)
+    
+    # Generate random angles for each velocity
+    angles = np.random.uniform(0, 2 * np.pi, number_of_particles)
+    
+    # Calculate velocity components based on speeds and angles
+    velocities_x = speeds * np.cos(angles)
+    velocities_y = speeds * np.sin(angles)
+    
+    # Combine velocity components into 2D velocities
+    velocities = np.column_stack((velocities_x, velocities_y))
+
+    # Adjust total kinetic energy
+    current_kinetic_energy = 0.5 * mass * np.sum(velocities**2)
+    target_kinetic_energy = number_of_particles * 0.5 * mass * avg_speed**2
+    if current_kinetic_energy == 0:
+        return np.zeros((number_of_particles, 2))
+    scaling_factor = np.sqrt(target_kinetic_energy / current_kinetic_energy)
+    velocities *= scaling_factor
+
+    # Adjust velocities to fit simulation
+    velocities *= VELOCITY_SCALE
+
+    return velocities
 
 class Closed_System:
     def __init__(self, closed_system_render_position: Union[list, tuple], closed_system_start_temperature: Union[float, int] = 200, closed_system_background_color: Union[list, tuple] = (255,255,255), 
                  container_width: int = 800, container_height: int = 300, container_start_volume_meters: float = 1, container_min_volume_meters: float = 0, container_max_volume_meters: float = 3, 
                  container_color: Union[list, tuple] = (0,0,0), 
-                 container_cap_color: Union[list, tuple] = (255,0,0)) -> None:
+                 container_cap_color: Union[list, tuple] = (255,0,0), broad_phase: str = BROAD_PHASE, 
+                 integrator: str = INTEGRATOR, headless: bool = False, particle_store: Union[Particle_Store, None] = None,
+                 thermostat: Union[str, None] = THERMOSTAT, max_substeps: Union[int, None] = MAX_SUBSTEPS, species: Union[List[Species], None] = None,
+                 compact_particles: bool = COMPACT_PARTICLES, memory_budget: Union[int, None] = PARTICLE_MEMORY_BUDGET, color_mode: str = PARTICLE_COLOR_MODE) -> None:
         
         self.closed_system_render_position: Union[list, tuple] = closed_system_render_position
         self.closed_system_background_color: Union[list, tuple] = closed_system_background_color
+        self.headless: bool = headless
+        # the shared frame profiler, systems stepping on another thread get their own
+        self.profiler: Frame_Profiler = FRAME_PROFILER
         self.render_surface: pygame.Surface = pygame.Surface(CLOSED_SYSTEM_RENDER_SURFACE_SIZE)
+        self.particle_renderer: Particle_Renderer = Particle_Renderer()
+        # above this many particles they are drawn as a density field (None to always draw every particle)
+        self.density_field_renderer: Density_Field_Renderer = Density_Field_Renderer()
+        self.lod_threshold: Union[int, None] = LOD_PARTICLE_THRESHOLD
+        if color_mode not in ("speed", "species"):
+            raise ValueError(f"Unknown color mode {color_mode!r}, expected 'speed' or 'species'")
+        self.color_mode: str = color_mode
+        # draws the particles in the colors of their species, built from the species table when first needed
+        self.species_renderer: Union[Particle_Renderer, None] = None
 
         # containers
         self.container: Container = Container(self.closed_system_render_position, width = container_width, height = container_height, start_volume_meters = container_start_volume_meters, 
                                    min_volume_meters = container_min_volume_meters, max_volume_meters = container_max_volume_meters, 
-                                   container_color = container_color, cap_color = container_cap_color)
+                                   container_color = container_color, cap_color = container_cap_color, interactive = not headless)
 
         # particles
-        self.particle_spawn_point = (self.container.position[0] + 30 - self.closed_system_render_position[0], self.container.position[1] + self.container.height - 30 - self.closed_system_render_position[0])
-        self.particles = []
+        self.particles: Particle_Store = particle_store if particle_store is not None else Particle_Store(compact=compact_particles)
+        # bytes the particle and scratch buffers may take (None for no limit), add_particles refuses to go past it
+        self.memory_budget: Union[int, None] = memory_budget
+        if memory_budget is not None:
+            self.particles.max_capacity = memory_budget // bytes_per_particle(self.particles.compact)
+        # mass, radius and color of every species, the particles hold the index of theirs
+        self.species: Species_Table = Species_Table(species)
+        self.broad_phase = create_broad_phase(broad_phase)
+
+        if integrator not in ("time_step", "event_driven"):
+            raise ValueError(f"Unknown integrator {integrator!r}, expected 'time_step' or 'event_driven'")
+        self.integrator: str = integrator
+        self.event_engine: Union[Event_Driven_Engine, None] = Event_Driven_Engine(self.particles) if integrator == "event_driven" else None
+
+        # holds the particles at the temperature setpoint between manual changes (None to let the gas evolve freely)
+        self.thermostat: Union[Thermostat, None] = create_thermostat(thermostat)
+
+        # splits the steps of hot gases into substeps so fast particles do not tunnel (None for one step per frame)
+        self.substep_controller: Union[Substep_Controller, None] = create_substep_controller(max_substeps) if integrator == "time_step" else None
 
         # simulation
         self.temperature = closed_system_start_temperature
@@ -36,78 +108,175 @@ class Closed_System:
 
         self.accurate_pressure = self.calculate_accurate_pressure()
 
-        # ui
+        # the cap is a moving wall, its velocity comes from how far it moved since the last step (pixels per second, positive when expanding)
+        self.cap_velocity: float = 0.0
+        self.last_cap_right: Union[float, None] = None
+        # work done by the cap on the gas in joules (on the energy scale of the temperature), negative while the gas expands
+        self.piston_work: float = 0.0
+        self.last_piston_work: float = 0.0
+
+        # measured pressure, in simulation units (momentum per pixel of wall per second)
+        self.pressure_gauge: Pressure_Gauge = Pressure_Gauge()
+        self.wall_impulses: np.ndarray = np.zeros(4)
+        self.measured_pressure: float = 0.0
+        self.measured_pressure_windowed: float = 0.0
+        self.ideal_pressure: float = 0.0
+        # readouts per species, ordered like the species table
+        self.species_temperatures: np.ndarray = np.zeros(len(self.species))
+        self.partial_pressures: np.ndarray = np.zeros(len(self.species))
+
+        # speed distribution, updated every step
+        self.speed_distribution: Speed_Distribution = Speed_Distribution()
+
+        # trajectory recording (see start_recording)
+        self.recorder: Union[Trajectory_Recorder, None] = None
+
+        # ui (not created in headless mode, so no fonts are needed)
+        if self.headless:
+            return
+
+        from ui.text import Text
         self.volume_text = Text(f"Volume: {self.container.get_volume_meters()} m", 26, (50+50,320))
         self.pressure_text = Text(f"Pressure: {self.container.get_volume_meters()} Pa", 26, (250+50,320))
         self.temperature_text = Text(f"Temperature: {self.temperature} K", 26, (500+50,320))
+        self.measured_pressure_text = Text(f"Measured Pressure: {self.measured_pressure_windowed:.2e} (ideal {self.ideal_pressure:.2e})", 26, (50+50,340))
+        self.speed_histogram_view = Speed_Histogram_View(self.speed_distribution, pygame.Rect(760, 305, 136, 42))
     
     def calculate_velocities(self, temperature: Union[float, int], number_of_particles: int) -> List[Tuple[float, float]]:
+        return list(map(tuple, self.calculate_velocity_array(temperature, number_of_particles)))
 
-        # Calculate average speed
-        avg_speed = np.sqrt(3 * BOLTZMANNS_CONSTANT * temperature / PARTICLE_MASS)
-        
-        # Generate speeds from a Maxwell-Boltzmann distribution
-        speeds = np.random.normal(loc=avg_speed, scale=0.1 * avg_speed, size=number_of_particles)
-        
-        # Generate random angles for each velocity
-        angles = np.random.uniform(0, 2 * np.pi, number_of_particles)
-        
-        # Calculate velocity components based on speeds and angles
-        velocities_x = speeds * np.cos(angles)
-        velocities_y = speeds * np.sin(angles)
-        
-        # Combine velocity components into 2D velocities
-        velocities = np.column_stack((velocities_x, velocities_y))
-
-        # Adjust total kinetic energy
-        current_kinetic_energy = 0.5 * PARTICLE_MASS * np.sum(velocities**2)
-        target_kinetic_energy = number_of_particles * 0.5 * PARTICLE_MASS * avg_speed**2
-        if current_kinetic_energy == 0:
-            return [(0.0, 0.0) for _ in range(number_of_particles)]
-        scaling_factor = np.sqrt(target_kinetic_energy / current_kinetic_energy)
-        velocities *= scaling_factor
-
-        # Adjust velocities to fit simulation
-        velocities *= 0.2
-
-        return list(map(tuple, velocities))
+    def calculate_velocity_array(self, temperature: Union[float, int], number_of_particles: int, mass: float = PARTICLE_MASS) -> np.ndarray:
+        return generate_velocities(temperature, number_of_particles, mass)
     
     def calculate_accurate_pressure(self) -> None:
         accurate_pressure = ((len(self.particles) / (AVOGADROS_CONSTANT)) * GAS_CONSTANT * self.temperature) / self.container.get_volume_meters()
         return f"{accurate_pressure:.{2}e}"
 
-    def assign_velocity_to_particles(self, velocities: List[list]):
-        for index, particle in enumerate(self.particles):
-            particle.velocity = vector(velocities[index])
+    def get_kinetic_temperature(self) -> float:
+        """ Temperature measured from the current particle velocities. """
+        return kinetic_temperature(self.particles.velocities, self.particles.masses)
+
+    def get_accessible_size(self) -> Tuple[float, float]:
+        """ Returns the width and height of the region the centres of the largest particles can reach (of PARTICLE_RADIUS ones in an empty system). """
+        container_bounds = self.container.get_container_bounds()
+        radius = float(self.particles.radii.max()) if len(self.particles) > 0 else PARTICLE_RADIUS
+        width = max(0, container_bounds["right"] - container_bounds["left"] - 2 * radius)
+        height = max(0, container_bounds["bottom"] - container_bounds["top"] - 2 * radius)
+        return width, height
 
-    def add_particles(self, number_of_particles: int = 10, color = (0,0,255)) -> None:
-        velocities = self.calculate_velocities(self.temperature, number_of_particles)
+    def update_measured_pressure(self, wall_impulses: np.ndarray, dt: float) -> None:
+        width, height = self.get_accessible_size()
+        self.wall_impulses = wall_impulses
+        self.pressure_gauge.record(wall_impulses, dt, np.array((height, height, width, width)))
 
-        for i in range(number_of_particles):
-            x = self.particle_spawn_point[0]
-            y = self.particle_spawn_point[1]
-            vx = velocities[i][0]
-            vy = velocities[i][1]
+        self.measured_pressure = self.pressure_gauge.pressure
+        self.measured_pressure_windowed = self.pressure_gauge.windowed_pressure
+        self.ideal_pressure = ideal_gas_pressure(len(self.particles), self.temperature, width * height)
 
-            self.particles.append(Particle((x, y), (vx, vy), radius=PARTICLE_RADIUS, color=color))
+        particles = self.particles
+        self.species_temperatures = species_kinetic_temperatures(particles.velocities, particles.masses, particles.species, len(self.species))
+        self.partial_pressures = partial_pressures(particles.velocities, particles.masses, particles.species, len(self.species), width * height)
+
+    def assign_velocity_to_particles(self, velocities: Union[np.ndarray, List[list]]):
+        self.particles.velocities[:] = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)
+
+    def add_species(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255)) -> int:
+        """ Adds a species to the table and returns its index, for add_particles. """
+        index = self.species.add(Species(name, mass, radius, color))
+        self.set_species_table(self.species)
+        return index
+
+    def get_memory_footprint(self) -> Dict[str, int]:
+        """ Bytes taken by the particle arrays and the scratch buffers of the system and its broad phase, for their whole capacity. """
+        particles, scratch = self.particles.nbytes, self.particles.scratch_nbytes + self.broad_phase.scratch_nbytes
+        return {"particles": particles, "scratch": scratch, "total": particles + scratch}
+
+    def set_species_table(self, species: Species_Table) -> None:
+        self.species = species
+        self.species_renderer = None
+        self.species_temperatures = np.zeros(len(species))
+        self.partial_pressures = np.zeros(len(species))
+
+    def add_particles(self, number_of_particles: int = 10, color = None, tracer: bool = False, species: Union[int, str] = 0) -> None:
+        """ Adds particles of a species (by index or name) at the temperature setpoint. color defaults to the color of the species. """
+        species_index = self.species.index(species)
+        kind = self.species[species_index]
+        # checked before the particles are placed, which takes long for the counts that would break the budget
+        total_particles = len(self.particles) + number_of_particles
+        if self.memory_budget is not None and total_particles > self.particles.max_capacity:
+            raise ValueError(f"Cannot add {number_of_particles} particles, {total_particles} particles take "
+                             f"{total_particles * bytes_per_particle(self.particles.compact) / 2**20:.3g} MiB and the memory budget of the system is "
+                             f"{self.memory_budget / 2**20:.3g} MiB ({self.particles.max_capacity} particles)")
+        velocities = self.calculate_velocity_array(self.temperature, number_of_particles, kind.mass)
+        # spread over the free room of the container, so the new particles start without overlaps
+        container_bounds = self.container.get_container_bounds((-self.closed_system_render_position[0], -self.closed_system_render_position[1]))
+        positions = place_particles(number_of_particles, container_bounds, kind.radius, self.particles.positions, self.particles.radii)
+
+        self.particles.add(positions, velocities, mass=kind.mass, radius=kind.radius, color=color if color is not None else kind.color,
+                           tracer=tracer, species=species_index)
     
-    def update_particles(self, dt: float, update_particles_movement: bool = True) -> None:
-        total_momentum_change = 0
-        for particle in self.particles:
-            particle_momentum_change = particle.update(self.container.get_container_bounds((-self.closed_system_render_position[0], -self.closed_system_render_position[1])), self.particles, dt, update_movement = update_particles_movement)
-            total_momentum_change += particle_momentum_change
-        return total_momentum_change
+    def update_particles(self, dt: float, update_particles_movement: bool = True) -> np.ndarray:
+        container_bounds = self.container.get_container_bounds((-self.closed_system_render_position[0], -self.closed_system_render_position[1]))
+
+        # the cap sweeps from where it was at the last step to where it is now over the step, a paused system only has it moved
+        cap_right = container_bounds["right"]
+        start_cap_right = self.last_cap_right if self.last_cap_right is not None and update_particles_movement and dt > 0 else cap_right
+        self.last_cap_right = cap_right
+        self.cap_velocity = (cap_right - start_cap_right) / dt if dt > 0 else 0.0
+        self.last_piston_work = 0.0
+
+        if self.event_engine is not None:
+            events_processed, piston_work = self.event_engine.events_processed, self.event_engine.piston_work
+            wall_impulses = self.event_engine.advance(dt if update_particles_movement else 0, container_bounds)
+            self.last_piston_work = (self.event_engine.piston_work - piston_work) / VELOCITY_SCALE ** 2
+            self.piston_work += self.last_piston_work
+            self.particles.update_colors()
+            self.profiler.count("collisions_resolved", self.event_engine.events_processed - events_processed)
+            return wall_impulses
+
+        substeps = 1
+        if update_particles_movement and self.substep_controller is not None:
+            substeps = self.substep_controller.substeps(self.particles.velocities, self.particles.radii, container_bounds, dt, self.cap_velocity)
+        self.profiler.count("substeps", substeps)
+
+        wall_impulses = np.zeros(4)
+        for substep in range(substeps):
+            if update_particles_movement:
+                self.particles.move(dt / substeps)
+
+            substep_bounds = dict(container_bounds, right=start_cap_right + (cap_right - start_cap_right) * (substep + 1) / substeps)
+            pairs_i, pairs_j = self.broad_phase.find_pairs(self.particles.positions, self.particles.radii, substep_bounds)
+            collisions_resolved = self.particles.resolve_particle_collisions(pairs_i, pairs_j, exchange_velocities=update_particles_movement)
+            self.profiler.count("pairs_tested", self.broad_phase.pairs_tested)
+            self.profiler.count("collisions_resolved", collisions_resolved)
+
+            # the cap is handled in its own frame first, so only the fixed walls are left for the generic reflection
+            piston_impulse, piston_work = self.particles.resolve_piston_collisions(substep_bounds["right"], self.cap_velocity)
+            wall_impulses[WALLS.index("right")] += piston_impulse
+            self.last_piston_work += piston_work / VELOCITY_SCALE ** 2
+            wall_impulses += self.particles.resolve_wall_collisions(substep_bounds)
+
+        self.piston_work += self.last_piston_work
+        self.particles.update_colors()
+
+        return wall_impulses
     
     def update_particle_temperature(self) -> None:
-        if self.previous_temperature == 0:
-            velocities = self.calculate_velocities(self.temperature, len(self.particles))
-            self.assign_velocity_to_particles(velocities)
+        if self.temperature == self.previous_temperature:
             return
-        
-        scaling = np.sqrt(self.temperature / self.previous_temperature) if self.temperature > 0 else 0
 
-        for particle in self.particles:
-            particle.velocity *= scaling
+        if self.previous_temperature == 0:
+            # nothing to scale, every species starts over from the distribution of its own mass
+            velocities = self.particles.velocities
+            for index, kind in enumerate(self.species):
+                members = np.flatnonzero(self.particles.species == index)
+                velocities[members] = self.calculate_velocity_array(self.temperature, len(members), kind.mass)
+        else:
+            scaling = np.sqrt(self.temperature / self.previous_temperature) if self.temperature > 0 else 0
+            self.particles.velocities[:] *= scaling
+
+        if self.event_engine is not None:
+            self.event_engine.invalidate()
     
     def adjust_temperature(self, temperature_adjustment: Union[float, int]) -> None:
         self.previous_temperature = self.temperature
@@ -119,34 +288,141 @@ class Closed_System:
         self.temperature = max(0, min(new_temperature, MAX_TEMPERATURE))
         self.update_particle_temperature()
 
+    def start_recording(self, path: str, capacity: Union[int, None] = None) -> None:
+        """ Records a frame to the trajectory file at path after every update, for up to capacity particles (default: twice the current number). """
+        self.stop_recording()
+        capacity = capacity if capacity is not None else max(2 * len(self.particles), 1)
+        self.recorder = Trajectory_Recorder(path, capacity)
+
+    def stop_recording(self) -> None:
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        self.recorder = None
+
+    def get_checkpoint_values(self) -> np.ndarray:
+        """ Returns the temperature, previous temperature, volume and volume limits as one array. """
+        return np.array((self.temperature, self.previous_temperature, self.container.volume_meters,
+                         self.container.min_volume_meters, self.container.max_volume_meters), dtype=np.float64)
+
+    def set_checkpoint_values(self, values: np.ndarray) -> None:
+        temperature, previous_temperature, volume_meters, min_volume_meters, max_volume_meters = values.tolist()
+        # temperatures go back to ints when they were ints, so the labels read the same as before
+        self.temperature = int(temperature) if temperature.is_integer() else temperature
+        self.previous_temperature = int(previous_temperature) if previous_temperature.is_integer() else previous_temperature
+        self.container.set_volume_limits(min_volume_meters, max_volume_meters)
+        self.container.set_volume_meters(volume_meters)
+        self.volume = self.container.get_volume_meters()
+        self.accurate_pressure = self.calculate_accurate_pressure()
+        # the cap did not move from where it was before the checkpoint was loaded
+        self.last_cap_right = None
+
+        # the measurement window and predicted events belong to the state that was replaced
+        self.pressure_gauge.reset()
+        if self.event_engine is not None:
+            self.event_engine.invalidate()
+
+    def get_checkpoint_state(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        """ Returns the particle arrays and the scalar state as named arrays, for save_arrays. """
+        state = {f"{prefix}particles.{name}": buffer[:len(self.particles)] for name, buffer in self.particles.get_buffers().items()}
+        state[f"{prefix}system"] = self.get_checkpoint_values()
+        state.update(self.species.get_checkpoint_arrays(prefix))
+        return state
+
+    def set_checkpoint_state(self, state: Dict[str, np.ndarray], prefix: str = "") -> None:
+        # checkpoints written before an array existed leave it zeroed
+        self.particles.set_arrays({name: state[f"{prefix}particles.{name}"] for name in self.particles.get_buffers() if f"{prefix}particles.{name}" in state})
+        self.set_checkpoint_values(state[f"{prefix}system"])
+        self.set_species_table(Species_Table.from_checkpoint_arrays(state, prefix))
+
+    def save_checkpoint(self, path: str) -> None:
+        """ Saves the particles, temperatures, container and the random generator state to a binary checkpoint file. """
+        save_arrays(path, {**self.get_checkpoint_state(), **get_random_state()})
+
+    def load_checkpoint(self, path: str) -> None:
+        state = load_arrays(path)
+        self.set_checkpoint_state(state)
+        set_random_state(state)
+
     def update_ui(self) -> None:
         self.volume_text.set_text(f"Volume: {self.volume} m")
         self.pressure_text.set_text(f"Pressure: {self.accurate_pressure} Pa")
         self.temperature_text.set_text(f"Temperature: {self.temperature} K")
+        self.measured_pressure_text.set_text(f"Measured Pressure: {self.measured_pressure_windowed:.2e} (ideal {self.ideal_pressure:.2e})")
     
     def render_ui(self, render_surface: pygame.Surface) -> None:
         self.volume_text.render(render_surface)
         self.pressure_text.render(render_surface)
         self.temperature_text.render(render_surface)
+        self.measured_pressure_text.render(render_surface)
+        self.speed_histogram_view.render(render_surface)
+
+    def get_species_renderer(self) -> Particle_Renderer:
+        """ Returns a renderer whose color table holds the color of every species, so the species index of a particle picks its sprite. """
+        if self.species_renderer is None:
+            self.species_renderer = Particle_Renderer(np.array([species.color[:3] for species in self.species], dtype=np.uint8))
+        return self.species_renderer
+
+    def render_particles(self, positions: np.ndarray, velocities: np.ndarray, radii: np.ndarray, color_buckets: np.ndarray,
+                         tracers: Union[np.ndarray, None] = None, species: Union[np.ndarray, None] = None) -> None:
+        """ Draws the particles onto the render surface, as a density field above lod_threshold particles with the tracers drawn on top.
+
+        In the species color mode particles whose species are given are drawn in the color of their species instead of their speed.
+        The density field always shows the speed.
+        """
+        particle_renderer = self.particle_renderer
+        if self.color_mode == "species" and species is not None:
+            particle_renderer, color_buckets = self.get_species_renderer(), species
+
+        if self.lod_threshold is None or len(positions) < self.lod_threshold:
+            particle_renderer.render(self.render_surface, positions, radii, color_buckets)
+            return
+
+        container_bounds = self.container.get_container_bounds((-self.closed_system_render_position[0], -self.closed_system_render_position[1]))
+        field_rect = pygame.Rect(container_bounds["left"], container_bounds["top"], container_bounds["right"] - container_bounds["left"], container_bounds["bottom"] - container_bounds["top"])
+        self.density_field_renderer.render(self.render_surface, positions, velocities, radii, field_rect, self.closed_system_background_color)
+
+        if tracers is not None:
+            selected = np.flatnonzero(tracers)
+            particle_renderer.render(self.render_surface, positions[selected], radii[selected], color_buckets[selected])
 
     def render(self, render_surface: pygame.Surface) -> None:
         self.render_surface.fill(self.closed_system_background_color)
         self.container.render(self.render_surface, offset=(-self.closed_system_render_position[0], -self.closed_system_render_position[1]))
 
-        for particle in self.particles:
-            particle.render(self.render_surface)
+        particles = self.particles
+        self.render_particles(particles.positions, particles.velocities, particles.radii, particles.color_buckets, particles.tracers, particles.species)
         
         self.render_ui(self.render_surface)
         render_surface.blit(self.render_surface, self.closed_system_render_position)
+        self.profiler.lap("render")
 
     def update(self, dt: float, update_particles_movement: bool = True) -> None:
         self.container.update()
         self.volume = self.container.get_volume_meters()
+        self.profiler.lap("container")
+
+        wall_impulses = self.update_particles(dt, update_particles_movement)
+        self.profiler.count("particle_count", len(self.particles))
+        self.profiler.lap("particles")
 
-        momentum_change = self.update_particles(dt, update_particles_movement)
+        if update_particles_movement and self.thermostat is not None:
+            # every species of a mixture is held at the setpoint on its own
+            species = (self.particles.species, len(self.species)) if len(self.species) > 1 else (None, 1)
+            if self.thermostat.step(self.particles.velocities, self.particles.masses, self.temperature, dt, *species) and self.event_engine is not None:
+                self.event_engine.invalidate()
+
+        if update_particles_movement:
+            self.speed_distribution.update(self.particles.velocities, self.particles.masses)
+        self.update_measured_pressure(wall_impulses, dt if update_particles_movement else 0)
 
         self.accurate_pressure = self.calculate_accurate_pressure()
 
-        self.update_ui()
+        if self.recorder is not None:
+            self.recorder.record(self, dt if update_particles_movement else 0)
+
+        if not self.headless:
+            self.update_ui()
+        self.profiler.lap("observables")
         
         
\ No newline at end of file
@@ -3,9 +3,11 @@ from typing import Union
 
 class Container:
     def __init__(self, position: Union[list, tuple], width: int = 800, height: int = 300, start_volume_meters: float = 1, min_volume_meters: float = 0, 
-                 max_volume_meters: float = 3, container_color: Union[list, tuple] = (0,0,0), cap_color: Union[list, tuple] = (255,0,0)) -> None:
+                 max_volume_meters: float = 3, container_color: Union[list, tuple] = (0,0,0), cap_color: Union[list, tuple] = (255,0,0), 
+                 interactive: bool = True) -> None:
         
         self.position: Union[list, tuple] = position
+        self.interactive: bool = interactive
 
         self.width: int = width
         self.height: int = height
@@ -18,6 +20,8 @@ class Container:
 
         self.volume_meters_pixel_ratio = self.width / self.max_volume_meters
 
+        # the cap is a wall at a sub-pixel x position, the hitbox only rounds it for the mouse
+        self.cap_x: float = self.position[0] + self.volume_meters * self.volume_meters_pixel_ratio
         self.cap_hitbox_size: tuple = (50, self.height)
         self.cap_hitbox: pygame.Rect = pygame.Rect(self.position[0] + (self.volume_meters * self.volume_meters_pixel_ratio) - (self.cap_hitbox_size[0] / 2), 
                                                    self.position[1], self.cap_hitbox_size[0], self.cap_hitbox_size[1])
@@ -37,7 +41,7 @@ class Container:
     
     def get_container_bounds(self, offset: Union[list, tuple] = (0,0)) -> dict:
         """ Returns the bounds of the container. """
-        return {"top": self.position[1] + offset[1], "bottom": self.position[1] + self.height + offset[1], "left": self.position[0] + offset[0], "right": self.cap_hitbox.centerx + offset[0]}
+        return {"top": self.position[1] + offset[1], "bottom": self.position[1] + self.height + offset[1], "left": self.position[0] + offset[0], "right": self.cap_x + offset[0]}
 
     def render(self, render_surface: pygame.Surface, offset: Union[list, tuple] = (0,0)) -> None:
         """ Renders the container with all its components to a surface. """
@@ -80,14 +84,33 @@ class Container:
         self.drag_cap_active = False if not self.left_mouse_button_holding else self.drag_cap_active
         
         if self.drag_cap_active:
-            self.cap_hitbox.centerx = mouse_position[0] - self.mouse_to_cap_offset_x
-        
-        self.cap_hitbox.centerx = max(self.position[0] + (self.min_volume_meters * self.volume_meters_pixel_ratio), min(self.cap_hitbox.centerx, self.position[0] + self.max_volume_meters * self.volume_meters_pixel_ratio))
+            self.set_cap_position(mouse_position[0] - self.mouse_to_cap_offset_x)
+
+    def set_cap_position(self, cap_centerx: Union[float, int]) -> None:
+        """ Moves the cap to an x position, clamped to the volume limits, and updates the volume. """
+        self.cap_x = max(self.position[0] + (self.min_volume_meters * self.volume_meters_pixel_ratio), min(cap_centerx, self.position[0] + self.max_volume_meters * self.volume_meters_pixel_ratio))
+        self.cap_hitbox.centerx = round(self.cap_x)
+
+        self.volume_meters = (self.cap_x - self.position[0]) / self.volume_meters_pixel_ratio
+    
+    def set_volume_limits(self, min_volume_meters: float, max_volume_meters: float) -> None:
+        """ Changes the volume limits, rescaling meters to pixels, and keeps the volume inside them. """
+        volume_meters = self.volume_meters
+        self.min_volume_meters = min_volume_meters
+        self.max_volume_meters = max_volume_meters
+        self.volume_meters_heigth = self.height / self.max_volume_meters
+        self.volume_meters_pixel_ratio = self.width / self.max_volume_meters
+        self.set_volume_meters(volume_meters)
 
-        self.volume_meters = (self.cap_hitbox.centerx - self.position[0]) / self.volume_meters_pixel_ratio
+    def set_volume_meters(self, volume_meters: float) -> None:
+        """ Moves the cap so the container has the given volume (clamped to the volume limits). """
+        self.set_cap_position(self.position[0] + volume_meters * self.volume_meters_pixel_ratio)
 
     def update(self) -> None:
-        """ Updates the container. """
+        """ Updates the container. The mouse is only polled when the container is interactive. """
+        if not self.interactive:
+            return
+
         self._inputs()
         self._drag_cap_line()
 
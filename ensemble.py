@@ -0,0 +1,123 @@
+import itertools
+from typing import List, Sequence
+import numpy as np
+
+from settings import *
+from container import Container
+from particle_store import Particle_Store, WALLS
+from broad_phase import create_broad_phase
+from closed_system import generate_velocities
+from pressure import ideal_gas_pressure
+from placement import place_particles
+
+class Ensemble:
+    """ Many independent gas systems advanced together by one vectorized step.
+
+    The particles of all members share one Particle_Store, member after member, and members[i] is the member of particle i.
+    Every member has its own container (volume) and temperature. The per-member quantities are arrays with the member
+    as leading dimension, and the physics is the one Closed_System uses (Particle_Store collisions and wall reflection).
+    """
+    def __init__(self, temperatures: Sequence[float], volumes_meters: Sequence[float], particle_counts: Sequence[int],
+                 container_width: int = 800, container_height: int = 300, max_volume_meters: float = 3, broad_phase: str = BROAD_PHASE) -> None:
+
+        self.temperatures: np.ndarray = np.asarray(temperatures, dtype=np.float64)
+        self.particle_counts: np.ndarray = np.asarray(particle_counts, dtype=np.int64)
+        self.number_of_members: int = len(self.temperatures)
+
+        self.containers: List[Container] = [Container((0, 0), width=container_width, height=container_height, start_volume_meters=volume_meters,
+                                                      min_volume_meters=0, max_volume_meters=max(max_volume_meters, volume_meters), interactive=False)
+                                            for volume_meters in volumes_meters]
+
+        self.members: np.ndarray = np.repeat(np.arange(self.number_of_members), self.particle_counts)
+        self.member_offsets: np.ndarray = np.concatenate(([0], np.cumsum(self.particle_counts)))
+
+        self.particles: Particle_Store = Particle_Store(capacity=int(self.particle_counts.sum()))
+        self.broad_phase = create_broad_phase(broad_phase)
+        self._update_bounds()
+
+        for member, (temperature, count) in enumerate(zip(self.temperatures, self.particle_counts)):
+            bounds = {side: self.member_bounds[side][member] for side in ("left", "top", "right", "bottom")}
+            positions = place_particles(count, bounds)
+            self.particles.add(positions, generate_velocities(temperature, count), mass=PARTICLE_MASS, radius=PARTICLE_RADIUS)
+
+        self.steps: int = 0
+        self.reset_pressure()
+
+    def _update_bounds(self) -> None:
+        """ Collects the container bounds of every member, and per particle for the wall collisions. """
+        bounds = [container.get_container_bounds() for container in self.containers]
+        self.member_bounds = {side: np.array([member[side] for member in bounds], dtype=np.float64) for side in ("left", "right", "top", "bottom")}
+        self.particle_bounds = {side: values[self.members] for side, values in self.member_bounds.items()}
+
+        # members are laid side by side on one wide grid for the broad phase, so particles of different members never meet
+        self.member_stride: float = float(np.max(self.member_bounds["right"] - self.member_bounds["left"])) + 4 * PARTICLE_RADIUS if self.number_of_members else 0.0
+        self.particle_shift: np.ndarray = self.members * self.member_stride - self.particle_bounds["left"]
+        self.broad_phase_bounds = {"left": 0, "right": self.member_stride * self.number_of_members,
+                                   "top": float(self.member_bounds["top"].min()) if self.number_of_members else 0,
+                                   "bottom": float(self.member_bounds["bottom"].max()) if self.number_of_members else 0}
+
+    def set_volumes(self, volumes_meters: Sequence[float]) -> None:
+        for container, volume_meters in zip(self.containers, volumes_meters):
+            container.set_volume_meters(volume_meters)
+        self._update_bounds()
+
+    def get_volumes(self) -> np.ndarray:
+        return np.array([container.get_volume_meters() for container in self.containers])
+
+    def get_accessible_areas(self) -> np.ndarray:
+        widths = np.maximum(self.member_bounds["right"] - self.member_bounds["left"] - 2 * PARTICLE_RADIUS, 0)
+        heights = np.maximum(self.member_bounds["bottom"] - self.member_bounds["top"] - 2 * PARTICLE_RADIUS, 0)
+        return widths * heights
+
+    def reset_pressure(self) -> None:
+        """ Starts a new pressure measurement window for every member. """
+        self.wall_impulses: np.ndarray = np.zeros((self.number_of_members, len(WALLS)))
+        self.exposures: np.ndarray = np.zeros((self.number_of_members, len(WALLS)))
+
+    def step(self, dt: float) -> None:
+        particles = self.particles
+        particles.move(dt)
+
+        shifted_positions = particles.positions.copy()
+        shifted_positions[:, 0] += self.particle_shift
+        pairs_i, pairs_j = self.broad_phase.find_pairs(shifted_positions, particles.radii, self.broad_phase_bounds)
+        particles.resolve_particle_collisions(pairs_i, pairs_j)
+
+        self.wall_impulses += particles.resolve_wall_collisions(self.particle_bounds, groups=self.members, number_of_groups=self.number_of_members)
+
+        widths = np.maximum(self.member_bounds["right"] - self.member_bounds["left"] - 2 * PARTICLE_RADIUS, 0)
+        heights = np.maximum(self.member_bounds["bottom"] - self.member_bounds["top"] - 2 * PARTICLE_RADIUS, 0)
+        self.exposures += np.column_stack((heights, heights, widths, widths)) * dt
+        self.steps += 1
+
+    def run(self, steps: int, dt: float = 1 / TARGET_FPS) -> None:
+        for _ in range(steps):
+            self.step(dt)
+
+    def measured_pressures(self) -> np.ndarray:
+        """ Pressure of every member over the current measurement window, in the units of Pressure_Gauge. """
+        exposures = self.exposures.sum(axis=1)
+        return np.divide(self.wall_impulses.sum(axis=1), exposures, out=np.zeros(self.number_of_members), where=exposures > 0)
+
+    def ideal_pressures(self) -> np.ndarray:
+        areas = self.get_accessible_areas()
+        return np.array([ideal_gas_pressure(int(count), temperature, area) for count, temperature, area in zip(self.particle_counts, self.temperatures, areas)])
+
+def sweep(temperatures: Sequence[float], volumes_meters: Sequence[float], particle_counts: Sequence[int], steps: int = 600,
+          equilibration_steps: int = 120, dt: float = 1 / TARGET_FPS, broad_phase: str = BROAD_PHASE) -> dict:
+    """ Runs one ensemble member for every (temperature, volume, particle count) combination and returns measured and ideal pressures. """
+    grid = list(itertools.product(temperatures, volumes_meters, particle_counts))
+    grid_temperatures, grid_volumes, grid_counts = (np.array(values) for values in zip(*grid)) if grid else (np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64))
+
+    ensemble = Ensemble(grid_temperatures, grid_volumes, grid_counts, broad_phase=broad_phase)
+    ensemble.run(equilibration_steps, dt)
+    ensemble.reset_pressure()
+    ensemble.run(steps, dt)
+
+    return {
+        "temperature": grid_temperatures,
+        "volume": ensemble.get_volumes(),
+        "particles": grid_counts,
+        "measured_pressure": ensemble.measured_pressures(),
+        "ideal_pressure": ensemble.ideal_pressures(),
+    }
@@ -0,0 +1,500 @@
+import heapq
+from itertools import chain
+from math import sqrt, inf
+from typing import Union, List, Tuple, Set, Iterable
+import numpy as np
+
+from particle_store import Particle_Store, WALLS
+
+# wall codes used as the partner index of disk-wall events, -(index in WALLS) - 1. The right wall is the cap
+WALL_LEFT = -1
+WALL_RIGHT = -2
+WALL_TOP = -3
+WALL_BOTTOM = -4
+
+# cell codes used as the partner index of cell crossing events, for the side the particle leaves its cell through
+CELL_LEFT = -5
+CELL_RIGHT = -6
+CELL_TOP = -7
+CELL_BOTTOM = -8
+# column and row step of every cell crossing
+CELL_STEPS = {CELL_LEFT: (-1, 0), CELL_RIGHT: (1, 0), CELL_TOP: (0, -1), CELL_BOTTOM: (0, 1)}
+
+# partner codes of the rows of Event_Driven_Engine._boundary_dts, ties go to the first row
+BOUNDARY_CODES = (WALL_LEFT, WALL_RIGHT, WALL_TOP, WALL_BOTTOM, CELL_LEFT, CELL_RIGHT, CELL_TOP, CELL_BOTTOM)
+
+class Event_Driven_Engine:
+    """ Exact hard-disk integrator. Advances from predicted collision to predicted collision instead of using fixed steps.
+
+    Every particle keeps one entry in the queue: its earliest predicted collision with a disk or a wall, or the moment it leaves
+    its cell of the grid. Entries of earlier predictions are invalidated lazily by the prediction count of the particle, entries
+    whose partner collided since by the collision count of the partner.
+
+    Particles keep their own time, position and velocity in lists while the engine runs and are only moved when they take part in
+    an event. At the end of advance the ones whose velocity changed are written to the store, the others are moved there in one
+    pass. The cells are at least one particle diameter wide, so a particle can only hit the particles in its own and the 8
+    neighbouring cells before it leaves its cell, and a prediction never looks further.
+
+    The cap is a moving wall. Over every step it moves at the constant velocity that takes it to the bounds of the step, particles
+    bounce off it in its frame and the work it does on them is added to piston_work. When its velocity changes only the particles
+    in the columns it can reach are predicted again, the others leave their column before they could hit it.
+
+    The one or two particles of an event are predicted one by one, against a few dozen neighbours a numpy call costs more than
+    the arithmetic. Larger batches, like a reset or the particles at a cap that changed its velocity, are predicted in one
+    vectorized pass over all their candidate pairs, walls and cell sides.
+    """
+    # average particles per cell, fewer cells mean fewer crossing events but more particles tested by every prediction
+    PARTICLES_PER_CELL = 1
+    # smaller systems are kept in one cell, testing against all particles is as fast as crossing cells
+    GRID_MIN_PARTICLES = 100
+    # batches of at least this many particles are predicted in one vectorized pass
+    VECTORIZED_MIN_PARTICLES = 16
+
+    def __init__(self, particles: Particle_Store) -> None:
+        self.particles: Particle_Store = particles
+
+        self.time: float = 0.0
+        self.queue: List[Tuple[float, int, int, int, int]] = []
+        self.collision_counts: List[int] = []
+        self.prediction_counts: List[int] = []
+        self.container_bounds: Union[dict, None] = None
+        self.needs_reset: bool = True
+
+        # position at the own time of every particle, its velocity, radius and mass while the engine runs
+        self.x: List[float] = []
+        self.y: List[float] = []
+        self.vx: List[float] = []
+        self.vy: List[float] = []
+        self.particle_times: List[float] = []
+        self.radii: List[float] = []
+        self.masses: List[float] = []
+        self.max_radius: float = 0.0
+        # particles whose velocity changed during the step
+        self.changed: Set[int] = set()
+
+        # the cap is at cap_x at cap_time and moves at cap_velocity
+        self.cap_x: float = 0.0
+        self.cap_time: float = 0.0
+        self.cap_velocity: float = 0.0
+        # first column whose particles were predicted with the current motion of the cap
+        self.cap_column: int = 0
+
+        # grid over the container, every cell holds the indices of the particles inside it
+        self.columns: int = 1
+        self.rows: int = 1
+        self.cell_width: float = 1.0
+        self.cell_height: float = 1.0
+        self.cells: List[Set[int]] = []
+        self.particle_columns: List[int] = []
+        self.particle_rows: List[int] = []
+
+        self.events_processed: int = 0
+        self.cell_crossings: int = 0
+        # work done by the cap on the particles, in simulation units
+        self.piston_work: float = 0.0
+
+    def invalidate(self) -> None:
+        """ Forces the predictions to be rebuilt, e.g. after the velocities were changed from outside the engine. """
+        self.needs_reset = True
+
+    def reset(self, container_bounds: dict) -> np.ndarray:
+        """ Moves stray particles back inside the container, sorts them into the grid and predicts the next event of every particle. """
+        # plain floats, numpy scalars would end up in the velocities through the cap and slow every prediction down
+        self.container_bounds = {side: float(value) for side, value in container_bounds.items()}
+        wall_impulses = self.particles.resolve_wall_collisions(self.container_bounds)
+
+        positions = self.particles.positions
+        velocities = self.particles.velocities
+        self.x, self.y = positions[:, 0].tolist(), positions[:, 1].tolist()
+        self.vx, self.vy = velocities[:, 0].tolist(), velocities[:, 1].tolist()
+        self.radii = self.particles.radii.tolist()
+        self.masses = self.particles.masses.tolist()
+        self.max_radius = max(self.radii, default=0.0)
+        self.changed = set()
+
+        self.time = 0.0
+        self.queue = []
+        self.particle_times = [0.0] * len(self.particles)
+        self.collision_counts = [0] * len(self.particles)
+        self.prediction_counts = [0] * len(self.particles)
+        self.cap_x, self.cap_time, self.cap_velocity, self.cap_column = self.container_bounds["right"], 0.0, 0.0, 0
+        self._build_grid()
+        self._predict(range(len(self.particles)))
+
+        self.needs_reset = False
+        return wall_impulses
+
+    def advance(self, dt: float, container_bounds: dict) -> np.ndarray:
+        """ Advances the system exactly by dt. Returns the momentum transferred to each wall, ordered like WALLS.
+
+        The cap moves from where it was to the right bound at a constant velocity over the step. With dt 0 it jumps there and the
+        particles it passed are put back inside, like the time step integrator does while the simulation is paused.
+        """
+        wall_impulses = np.zeros(len(WALLS))
+        if (self.needs_reset or len(self.collision_counts) != len(self.particles)
+                or any(container_bounds[side] != self.container_bounds[side] for side in ("left", "top", "bottom"))):
+            wall_impulses += self.reset(container_bounds)
+
+        cap_x = float(container_bounds["right"])
+        if dt > 0:
+            cap_velocity = (cap_x - self.cap_x) / dt
+            if cap_velocity != self.cap_velocity:
+                self._set_cap_motion(cap_velocity, cap_x)
+            else:
+                # at an unchanged velocity the cap moves on into columns it could not reach before
+                self._extend_grid(cap_x)
+                self._predict_cap_columns(cap_x)
+        elif cap_x != self.cap_x:
+            wall_impulses[WALLS.index("right")] += self._jump_cap(cap_x)
+        elif self.cap_velocity != 0:
+            self._set_cap_motion(0.0, cap_x)
+
+        target_time = self.time + dt
+        queue = self.queue
+        collision_counts = self.collision_counts
+        prediction_counts = self.prediction_counts
+
+        while queue and queue[0][0] <= target_time:
+            event_time, index, other, prediction, other_count = heapq.heappop(queue)
+
+            if prediction != prediction_counts[index]:
+                continue
+            if other >= 0 and other_count != collision_counts[other]:
+                # the partner collided with something else first, so this particle needs a new prediction
+                self._predict_particle(index)
+                continue
+
+            self.time = event_time
+            self._synchronise(index)
+
+            if other >= 0:
+                self._synchronise(other)
+                self._collide_disks(index, other)
+                collision_counts[other] += 1
+                self.changed.add(other)
+            elif other >= WALL_BOTTOM:
+                wall_impulses[-other - 1] += self._collide_wall(index, other)
+            else:
+                # the path of the particle does not change, so the predictions of the others involving it stay valid
+                self._cross_cell(index, other)
+                self._predict_particle(index)
+                continue
+            collision_counts[index] += 1
+            self.changed.add(index)
+            self.events_processed += 1
+
+            self._predict_particle(index)
+            if other >= 0:
+                self._predict_particle(other)
+
+        self.time = target_time
+        self.cap_x, self.cap_time = cap_x, target_time
+        self.container_bounds["right"] = cap_x
+        self._write_particles(dt)
+
+        return wall_impulses
+
+    def _synchronise(self, index: int) -> None:
+        """ Moves one particle from its own time to the time of the engine. """
+        elapsed = self.time - self.particle_times[index]
+        if elapsed != 0:
+            self.x[index] += self.vx[index] * elapsed
+            self.y[index] += self.vy[index] * elapsed
+            self.particle_times[index] = self.time
+
+    def _write_particles(self, dt: float) -> None:
+        """ Brings the store to the time of the engine at the end of a step of dt. """
+        if len(self.particles) == 0:
+            return
+        positions = self.particles.positions
+        velocities = self.particles.velocities
+        # the particles that kept their velocity moved in a straight line over the whole step
+        positions += velocities * dt
+
+        if self.changed:
+            changed = list(self.changed)
+            for index in changed:
+                self._synchronise(index)
+            positions[changed] = [(self.x[index], self.y[index]) for index in changed]
+            velocities[changed] = [(self.vx[index], self.vy[index]) for index in changed]
+            self.changed.clear()
+
+    def _set_cap_motion(self, cap_velocity: float, end_x: float) -> None:
+        """ Lets the cap move at cap_velocity from now on and predicts the particles it can reach before it is at end_x again. """
+        self.cap_time = self.time
+        self.cap_velocity = cap_velocity
+        self._extend_grid(max(self.cap_x, end_x))
+        self.cap_column = self.columns
+        self._predict_cap_columns(min(self.cap_x, end_x))
+
+    def _predict_cap_columns(self, left: float) -> None:
+        """ Predicts the particles of the columns the cap can reach on its way to left that were not predicted with its motion yet. """
+        # a particle whose column ends further than its radius from the cap leaves the column before it can hit the cap,
+        # and is predicted with the motion of the cap then
+        first_column = min(max(int((left - self.max_radius - self.container_bounds["left"]) // self.cell_width), 0), self.columns - 1)
+        if first_column < self.cap_column:
+            columns = range(first_column, self.cap_column)
+            self.cap_column = first_column
+            self._predict(list(chain.from_iterable(self.cells[row * self.columns + column] for row in range(self.rows) for column in columns)))
+
+    def _jump_cap(self, cap_x: float) -> float:
+        """ Moves the cap to cap_x at once and puts the particles it passed back inside. Returns the momentum transferred to the cap. """
+        positions = self.particles.positions
+        velocities = self.particles.velocities
+        past = np.flatnonzero(positions[:, 0] > cap_x - self.particles.radii).tolist()
+        impulse, _ = self.particles.resolve_piston_collisions(cap_x, 0.0)
+
+        for index in past:
+            self.x[index], self.y[index] = positions[index].tolist()
+            self.vx[index], self.vy[index] = velocities[index].tolist()
+            self.particle_times[index] = self.time
+            self.collision_counts[index] += 1
+            self._place(index)
+
+        self.cap_x = cap_x
+        self._set_cap_motion(0.0, cap_x)
+        return impulse
+
+    def _build_grid(self) -> None:
+        positions = self.particles.positions
+        bounds = self.container_bounds
+        width, height = bounds["right"] - bounds["left"], bounds["bottom"] - bounds["top"]
+
+        # cells are never narrower than the largest diameter and wider when the gas is dilute, small systems get a single cell
+        if len(positions) < self.GRID_MIN_PARTICLES:
+            cell_size = np.inf
+        else:
+            cell_size = max(2 * self.max_radius, np.sqrt(width * height * self.PARTICLES_PER_CELL / len(positions)))
+        self.columns = max(1, int(width // cell_size))
+        self.rows = max(1, int(height // cell_size))
+        self.cell_width = width / self.columns
+        self.cell_height = height / self.rows
+
+        columns = np.clip(np.floor((positions[:, 0] - bounds["left"]) / self.cell_width), 0, self.columns - 1).astype(np.int64)
+        rows = np.clip(np.floor((positions[:, 1] - bounds["top"]) / self.cell_height), 0, self.rows - 1).astype(np.int64)
+        self.particle_columns = columns.tolist()
+        self.particle_rows = rows.tolist()
+        self.cells = [set() for _ in range(self.columns * self.rows)]
+        for index, cell in enumerate((rows * self.columns + columns).tolist()):
+            self.cells[cell].add(index)
+
+    def _extend_grid(self, right: float) -> None:
+        """ Adds columns until the grid reaches right, for a cap pulled out past it. A single cell stretches instead. """
+        columns = int(np.ceil((right - self.container_bounds["left"]) / self.cell_width))
+        if len(self.cells) == 1 or columns <= self.columns:
+            return
+
+        # the last column held every particle right of it, they are sorted into the new columns
+        last_column = [index for row in range(self.rows) for index in self.cells[row * self.columns + self.columns - 1]]
+        cells = [set() for _ in range(columns * self.rows)]
+        for row in range(self.rows):
+            cells[row * columns:row * columns + self.columns] = self.cells[row * self.columns:(row + 1) * self.columns]
+        self.cells, self.columns = cells, columns
+        for index in last_column:
+            self._synchronise(index)
+            self._place(index)
+        # their predictions did not cross into the new columns
+        self._predict(last_column)
+
+    def _place(self, index: int) -> None:
+        """ Moves a particle into the cell of its position, which has to be up to date. """
+        bounds = self.container_bounds
+        column = min(max(int((self.x[index] - bounds["left"]) // self.cell_width), 0), self.columns - 1)
+        row = min(max(int((self.y[index] - bounds["top"]) // self.cell_height), 0), self.rows - 1)
+        self.cells[self.particle_rows[index] * self.columns + self.particle_columns[index]].discard(index)
+        self.particle_columns[index], self.particle_rows[index] = column, row
+        self.cells[row * self.columns + column].add(index)
+
+    def _neighbourhood(self, index: int) -> List[Set[int]]:
+        """ Returns the cell of a particle and the cells around it, the particle itself included. """
+        column, row = self.particle_columns[index], self.particle_rows[index]
+        first_column, end_column = max(column - 1, 0), min(column + 2, self.columns)
+        return [cell for row_start in range(max(row - 1, 0) * self.columns, min(row + 2, self.rows) * self.columns, self.columns)
+                for cell in self.cells[row_start + first_column:row_start + end_column]]
+
+    def _cross_cell(self, index: int, side: int) -> None:
+        column, row = self.particle_columns[index], self.particle_rows[index]
+        self.cells[row * self.columns + column].discard(index)
+
+        column_step, row_step = CELL_STEPS[side]
+        column = min(max(column + column_step, 0), self.columns - 1)
+        row = min(max(row + row_step, 0), self.rows - 1)
+        self.particle_columns[index], self.particle_rows[index] = column, row
+        self.cells[row * self.columns + column].add(index)
+        self.cell_crossings += 1
+
+    def _push(self, index: int, event_dt: float, partner: int) -> None:
+        """ Replaces the queue entry of a particle by its event in event_dt, or by none for inf. """
+        self.prediction_counts[index] += 1
+        if event_dt != inf:
+            partner_count = self.collision_counts[partner] if partner >= 0 else 0
+            heapq.heappush(self.queue, (self.time + event_dt, index, partner, self.prediction_counts[index], partner_count))
+
+    def _predict(self, indices: Iterable[int]) -> None:
+        """ Pushes the earliest disk or wall collision or cell crossing of every given particle onto the queue. """
+        indices = list(indices)
+        if len(indices) >= self.VECTORIZED_MIN_PARTICLES:
+            self._predict_vectorized(indices)
+        else:
+            for index in indices:
+                self._predict_particle(index)
+
+    def _predict_particle(self, index: int) -> None:
+        self._synchronise(index)
+        now = self.time
+        xs, ys, vxs, vys, times, radii = self.x, self.y, self.vx, self.vy, self.particle_times, self.radii
+        x, y, vx, vy, radius = xs[index], ys[index], vxs[index], vys[index], radii[index]
+
+        # solve |dp + dv t| = sigma for the first contact of approaching pairs, the others are still where they were at their own time.
+        # The particle itself never approaches, overlapping pairs are left to separate so a pile of spawned particles cannot lock the queue
+        event_dt, partner = inf, 0
+        for cell in self._neighbourhood(index):
+            for other in cell:
+                elapsed = now - times[other]
+                other_vx, other_vy = vxs[other], vys[other]
+                dx = xs[other] + other_vx * elapsed - x
+                dy = ys[other] + other_vy * elapsed - y
+                dvx = other_vx - vx
+                dvy = other_vy - vy
+                dv_dot_dr = dvx * dx + dvy * dy
+                if dv_dot_dr >= 0:
+                    continue
+                sigma = radius + radii[other]
+                distance_excess = dx * dx + dy * dy - sigma * sigma
+                if distance_excess <= 0:
+                    continue
+                dv_dot_dv = dvx * dvx + dvy * dvy
+                discriminant = dv_dot_dr * dv_dot_dr - dv_dot_dv * distance_excess
+                if discriminant <= 0:
+                    continue
+                contact_dt = -(dv_dot_dr + sqrt(discriminant)) / dv_dot_dv
+                if contact_dt < event_dt:
+                    event_dt, partner = contact_dt, other
+
+        # the cap can be reached whenever the particle is faster than it
+        closing_speed = vx - self.cap_velocity
+        if closing_speed > 0:
+            cap_dt = max(self.cap_x + self.cap_velocity * (now - self.cap_time) - radius - x, 0) / closing_speed
+            if cap_dt < event_dt:
+                event_dt, partner = cap_dt, WALL_RIGHT
+
+        # on each axis only the wall and the side of the cell the particle moves toward can be reached,
+        # the edges of the grid are never crossed as the walls come first
+        bounds = self.container_bounds
+        column, row = self.particle_columns[index], self.particle_rows[index]
+        cell_left = bounds["left"] + column * self.cell_width
+        cell_top = bounds["top"] + row * self.cell_height
+        for speed, wall, wall_distance, side, side_distance in (
+                (vx, None, 0, CELL_RIGHT if column < self.columns - 1 else None, cell_left + self.cell_width - x) if vx > 0 else
+                (-vx, WALL_LEFT, x - radius - bounds["left"], CELL_LEFT if column > 0 else None, x - cell_left),
+                (vy, WALL_BOTTOM, bounds["bottom"] - radius - y, CELL_BOTTOM if row < self.rows - 1 else None, cell_top + self.cell_height - y) if vy > 0 else
+                (-vy, WALL_TOP, y - radius - bounds["top"], CELL_TOP if row > 0 else None, y - cell_top)):
+            if speed > 0:
+                if wall is not None:
+                    wall_dt = max(wall_distance, 0) / speed
+                    if wall_dt < event_dt:
+                        event_dt, partner = wall_dt, wall
+                if side is not None:
+                    crossing_dt = max(side_distance, 0) / speed
+                    if crossing_dt < event_dt:
+                        event_dt, partner = crossing_dt, side
+
+        self._push(index, event_dt, partner)
+
+    def _predict_vectorized(self, indices: List[int]) -> None:
+        for index in indices:
+            self._synchronise(index)
+        x, y, vx, vy = np.array(self.x), np.array(self.y), np.array(self.vx), np.array(self.vy)
+        radii = np.array(self.radii)
+        particles = np.array(indices, dtype=np.intp)
+
+        # candidate pairs (owner, neighbour), the owners are positions in indices
+        if len(self.cells) == 1:
+            owners, neighbours = np.divmod(np.arange(len(indices) * len(x)), len(x))
+        else:
+            neighbourhoods = [self._neighbourhood(index) for index in indices]
+            owners = np.repeat(np.arange(len(indices)), [sum(map(len, cells)) for cells in neighbourhoods])
+            neighbours = np.fromiter(chain.from_iterable(chain.from_iterable(neighbourhoods)), dtype=np.intp, count=len(owners))
+        owner_particles = particles[owners]
+
+        # the contacts of _predict_particle for all pairs at once
+        elapsed = self.time - np.array(self.particle_times)[neighbours]
+        dx = x[neighbours] + vx[neighbours] * elapsed - x[owner_particles]
+        dy = y[neighbours] + vy[neighbours] * elapsed - y[owner_particles]
+        dvx = vx[neighbours] - vx[owner_particles]
+        dvy = vy[neighbours] - vy[owner_particles]
+        dv_dot_dr = dvx * dx + dvy * dy
+        distance_excesses = dx * dx + dy * dy - (radii[neighbours] + radii[owner_particles]) ** 2
+        dv_dot_dv = dvx * dvx + dvy * dvy
+        discriminants = dv_dot_dr * dv_dot_dr - dv_dot_dv * distance_excesses
+
+        event_dts = np.full(len(indices), np.inf)
+        partners = np.zeros(len(indices), dtype=np.intp)
+        candidates = np.flatnonzero((dv_dot_dr < 0) & (distance_excesses > 0) & (discriminants > 0))
+        if len(candidates):
+            times = -(dv_dot_dr[candidates] + np.sqrt(discriminants[candidates])) / dv_dot_dv[candidates]
+            candidate_owners = owners[candidates]
+            np.minimum.at(event_dts, candidate_owners, times)
+            earliest = times == event_dts[candidate_owners]
+            partners[candidate_owners[earliest]] = neighbours[candidates[earliest]]
+
+        boundary_dts = self._boundary_dts(particles, x[particles], y[particles], vx[particles], vy[particles], radii[particles])
+        boundaries = np.argmin(boundary_dts, axis=0)
+        boundary_dts = boundary_dts[boundaries, np.arange(len(indices))]
+        is_boundary = boundary_dts < event_dts
+        event_dts = np.where(is_boundary, boundary_dts, event_dts)
+        partners = np.where(is_boundary, np.take(BOUNDARY_CODES, boundaries), partners)
+
+        for index, event_dt, partner in zip(indices, event_dts.tolist(), partners.tolist()):
+            self._push(index, event_dt, partner)
+
+    def _boundary_dts(self, particles: np.ndarray, x: np.ndarray, y: np.ndarray, vx: np.ndarray, vy: np.ndarray, radii: np.ndarray) -> np.ndarray:
+        """ Returns the time until the given particles reach every wall and cell side, rows ordered like BOUNDARY_CODES (inf for never). """
+        bounds = self.container_bounds
+        columns = np.array(self.particle_columns)[particles]
+        rows = np.array(self.particle_rows)[particles]
+        cell_left = bounds["left"] + columns * self.cell_width
+        cell_top = bounds["top"] + rows * self.cell_height
+        cap_x = self.cap_x + self.cap_velocity * (self.time - self.cap_time)
+        closing_speeds = vx - self.cap_velocity
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.stack((
+                np.where(vx < 0, np.maximum(x - radii - bounds["left"], 0) / -vx, np.inf),
+                np.where(closing_speeds > 0, np.maximum(cap_x - radii - x, 0) / closing_speeds, np.inf),
+                np.where(vy < 0, np.maximum(y - radii - bounds["top"], 0) / -vy, np.inf),
+                np.where(vy > 0, np.maximum(bounds["bottom"] - radii - y, 0) / vy, np.inf),
+                np.where((vx < 0) & (columns > 0), np.maximum(x - cell_left, 0) / -vx, np.inf),
+                np.where((vx > 0) & (columns < self.columns - 1), np.maximum(cell_left + self.cell_width - x, 0) / vx, np.inf),
+                np.where((vy < 0) & (rows > 0), np.maximum(y - cell_top, 0) / -vy, np.inf),
+                np.where((vy > 0) & (rows < self.rows - 1), np.maximum(cell_top + self.cell_height - y, 0) / vy, np.inf)))
+
+    def _collide_disks(self, index: int, other: int) -> None:
+        delta_x, delta_y = self.x[other] - self.x[index], self.y[other] - self.y[index]
+        delta_vx, delta_vy = self.vx[other] - self.vx[index], self.vy[other] - self.vy[index]
+        distance = sqrt(delta_x * delta_x + delta_y * delta_y)
+        if distance == 0:
+            return
+
+        # impulse along the line of centres for a perfectly elastic collision
+        mass, other_mass = self.masses[index], self.masses[other]
+        impulse = 2 * mass * other_mass * (delta_vx * delta_x + delta_vy * delta_y) / ((mass + other_mass) * distance)
+        impulse_x, impulse_y = impulse * delta_x / distance, impulse * delta_y / distance
+        self.vx[index] += impulse_x / mass
+        self.vy[index] += impulse_y / mass
+        self.vx[other] -= impulse_x / other_mass
+        self.vy[other] -= impulse_y / other_mass
+
+    def _collide_wall(self, index: int, wall: int) -> float:
+        mass = self.masses[index]
+        if wall == WALL_RIGHT:
+            # the particle bounces off the cap in the frame of the cap, so a moving cap changes its speed
+            vx = self.vx[index]
+            self.vx[index] = 2 * self.cap_velocity - vx
+            self.piston_work += 0.5 * mass * (self.vx[index] ** 2 - vx ** 2)
+            return mass * abs(self.vx[index] - vx)
+
+        velocities = self.vx if wall == WALL_LEFT else self.vy
+        momentum_change = 2 * mass * abs(velocities[index])
+        velocities[index] = -velocities[index]
+        return momentum_change
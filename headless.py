@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Union, List
+import numpy as np
+
+# pygame greets on stdout when imported, which would end up in front of the JSON observables
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from settings import *
+from closed_system import Closed_System
+from protocol import Protocol_Runner, load_protocol
+
+class Headless_Runner:
+    """ Steps one or more closed systems as fast as possible, without a window, UI manager or text rendering. """
+    def __init__(self, number_of_systems: int = 1, number_of_particles: int = NUMBER_OF_PARTICLES, temperature: Union[float, int] = 800,
+                 volume_meters: float = 10, min_volume_meters: float = 1.5, max_volume_meters: float = 10,
+                 broad_phase: str = BROAD_PHASE, integrator: str = INTEGRATOR, thermostat: Union[str, None] = THERMOSTAT,
+                 max_substeps: Union[int, None] = MAX_SUBSTEPS, compact_particles: bool = COMPACT_PARTICLES,
+                 memory_budget: Union[int, None] = PARTICLE_MEMORY_BUDGET) -> None:
+
+        self.systems: List[Closed_System] = []
+        for _ in range(number_of_systems):
+            system = Closed_System((0,0), closed_system_start_temperature=temperature, container_start_volume_meters=volume_meters,
+                                   container_min_volume_meters=min_volume_meters, container_max_volume_meters=max(max_volume_meters, volume_meters),
+                                   broad_phase=broad_phase, integrator=integrator, headless=True, thermostat=thermostat,
+                                   max_substeps=max_substeps, compact_particles=compact_particles, memory_budget=memory_budget)
+            system.add_particles(number_of_particles=number_of_particles)
+            self.systems.append(system)
+
+        self.steps: int = 0
+        self.simulated_time: float = 0.0
+        self.wall_time: float = 0.0
+
+        self.distribution_file = None
+        self.distribution_dump_every: int = 0
+
+    def start_distribution_dumps(self, path: str, every_steps: int) -> None:
+        """ Appends the speed distribution of every system to a JSON lines file every every_steps steps. """
+        self.stop_distribution_dumps()
+        self.distribution_file = open(path, "w")
+        self.distribution_dump_every = max(1, every_steps)
+
+    def stop_distribution_dumps(self) -> None:
+        if self.distribution_file is None:
+            return
+        self.distribution_file.close()
+        self.distribution_file = None
+
+    def dump_distributions(self) -> None:
+        for index, system in enumerate(self.systems):
+            line = {"step": self.steps, "simulated_time": self.simulated_time, "system": index, **system.speed_distribution.as_dict()}
+            self.distribution_file.write(json.dumps(line) + "\n")
+
+    def step(self, dt: float) -> None:
+        for system in self.systems:
+            system.update(dt)
+        self.steps += 1
+        self.simulated_time += dt
+
+        if self.distribution_file is not None and self.steps % self.distribution_dump_every == 0:
+            self.dump_distributions()
+
+    def run(self, dt: float, steps: Union[int, None] = None, simulated_time: Union[float, None] = None) -> None:
+        """ Runs for a number of steps, or until the given amount of simulated time has passed. """
+        if steps is None:
+            steps = int(np.ceil(simulated_time / dt)) if simulated_time is not None else 1
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            self.step(dt)
+        self.wall_time += time.perf_counter() - start
+
+    def observables(self) -> dict:
+        systems = []
+        for system in self.systems:
+            speeds = np.sqrt(np.einsum("ij,ij->i", system.particles.velocities, system.particles.velocities))
+            systems.append({
+                "particles": len(system.particles),
+                "temperature": system.temperature,
+                "volume": system.volume,
+                "accurate_pressure": float(system.accurate_pressure),
+                "measured_pressure": system.measured_pressure,
+                "measured_pressure_windowed": system.measured_pressure_windowed,
+                "ideal_pressure": system.ideal_pressure,
+                "piston_work": system.piston_work,
+                "mean_speed": float(speeds.mean()) if len(speeds) else 0.0,
+                "kinetic_temperature": system.speed_distribution.kinetic_temperature,
+                "speed_kurtosis": system.speed_distribution.kurtosis,
+                "mean_substeps": system.substep_controller.mean_substeps if system.substep_controller is not None else 1.0,
+                "capped_steps": system.substep_controller.capped_steps if system.substep_controller is not None else 0,
+                "memory": system.get_memory_footprint(),
+                "species": [{"name": species.name, "particles": int(count), "temperature": float(temperature), "partial_pressure": float(pressure)}
+                            for species, count, temperature, pressure in zip(system.species, np.bincount(system.particles.species, minlength=len(system.species)),
+                                                                             system.species_temperatures, system.partial_pressures)],
+            })
+
+        return {
+            "steps": self.steps,
+            "simulated_time": self.simulated_time,
+            "wall_time": self.wall_time,
+            "steps_per_second": self.steps / self.wall_time if self.wall_time > 0 else None,
+            "systems": systems,
+        }
+
+def main(argv: Union[List[str], None] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the ideal gas simulation without a display.")
+    parser.add_argument("--systems", type=int, default=1, help="number of independent closed systems")
+    parser.add_argument("--particles", type=int, default=NUMBER_OF_PARTICLES, help="particles per system")
+    parser.add_argument("--temperature", type=float, default=800, help="start temperature in kelvin")
+    parser.add_argument("--volume", type=float, default=10, help="container volume in meters")
+    parser.add_argument("--dt", type=float, default=1 / TARGET_FPS, help="simulated seconds per step")
+    parser.add_argument("--steps", type=int, default=None, help="number of steps to run")
+    parser.add_argument("--time", type=float, default=None, help="simulated seconds to run (used when --steps is not given)")
+    parser.add_argument("--broad-phase", default=BROAD_PHASE, choices=["spatial_hash", "brute_force"])
+    parser.add_argument("--integrator", default=INTEGRATOR, choices=["time_step", "event_driven"])
+    parser.add_argument("--thermostat", default=THERMOSTAT, choices=["instant", "berendsen", "andersen"], help="thermostat holding the start temperature")
+    parser.add_argument("--max-substeps", type=int, default=MAX_SUBSTEPS, help="most substeps per step for fast particles (1 for a fixed step)")
+    parser.add_argument("--compact", action="store_true", default=COMPACT_PARTICLES, help="store positions and velocities in single precision")
+    parser.add_argument("--memory-budget", type=float, default=None, help="most MiB of particle and scratch buffers per system, adding more particles fails")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the random number generator")
+    parser.add_argument("--output", default=None, help="write the observables to this JSON file instead of stdout")
+    parser.add_argument("--dump-distributions", default=None, help="append the speed distributions to this JSON lines file while running")
+    parser.add_argument("--dump-every", type=int, default=60, help="steps between two speed distribution dumps")
+    parser.add_argument("--protocol", default=None, help="run the schedule of volume, temperature, add_species, add_particles and pause steps in this JSON file instead of --steps or --time")
+    parser.add_argument("--protocol-log", default=None, help="write the observables logged while running the protocol to this CSV file")
+    parser.add_argument("--log-interval", type=float, default=PROTOCOL_LOG_INTERVAL, help="simulated seconds between two rows of the protocol log")
+    arguments = parser.parse_args(argv)
+
+    if arguments.seed is not None:
+        np.random.seed(arguments.seed)
+
+    # particles past the memory budget or that do not fit in the container are reported like a bad argument
+    try:
+        runner = Headless_Runner(number_of_systems=arguments.systems, number_of_particles=arguments.particles, temperature=arguments.temperature,
+                                 volume_meters=arguments.volume, broad_phase=arguments.broad_phase, integrator=arguments.integrator,
+                                 thermostat=arguments.thermostat, max_substeps=arguments.max_substeps, compact_particles=arguments.compact,
+                                 memory_budget=int(arguments.memory_budget * 2**20) if arguments.memory_budget is not None else PARTICLE_MEMORY_BUDGET)
+    except ValueError as error:
+        parser.error(str(error))
+    if arguments.dump_distributions is not None:
+        runner.start_distribution_dumps(arguments.dump_distributions, arguments.dump_every)
+    if arguments.protocol is not None:
+        try:
+            protocol = load_protocol(arguments.protocol)
+        except ValueError as error:
+            parser.error(str(error))
+        protocol_runner = Protocol_Runner(runner, protocol, arguments.dt, arguments.log_interval)
+        if arguments.protocol_log is not None:
+            protocol_runner.start_log(arguments.protocol_log)
+        try:
+            protocol_runner.run()
+        except ValueError as error:
+            # e.g. an add_particles step past the memory budget
+            parser.error(str(error))
+        finally:
+            protocol_runner.stop_log()
+    else:
+        runner.run(arguments.dt, steps=arguments.steps, simulated_time=arguments.time)
+    runner.stop_distribution_dumps()
+
+    observables = json.dumps(runner.observables(), indent=4)
+    if arguments.output is None:
+        sys.stdout.write(observables + "\n")
+    else:
+        with open(arguments.output, "w") as file:
+            file.write(observables + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,9 @@ from simulation import Simulation
 
 class Main:
     def __init__(self) -> None:
-        pygame.init()
+        # only the modules the simulation uses, initialising all of pygame (audio, joysticks, ...) slows every launch
+        pygame.display.init()
+        pygame.font.init()
         self.display_width, self.display_height = DISPLAY_WIDTH, DISPLAY_HEIGHT
         self.display = pygame.display.set_mode((self.display_width, self.display_height))#, pygame.FULLSCREEN)
         pygame.display.set_caption("Ideal Gas Simulation")
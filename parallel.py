@@ -0,0 +1,244 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import pygame
+from typing import Union, Dict
+import numpy as np
+
+from settings import *
+from particle_store import Particle_Store, buffer_layout
+from checkpoint import save_arrays, load_arrays, get_random_state, set_random_state
+
+# slots of the float64 header at the start of every shared block
+HEADER_COUNT = 0
+HEADER_TEMPERATURE = 1
+HEADER_PREVIOUS_TEMPERATURE = 2
+HEADER_VOLUME = 3
+HEADER_MEASURED_PRESSURE = 4
+HEADER_MEASURED_PRESSURE_WINDOWED = 5
+HEADER_IDEAL_PRESSURE = 6
+HEADER_ACCURATE_PRESSURE = 7
+HEADER_SIZE = 8
+
+class Shared_System_State:
+    """ One shared memory block holding a header and the particle arrays of a closed system. """
+    def __init__(self, capacity: int, name: Union[str, None] = None, compact: bool = False) -> None:
+        self.capacity: int = capacity
+        layout = buffer_layout(compact)
+
+        offsets = []
+        size = HEADER_SIZE * np.dtype(np.float64).itemsize
+        for _, shape, dtype in layout:
+            size += -size % np.dtype(dtype).itemsize
+            offsets.append(size)
+            size += capacity * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+
+        self.owner: bool = name is None
+        # spawned workers share the resource tracker of the creating process, which unlinks the block in close()
+        self.shared_memory = shared_memory.SharedMemory(name=name, create=self.owner, size=max(size, 1))
+
+        self.header: np.ndarray = np.ndarray((HEADER_SIZE,), dtype=np.float64, buffer=self.shared_memory.buf)
+        self.buffers: Dict[str, np.ndarray] = {name: np.ndarray((capacity,) + shape, dtype=dtype, buffer=self.shared_memory.buf, offset=offset)
+                                               for (name, shape, dtype), offset in zip(layout, offsets)}
+
+    @property
+    def name(self) -> str:
+        return self.shared_memory.name
+
+    def close(self) -> None:
+        self.header = None
+        self.buffers = {}
+        try:
+            self.shared_memory.close()
+        except BufferError:
+            # numpy views of the block are still alive somewhere, the mapping then goes away with the process
+            pass
+        if self.owner:
+            self.shared_memory.unlink()
+
+def _publish(system, header: np.ndarray) -> None:
+    """ Copies the scalars of a system into its shared header. """
+    header[HEADER_COUNT] = len(system.particles)
+    header[HEADER_TEMPERATURE] = system.temperature
+    header[HEADER_PREVIOUS_TEMPERATURE] = system.previous_temperature
+    header[HEADER_VOLUME] = system.volume
+    header[HEADER_MEASURED_PRESSURE] = system.measured_pressure
+    header[HEADER_MEASURED_PRESSURE_WINDOWED] = system.measured_pressure_windowed
+    header[HEADER_IDEAL_PRESSURE] = system.ideal_pressure
+    header[HEADER_ACCURATE_PRESSURE] = float(system.accurate_pressure)
+
+def _read_published(system, header: np.ndarray) -> None:
+    """ Copies the scalars of a published header into a system. """
+    system.particles.count = int(header[HEADER_COUNT])
+    # temperatures go back to ints when they were ints, so the labels read the same as for a local system
+    temperature, previous_temperature = float(header[HEADER_TEMPERATURE]), float(header[HEADER_PREVIOUS_TEMPERATURE])
+    system.temperature = int(temperature) if temperature.is_integer() else temperature
+    system.previous_temperature = int(previous_temperature) if previous_temperature.is_integer() else previous_temperature
+    system.volume = round(float(header[HEADER_VOLUME]), 2)
+    system.measured_pressure = float(header[HEADER_MEASURED_PRESSURE])
+    system.measured_pressure_windowed = float(header[HEADER_MEASURED_PRESSURE_WINDOWED])
+    system.ideal_pressure = float(header[HEADER_IDEAL_PRESSURE])
+    system.accurate_pressure = f"{header[HEADER_ACCURATE_PRESSURE]:.{2}e}"
+
+def _worker_main(shared_name: str, capacity: int, system_arguments: dict, commands: multiprocessing.Queue, replies: multiprocessing.Queue) -> None:
+    """ Runs the physics of one closed system. Its particle arrays live directly in the shared block. """
+    from closed_system import Closed_System
+
+    shared_state = Shared_System_State(capacity, name=shared_name, compact=system_arguments.get("compact_particles", COMPACT_PARTICLES))
+    system = Closed_System(**system_arguments, headless=True, particle_store=Particle_Store(buffers=shared_state.buffers))
+    _publish(system, shared_state.header)
+
+    while True:
+        command, arguments = commands.get()
+
+        if command == "step":
+            dt, update_particles_movement, cap_x = arguments
+            system.container.set_cap_position(cap_x)
+            system.update(dt, update_particles_movement=update_particles_movement)
+        elif command == "add_particles":
+            system.add_particles(*arguments)
+        elif command == "add_species":
+            system.add_species(*arguments)
+        elif command == "set_temperature":
+            system.set_temperature(*arguments)
+        elif command == "adjust_temperature":
+            system.adjust_temperature(*arguments)
+        elif command == "restore":
+            # the particle arrays were already written to the shared block by the main process
+            count, values, species = arguments
+            system.particles.count = count
+            system.set_checkpoint_values(values)
+            system.set_species_table(species)
+
+        _publish(system, shared_state.header)
+        replies.put(command)
+
+        if command == "stop":
+            break
+
+class Remote_Closed_System:
+    """ Stand-in for a Closed_System whose physics runs in a worker process.
+
+    The worker writes the particle arrays straight into shared memory. This process only polls the mouse for the cap,
+    reads the shared arrays to render, and sends control changes (temperature, cap position, pause and frame skip).
+    update() only starts a step, so several systems step in parallel until render() waits for the result.
+    """
+    def __init__(self, closed_system_render_position: Union[list, tuple], capacity: int = WORKER_PARTICLE_CAPACITY, **system_arguments) -> None:
+        from closed_system import Closed_System
+
+        self.shared_state: Shared_System_State = Shared_System_State(capacity, compact=system_arguments.get("compact_particles", COMPACT_PARTICLES))
+
+        system_arguments["closed_system_render_position"] = closed_system_render_position
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.replies = context.Queue()
+        self.process = context.Process(target=_worker_main, args=(self.shared_state.name, capacity, system_arguments, self.commands, self.replies), daemon=True)
+        self.process.start()
+
+        # local copy for the mouse, the container and the labels, reading its particles from the shared arrays
+        self.local_system: Closed_System = Closed_System(**system_arguments, particle_store=Particle_Store(buffers=self.shared_state.buffers))
+        self.pending_replies: int = 0
+        self.last_step: tuple = (0, False)
+
+    # the attributes the simulation reads from a system
+    @property
+    def closed_system_render_position(self) -> Union[list, tuple]:
+        return self.local_system.closed_system_render_position
+
+    @property
+    def container(self):
+        return self.local_system.container
+
+    @property
+    def particles(self) -> Particle_Store:
+        return self.local_system.particles
+
+    @property
+    def temperature(self) -> Union[float, int]:
+        return self.local_system.temperature
+
+    def _send(self, command: str, *arguments) -> None:
+        self.commands.put((command, arguments))
+        self.pending_replies += 1
+
+    def wait(self) -> None:
+        """ Waits until the worker has handled every command sent so far, then reads its published state. """
+        while self.pending_replies > 0:
+            self.replies.get()
+            self.pending_replies -= 1
+
+        _read_published(self.local_system, self.shared_state.header)
+
+    def add_species(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255)) -> int:
+        # the local copy keeps the same table, for checkpoints and the species names
+        index = self.local_system.add_species(name, mass, radius, color)
+        self._send("add_species", name, mass, radius, color)
+        self.wait()
+        return index
+
+    def add_particles(self, number_of_particles: int = 10, color = None, tracer: bool = False, species: Union[int, str] = 0) -> None:
+        self._send("add_particles", number_of_particles, color, tracer, species)
+        self.wait()
+
+    def set_temperature(self, new_temperature: Union[float, int]) -> None:
+        # the simulation re-applies the entry line value every frame, so skip the round trip when nothing changes
+        if max(0, min(new_temperature, MAX_TEMPERATURE)) == self.temperature:
+            return
+        self._send("set_temperature", new_temperature)
+        self.wait()
+
+    def adjust_temperature(self, temperature_adjustment: Union[float, int]) -> None:
+        self._send("adjust_temperature", temperature_adjustment)
+        self.wait()
+
+    def start_recording(self, path: str, capacity: Union[int, None] = None) -> None:
+        """ Records the shared arrays after every step. Frames are written from this process, the worker does not wait on the disk. """
+        self.local_system.start_recording(path, capacity)
+
+    def stop_recording(self) -> None:
+        self.local_system.stop_recording()
+
+    def get_checkpoint_state(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        self.wait()
+        return self.local_system.get_checkpoint_state(prefix)
+
+    def set_checkpoint_state(self, state: Dict[str, np.ndarray], prefix: str = "") -> None:
+        """ Writes the particle arrays straight into the shared block, then tells the worker to pick them up. """
+        self.wait()
+        self.local_system.set_checkpoint_state(state, prefix)
+        self._send("restore", len(self.local_system.particles), self.local_system.get_checkpoint_values(), self.local_system.species)
+        self.wait()
+
+    def save_checkpoint(self, path: str) -> None:
+        save_arrays(path, {**self.get_checkpoint_state(), **get_random_state()})
+
+    def load_checkpoint(self, path: str) -> None:
+        state = load_arrays(path)
+        self.set_checkpoint_state(state)
+        set_random_state(state)
+
+    def update(self, dt: float, update_particles_movement: bool = True) -> None:
+        self.last_step = (dt, update_particles_movement)
+        self.local_system.container.update()
+        # the exact cap position, the hitbox is rounded to whole pixels and would make the piston move in jumps
+        self._send("step", dt, update_particles_movement, self.local_system.container.cap_x)
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        self.wait()
+        # the worker does not send its speed distribution, it is kept here from the shared velocities
+        dt, update_particles_movement = self.last_step
+        if update_particles_movement:
+            self.local_system.speed_distribution.update(self.local_system.particles.velocities, self.local_system.particles.masses)
+        if self.local_system.recorder is not None:
+            self.local_system.recorder.record(self.local_system, dt if update_particles_movement else 0)
+        if not self.local_system.headless:
+            self.local_system.update_ui()
+        self.local_system.render(render_surface)
+
+    def close(self) -> None:
+        self.stop_recording()
+        if self.process.is_alive():
+            self._send("stop")
+            self.wait()
+            self.process.join()
+        self.local_system = None
+        self.shared_state.close()
@@ -13,11 +13,8 @@ class Particle:
 
         self.color: Union[list, tuple] = color
 
-        self.image = pygame.Surface((radius * 2, radius * 2))
-        pygame.draw.circle(self.image, self.color, (self.radius, self.radius), self.radius)
-        self.image.set_colorkey((0,0,0))
-
-        self.rect: pygame.Rect = self.image.get_rect(center = self.position)
+        self.rect: pygame.Rect = pygame.Rect(0, 0, self.radius * 2, self.radius * 2)
+        self.rect.center = self.position
 
     def render(self, render_surface: pygame.Surface) -> None:
         pygame.draw.circle(render_surface, self.color, self.rect.center, self.radius)
@@ -0,0 +1,106 @@
+import pygame
+from typing import Union, Dict, List, Tuple
+import numpy as np
+
+from settings import *
+from particle_store import COLOR_LUT, squared_speed_buckets
+
+class Particle_Renderer:
+    """ Draws particles by blitting one pre-rendered sprite per color bucket, all in a single Surface.blits call. """
+    def __init__(self, color_lut: np.ndarray = COLOR_LUT) -> None:
+        self.color_lut: np.ndarray = color_lut
+        self.sprites: Dict[int, List[pygame.Surface]] = {}
+
+    def _create_sprites(self, radius: int) -> List[pygame.Surface]:
+        """ Renders one circle per color bucket for the given radius. """
+        sprites = []
+        for color in self.color_lut.tolist():
+            sprite = pygame.Surface((radius * 2, radius * 2))
+            # the color key only has to differ from every color in the table
+            colorkey = (255, 255, 255)
+            sprite.fill(colorkey)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            sprite.set_colorkey(colorkey, pygame.RLEACCEL)
+            sprites.append(sprite)
+        return sprites
+
+    def get_sprites(self, radius: int) -> List[pygame.Surface]:
+        if radius not in self.sprites:
+            self.sprites[radius] = self._create_sprites(radius)
+        return self.sprites[radius]
+
+    def render(self, render_surface: pygame.Surface, positions: np.ndarray, radii: np.ndarray, color_buckets: np.ndarray) -> None:
+        if len(positions) == 0:
+            return
+
+        integer_radii = radii.astype(np.int64)
+        top_lefts = positions.astype(np.int64) - integer_radii[:, None]
+
+        # particles are grouped by radius, which is a single group unless radii differ
+        unique_radii = np.unique(integer_radii)
+        for radius in unique_radii.tolist():
+            if radius <= 0:
+                continue
+            sprites = self.get_sprites(radius)
+            selected = slice(None) if len(unique_radii) == 1 else integer_radii == radius
+            render_surface.blits(zip(map(sprites.__getitem__, color_buckets[selected].tolist()), top_lefts[selected].tolist()), doreturn=False)
+
+class Density_Field_Renderer:
+    """ Draws the particles as a grid of cells instead of one by one, for particle counts too large to draw individually.
+
+    One binning pass over an evenly strided sample of at most sample_size particles sums the particles, their covered area and
+    their squared speeds per cell. Every cell gets the color of its RMS speed on the particle color scale, faded toward the
+    background the emptier it is. The grid is uploaded with surfarray and scaled up onto the field, so the cost depends on
+    the size of the field and not on the number of particles.
+    """
+    def __init__(self, cell_size: int = LOD_CELL_SIZE, full_packing_fraction: float = LOD_FULL_PACKING_FRACTION, sample_size: int = LOD_SAMPLE_SIZE,
+                 color_lut: np.ndarray = COLOR_LUT) -> None:
+        self.cell_size: int = max(1, cell_size)
+        self.sample_size: int = max(1, sample_size)
+        self.full_packing_fraction: float = full_packing_fraction
+        self.color_lut: np.ndarray = color_lut.astype(np.float32)
+
+        # reused while the grid and field sizes stay the same
+        self.grid_surface: Union[pygame.Surface, None] = None
+        self.field_surface: Union[pygame.Surface, None] = None
+
+    def _get_surfaces(self, grid_size: Tuple[int, int], field_size: Tuple[int, int]) -> Tuple[pygame.Surface, pygame.Surface]:
+        if self.grid_surface is None or self.grid_surface.get_size() != grid_size:
+            self.grid_surface = pygame.Surface(grid_size)
+        if self.field_surface is None or self.field_surface.get_size() != field_size:
+            self.field_surface = pygame.Surface(field_size)
+        return self.grid_surface, self.field_surface
+
+    def render(self, render_surface: pygame.Surface, positions: np.ndarray, velocities: np.ndarray, radii: np.ndarray,
+               field_rect: pygame.Rect, background_color: Union[list, tuple] = (255,255,255)) -> None:
+        # only the visible part of the field is drawn
+        field_rect = field_rect.clip(render_surface.get_rect())
+        if field_rect.width <= 0 or field_rect.height <= 0:
+            return
+
+        columns = max(1, field_rect.width // self.cell_size)
+        rows = max(1, field_rect.height // self.cell_size)
+        cell_size = np.array((field_rect.width / columns, field_rect.height / rows))
+
+        # an evenly strided sample of at most sample_size particles stands in for all of them
+        stride = max(1, -(-len(positions) // self.sample_size))
+        positions, velocities, radii = positions[::stride], velocities[::stride], radii[::stride]
+
+        cell_indices = np.floor((positions - field_rect.topleft) / cell_size).astype(np.int64)
+        inside = (cell_indices[:, 0] >= 0) & (cell_indices[:, 0] < columns) & (cell_indices[:, 1] >= 0) & (cell_indices[:, 1] < rows)
+        # column major, the layout of a surfarray, with one extra cell collecting the particles outside the field
+        cells = np.where(inside, cell_indices[:, 0] * rows + cell_indices[:, 1], columns * rows)
+
+        counts = np.bincount(cells, minlength=columns * rows + 1)[:-1]
+        speeds_squared = np.bincount(cells, weights=np.einsum("ij,ij->i", velocities, velocities), minlength=columns * rows + 1)[:-1]
+        covered_areas = np.bincount(cells, weights=radii ** 2, minlength=columns * rows + 1)[:-1] * (np.pi * stride)
+
+        colors = self.color_lut[squared_speed_buckets(speeds_squared / np.maximum(counts, 1))]
+        opacities = np.minimum(covered_areas / (cell_size[0] * cell_size[1] * self.full_packing_fraction), 1).astype(np.float32)
+        background = np.asarray(background_color[:3], dtype=np.float32)
+        pixels = background + (colors - background) * opacities[:, None]
+
+        grid_surface, field_surface = self._get_surfaces((columns, rows), field_rect.size)
+        pygame.surfarray.blit_array(grid_surface, pixels.astype(np.uint8).reshape(columns, rows, 3))
+        pygame.transform.scale(grid_surface, field_rect.size, field_surface)
+        render_surface.blit(field_surface, field_rect)
@@ -0,0 +1,474 @@
+import pygame
+from pygame import Vector2 as vector
+from typing import Union, Iterator, Tuple, Dict
+import numpy as np
+
+from settings import *
+
+# order of the per-wall arrays returned by the wall collision code
+WALLS = ("left", "right", "top", "bottom")
+
+# (name, per-particle shape, dtype) of every array in a Particle_Store
+BUFFER_LAYOUT = (
+    ("positions", (2,), np.float64),
+    ("velocities", (2,), np.float64),
+    ("masses", (), np.float64),
+    ("radii", (), np.float64),
+    ("color_buckets", (), np.uint8),
+    ("tracers", (), np.bool_),
+    ("species", (), np.uint8),
+)
+
+# the compact layout keeps positions and velocities in single precision, 35 instead of 51 bytes per particle
+COMPACT_BUFFER_LAYOUT = tuple((name, shape, np.float32 if name in ("positions", "velocities") else dtype) for name, shape, dtype in BUFFER_LAYOUT)
+
+def buffer_layout(compact: bool = False) -> tuple:
+    return COMPACT_BUFFER_LAYOUT if compact else BUFFER_LAYOUT
+
+def allocate_buffers(capacity: int, compact: bool = False) -> Dict[str, np.ndarray]:
+    """ Returns zeroed arrays laid out like BUFFER_LAYOUT (or COMPACT_BUFFER_LAYOUT) for capacity particles. """
+    return {name: np.zeros((capacity,) + shape, dtype=dtype) for name, shape, dtype in buffer_layout(compact)}
+
+def bytes_per_particle(compact: bool = False) -> int:
+    """ Bytes a particle takes in a Particle_Store, its arrays and its share of the scratch buffers. """
+    float_size = np.dtype(np.float32 if compact else np.float64).itemsize
+    buffers = sum(int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize for _, shape, dtype in buffer_layout(compact))
+    # two vectors of floats, two masks and an index, see Particle_Store._allocate_scratch
+    return buffers + 4 * float_size + 2 + np.dtype(np.intp).itemsize
+
+class Scratch_Buffers:
+    """ Scratch arrays for a number of items that changes from step to step, like the pairs of the broad phase. They are
+    laid out like BUFFER_LAYOUT and grow geometrically, so they are only allocated again when more items than ever before
+    are asked for or the layout changes. """
+    def __init__(self) -> None:
+        self.capacity: int = 0
+        self.layout: tuple = ()
+        self.buffers: Dict[str, np.ndarray] = {}
+
+    def get(self, length: int, layout: tuple) -> Dict[str, np.ndarray]:
+        """ Returns the arrays of layout for length items. Their contents are left from earlier uses. """
+        if length > self.capacity or layout != self.layout:
+            self.capacity = max(length, 2 * self.capacity) if length > self.capacity else self.capacity
+            self.layout = layout
+            self.buffers = {name: np.empty((self.capacity,) + shape, dtype=dtype) for name, shape, dtype in layout}
+        return {name: buffer[:length] for name, buffer in self.buffers.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+def build_color_lut(buckets: int = COLOR_BUCKETS, start_color: Union[list, tuple] = (0, 0, 255), end_color: Union[list, tuple] = (255, 0, 0)) -> np.ndarray:
+    """ Returns a (buckets, 3) uint8 table going from blue to red, the same scale as Particle.color_lerping. """
+    proportions = np.linspace(0, 1, buckets)[:, None]
+    start_color = np.asarray(start_color, dtype=np.float64)
+    end_color = np.asarray(end_color, dtype=np.float64)
+    return (start_color + (end_color - start_color) * proportions).astype(np.uint8)
+
+COLOR_LUT = build_color_lut()
+
+# squared speeds where the color buckets change, so bucketing needs no square root
+_COLOR_BUCKET_EDGES_SQUARED = (np.arange(1, COLOR_BUCKETS) / (COLOR_BUCKETS - 1) * COLOR_SCALE_MAX_SPEED) ** 2
+
+def speed_buckets(velocities: np.ndarray) -> np.ndarray:
+    """ Returns the color bucket (index into COLOR_LUT) of every velocity in one vectorized pass. """
+    return squared_speed_buckets(np.einsum("ij,ij->i", velocities, velocities))
+
+def squared_speed_buckets(speeds_squared: np.ndarray) -> np.ndarray:
+    """ Returns the color bucket (index into COLOR_LUT) of every squared speed. """
+    return np.searchsorted(_COLOR_BUCKET_EDGES_SQUARED, speeds_squared, side="right").astype(np.uint8)
+
+def nearest_color_bucket(color: Union[list, tuple]) -> int:
+    """ Returns the bucket whose color in COLOR_LUT is closest to the given color. """
+    differences = COLOR_LUT.astype(np.int64) - np.asarray(color[:3], dtype=np.int64)
+    return int(np.argmin(np.einsum("ij,ij->i", differences, differences)))
+
+class Particle_View:
+    """ A thin view of one particle inside a Particle_Store, exposing the same attributes as Particle. """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "Particle_Store", index: int) -> None:
+        self.store: Particle_Store = store
+        self.index: int = index
+
+    @property
+    def position(self) -> vector:
+        return vector(*self.store.positions[self.index])
+
+    @position.setter
+    def position(self, value: Union[vector, list, tuple]) -> None:
+        self.store.positions[self.index] = tuple(value)
+
+    @property
+    def velocity(self) -> vector:
+        return vector(*self.store.velocities[self.index])
+
+    @velocity.setter
+    def velocity(self, value: Union[vector, list, tuple]) -> None:
+        self.store.velocities[self.index] = tuple(value)
+
+    @property
+    def mass(self) -> float:
+        return float(self.store.masses[self.index])
+
+    @property
+    def radius(self) -> int:
+        return int(self.store.radii[self.index])
+
+    @property
+    def color(self) -> tuple:
+        return tuple(int(channel) for channel in COLOR_LUT[self.store.color_buckets[self.index]])
+
+    @property
+    def rect(self) -> pygame.Rect:
+        rect = pygame.Rect(0, 0, self.radius * 2, self.radius * 2)
+        rect.center = self.position
+        return rect
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        pygame.draw.circle(render_surface, self.color, self.rect.center, self.radius)
+
+class Particle_Store:
+    """ Structure-of-arrays storage for the particles of a closed system.
+
+    A compact store keeps positions and velocities in single precision. The per-particle passes of every step (moving,
+    the walls, the cap and the colors) work in scratch buffers sized for the capacity, so they allocate nothing while the
+    capacity stays put, and the collisions in scratch buffers that grow with the number of pairs. max_capacity caps the
+    growth of the arrays, e.g. to keep a system in a memory budget.
+    """
+
+    # pairs still unresolved after this many rounds stay overlapping and are picked up again next step
+    MAX_COLLISION_ROUNDS = 16
+
+    def __init__(self, capacity: int = 0, buffers: Union[Dict[str, np.ndarray], None] = None, compact: bool = False,
+                 max_capacity: Union[int, None] = None) -> None:
+        """ With buffers (laid out like BUFFER_LAYOUT, e.g. in shared memory) the store uses them as is and cannot grow past them.
+        A store on given buffers is compact when they are. """
+        self.count: int = 0
+        self.fixed_capacity: bool = buffers is not None
+        self.max_capacity: Union[int, None] = max_capacity
+        self._pair_scratch: Scratch_Buffers = Scratch_Buffers()
+
+        if buffers is None:
+            buffers = allocate_buffers(capacity, compact)
+        self.compact: bool = buffers["positions"].dtype == np.float32
+        self._set_buffers(buffers)
+
+    # arrays (views of the live part of the buffers)
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self.count]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self._velocities[:self.count]
+
+    @property
+    def masses(self) -> np.ndarray:
+        return self._masses[:self.count]
+
+    @property
+    def radii(self) -> np.ndarray:
+        return self._radii[:self.count]
+
+    @property
+    def color_buckets(self) -> np.ndarray:
+        return self._color_buckets[:self.count]
+
+    @property
+    def tracers(self) -> np.ndarray:
+        """ Marks the particles followed individually, e.g. drawn on their own by the density field renderer. """
+        return self._tracers[:self.count]
+
+    @property
+    def species(self) -> np.ndarray:
+        """ Index of every particle's species in the species table of its system. """
+        return self._species[:self.count]
+
+    @property
+    def colors(self) -> np.ndarray:
+        """ (N, 3) RGB colors looked up from the color buckets. """
+        return COLOR_LUT[self.color_buckets]
+
+    # sequence protocol, so the store can be used where a list of particles was expected
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> Particle_View:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("particle index out of range")
+        return Particle_View(self, index)
+
+    def __iter__(self) -> Iterator[Particle_View]:
+        for index in range(self.count):
+            yield Particle_View(self, index)
+
+    def _set_buffers(self, buffers: Dict[str, np.ndarray]) -> None:
+        self._positions: np.ndarray = buffers["positions"]
+        self._velocities: np.ndarray = buffers["velocities"]
+        self._masses: np.ndarray = buffers["masses"]
+        self._radii: np.ndarray = buffers["radii"]
+        self._color_buckets: np.ndarray = buffers["color_buckets"]
+        self._tracers: np.ndarray = buffers["tracers"]
+        self._species: np.ndarray = buffers["species"]
+        self.capacity: int = len(self._positions)
+        self._allocate_scratch(0)
+
+    def _scratch(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Scratch vectors, scalars, masks and indices of the live particles. They are allocated for the whole capacity when first
+        used, so stores that are only read, like the snapshots of a physics thread, never allocate them. """
+        if len(self._scratch_vectors) < self.capacity:
+            self._allocate_scratch(self.capacity)
+        return self._scratch_vectors[:self.count], self._scratch_scalars[:, :self.count], self._scratch_masks[:, :self.count], self._scratch_indices[:self.count]
+
+    def _allocate_scratch(self, capacity: int) -> None:
+        dtype = self._positions.dtype
+        self._scratch_vectors: np.ndarray = np.empty((capacity, 2), dtype=dtype)
+        # rows, so every scalar buffer is contiguous
+        self._scratch_scalars: np.ndarray = np.empty((2, capacity), dtype=dtype)
+        self._scratch_masks: np.ndarray = np.empty((2, capacity), dtype=np.bool_)
+        self._scratch_indices: np.ndarray = np.empty(capacity, dtype=np.intp)
+
+    @property
+    def nbytes(self) -> int:
+        """ Bytes of the particle arrays, for their whole capacity. """
+        return sum(buffer.nbytes for buffer in self.get_buffers().values())
+
+    @property
+    def scratch_nbytes(self) -> int:
+        return self._scratch_vectors.nbytes + self._scratch_scalars.nbytes + self._scratch_masks.nbytes + self._scratch_indices.nbytes + self._pair_scratch.nbytes
+
+    def get_buffers(self) -> Dict[str, np.ndarray]:
+        return {"positions": self._positions, "velocities": self._velocities, "masses": self._masses, "radii": self._radii, "color_buckets": self._color_buckets, "tracers": self._tracers, "species": self._species}
+
+    def _reserve(self, capacity: int) -> None:
+        """ Makes sure the buffers can hold at least capacity particles, growing them geometrically. """
+        if capacity <= self.capacity:
+            return
+        if self.fixed_capacity:
+            raise ValueError(f"This particle store is backed by fixed buffers and holds at most {self.capacity} particles")
+        if self.max_capacity is not None and capacity > self.max_capacity:
+            raise ValueError(f"This particle store holds at most {self.max_capacity} particles")
+
+        growth = self.capacity * 2 if self.max_capacity is None else min(self.capacity * 2, self.max_capacity)
+        buffers = allocate_buffers(max(capacity, growth), self.compact)
+        for name, array in self.get_buffers().items():
+            buffers[name][:self.count] = array[:self.count]
+        self._set_buffers(buffers)
+
+    def add(self, positions: np.ndarray, velocities: np.ndarray, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS,
+            color: Union[list, tuple] = (0,0,255), tracer: bool = False, species: int = 0) -> None:
+        """ Appends a batch of particles sharing the same mass, radius, color, tracer flag and species. """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)
+        number_of_particles = len(positions)
+
+        start = self.count
+        end = start + number_of_particles
+        self._reserve(end)
+
+        self._positions[start:end] = positions
+        self._velocities[start:end] = velocities
+        self._masses[start:end] = mass
+        self._radii[start:end] = radius
+        self._color_buckets[start:end] = nearest_color_bucket(color)
+        self._tracers[start:end] = tracer
+        self._species[start:end] = species
+        self.count = end
+
+    def set_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        """ Replaces all particles with copies of the given arrays (named and laid out like BUFFER_LAYOUT). Missing arrays are zeroed. """
+        number_of_particles = len(arrays["positions"])
+        self.count = 0
+        self._reserve(number_of_particles)
+        for name, buffer in self.get_buffers().items():
+            buffer[:number_of_particles] = arrays[name] if name in arrays else 0
+        self.count = number_of_particles
+
+    def move(self, dt: float) -> None:
+        displacements, _, _, _ = self._scratch()
+        np.multiply(self.velocities, dt, out=displacements)
+        positions = self.positions
+        positions += displacements
+
+    def resolve_particle_collisions(self, pairs_i: np.ndarray, pairs_j: np.ndarray, exchange_velocities: bool = True) -> int:
+        """ Pushes the given overlapping pairs apart and applies elastic impulses. Returns the number of pairs resolved. """
+        resolved = 0
+
+        # Resolve the pairs in rounds where no particle appears twice, so every round is an exact set of two-body collisions
+        for _ in range(self.MAX_COLLISION_ROUNDS):
+            if len(pairs_i) == 0:
+                break
+            in_round = self._first_pairs_per_particle(pairs_i, pairs_j)
+            resolved += self._resolve_disjoint_pairs(pairs_i[in_round], pairs_j[in_round], exchange_velocities)
+            pairs_i, pairs_j = pairs_i[~in_round], pairs_j[~in_round]
+
+        return resolved
+
+    def _resolve_disjoint_pairs(self, pairs_i: np.ndarray, pairs_j: np.ndarray, exchange_velocities: bool) -> int:
+        positions = self.positions
+        velocities = self.velocities
+        masses = self.masses
+        radii = self.radii
+
+        # the temporaries keep the dtypes they had as expressions, so a compact store gives the same results
+        float_dtype = positions.dtype
+        scratch = self._pair_scratch.get(len(pairs_i), (("distance_vectors", (2,), float_dtype), ("normals", (2,), float_dtype), ("gathered", (2,), float_dtype),
+                                                        ("impulses", (2,), np.float64), ("shifts", (2,), np.float64), ("distances", (), float_dtype),
+                                                        ("velocities_along_normal", (), float_dtype), ("magnitudes", (), np.float64),
+                                                        ("values_i", (), np.float64), ("values_j", (), np.float64), ("mask", (), np.bool_)))
+        distance_vectors, normals, gathered = scratch["distance_vectors"], scratch["normals"], scratch["gathered"]
+        impulses, shifts, distances, mask = scratch["impulses"], scratch["shifts"], scratch["distances"], scratch["mask"]
+        values_i, values_j, magnitudes = scratch["values_i"], scratch["values_j"], scratch["magnitudes"]
+
+        np.take(positions, pairs_i, axis=0, out=distance_vectors)
+        np.take(positions, pairs_j, axis=0, out=gathered)
+        distance_vectors -= gathered
+        np.einsum("ij,ij->i", distance_vectors, distance_vectors, out=distances)
+        np.sqrt(distances, out=distances)
+        # coincident pairs have no normal, at an infinite distance they are neither moved nor exchange velocities
+        np.equal(distances, 0, out=mask)
+        coincident = int(np.count_nonzero(mask))
+        if coincident:
+            distances[mask] = np.inf
+        np.divide(distance_vectors, distances[:, None], out=normals)
+
+        # Move particles apart so they don't overlap
+        np.take(radii, pairs_i, out=values_i)
+        np.take(radii, pairs_j, out=values_j)
+        values_i += values_j
+        values_i -= distances
+        np.maximum(values_i, 0, out=values_i)
+        values_i /= 2
+        np.multiply(normals, values_i[:, None], out=shifts)
+        # the pairs share no particle, so gathering, shifting and scattering back moves each particle once
+        np.take(positions, pairs_i, axis=0, out=gathered)
+        gathered += shifts
+        positions[pairs_i] = gathered
+        np.take(positions, pairs_j, axis=0, out=gathered)
+        gathered -= shifts
+        positions[pairs_j] = gathered
+
+        # Elastic collision: exchange velocities along the normal of approaching pairs
+        if exchange_velocities:
+            velocities_along_normal = scratch["velocities_along_normal"]
+            np.take(velocities, pairs_i, axis=0, out=distance_vectors)
+            np.take(velocities, pairs_j, axis=0, out=gathered)
+            distance_vectors -= gathered
+            np.einsum("ij,ij->i", distance_vectors, normals, out=velocities_along_normal)
+            np.less(velocities_along_normal, 0, out=mask)
+
+            restitution = 1 # For a perfectly elastic collision
+            np.take(masses, pairs_i, out=values_i)
+            np.take(masses, pairs_j, out=values_j)
+            np.divide(1, values_i, out=magnitudes)
+            np.divide(1, values_j, out=values_j)
+            values_j += magnitudes
+            np.multiply(velocities_along_normal, -(1 + restitution), out=magnitudes)
+            magnitudes /= values_j
+            magnitudes *= mask
+            np.multiply(normals, magnitudes[:, None], out=impulses)
+
+            np.divide(impulses, values_i[:, None], out=shifts)
+            np.take(velocities, pairs_i, axis=0, out=gathered)
+            gathered += shifts
+            velocities[pairs_i] = gathered
+            np.take(masses, pairs_j, out=values_j)
+            np.divide(impulses, values_j[:, None], out=shifts)
+            np.take(velocities, pairs_j, axis=0, out=gathered)
+            gathered -= shifts
+            velocities[pairs_j] = gathered
+
+        return len(pairs_i) - coincident
+
+    def _first_pairs_per_particle(self, pairs_i: np.ndarray, pairs_j: np.ndarray) -> np.ndarray:
+        """ Returns a mask of the pairs that are the first pair of both of their particles. The selected pairs share no particle. """
+        pair_indices = np.arange(len(pairs_i))
+
+        # the smallest pair index of every particle, fancy assignment does not define which of repeated indices wins.
+        # Only the entries of the particles in pairs are reset, the others are never read.
+        _, _, _, first_pair = self._scratch()
+        first_pair[pairs_i] = len(pairs_i)
+        first_pair[pairs_j] = len(pairs_i)
+        np.minimum.at(first_pair, pairs_i, pair_indices)
+        np.minimum.at(first_pair, pairs_j, pair_indices)
+
+        return (first_pair[pairs_i] == pair_indices) & (first_pair[pairs_j] == pair_indices)
+
+    def resolve_wall_collisions(self, container_bounds: dict, groups: Union[np.ndarray, None] = None, number_of_groups: int = 1) -> np.ndarray:
+        """ Reflects particles off the container walls. Returns the momentum transferred to each wall, ordered like WALLS.
+
+        The bounds may be per-particle arrays. With groups (one index per particle) the impulses are summed per group into a (number_of_groups, 4) array.
+        """
+        positions = self.positions
+        velocities = self.velocities
+        masses = self.masses
+        radii = self.radii
+        wall_impulses = np.zeros((number_of_groups, len(WALLS)))
+        _, (low, high), (low_hit, high_hit), _ = self._scratch()
+
+        for axis, low_side, high_side in ((0, "left", "right"), (1, "top", "bottom")):
+            np.add(container_bounds[low_side], radii, out=low)
+            np.subtract(container_bounds[high_side], radii, out=high)
+
+            np.less(positions[:, axis], low, out=low_hit)
+            np.greater(positions[:, axis], high, out=high_hit)
+            if not (low_hit.any() or high_hit.any()):
+                continue
+            # only the particles at a wall are gathered, the rest of the pass runs in the scratch buffers
+            low_hits, high_hits = np.flatnonzero(low_hit), np.flatnonzero(high_hit)
+            hit = np.concatenate((low_hits, high_hits))
+
+            momentum_changes = 2 * masses[hit] * np.abs(velocities[hit, axis])
+            hit_low = np.arange(len(hit)) < len(low_hits)
+            if groups is None:
+                wall_impulses[0, 2 * axis] = momentum_changes[hit_low].sum()
+                wall_impulses[0, 2 * axis + 1] = momentum_changes[~hit_low].sum()
+            else:
+                wall_impulses[:, 2 * axis] = np.bincount(groups[hit], weights=momentum_changes * hit_low, minlength=number_of_groups)
+                wall_impulses[:, 2 * axis + 1] = np.bincount(groups[hit], weights=momentum_changes * ~hit_low, minlength=number_of_groups)
+
+            positions[hit, axis] = np.minimum(np.maximum(positions[hit, axis], low[hit]), high[hit])
+            velocities[hit, axis] *= -1
+
+        return wall_impulses if groups is not None else wall_impulses[0]
+
+    def resolve_piston_collisions(self, piston_x: float, piston_velocity: float) -> Tuple[float, float]:
+        """ Reflects the particles past a right wall at piston_x moving with piston_velocity along x, in the frame of the wall.
+
+        Only the particles past the wall are gathered, so the cost beyond one comparison per particle grows with the particles
+        at the cap rather than with all of them. Returns the momentum transferred to the wall and the work the wall did on the
+        particles (their gain in kinetic energy, in simulation units).
+        """
+        _, (limits, _), (is_past, _), _ = self._scratch()
+        np.subtract(piston_x, self.radii, out=limits)
+        np.greater(self.positions[:, 0], limits, out=is_past)
+        if not is_past.any():
+            return 0.0, 0.0
+        past = np.flatnonzero(is_past)
+
+        x = self.positions[past, 0]
+        vx = self.velocities[past, 0]
+        masses = self.masses[past]
+        limits = limits[past]
+
+        # particles closing in on the wall bounce off it with their speed relative to the wall reversed and are mirrored back inside,
+        # particles the wall only swept over without catching up with them are put back at the wall
+        approaching = vx > piston_velocity
+        new_vx = np.where(approaching, 2 * piston_velocity - vx, vx)
+        self.positions[past, 0] = np.where(approaching, 2 * limits - x, limits)
+        self.velocities[past, 0] = new_vx
+
+        impulse = float(np.sum(masses * np.abs(new_vx - vx)))
+        work = float(0.5 * np.sum(masses * (new_vx ** 2 - vx ** 2)))
+        return impulse, work
+
+    def update_colors(self) -> None:
+        # the bucket edges are evenly spaced in speed, so the bucket is the scaled speed rounded down (see speed_buckets)
+        _, (speeds, _), _, _ = self._scratch()
+        np.einsum("ij,ij->i", self.velocities, self.velocities, out=speeds)
+        np.sqrt(speeds, out=speeds)
+        np.multiply(speeds, (COLOR_BUCKETS - 1) / COLOR_SCALE_MAX_SPEED, out=speeds)
+        np.minimum(speeds, COLOR_BUCKETS - 1, out=speeds)
+        np.copyto(self.color_buckets, speeds, casting="unsafe")
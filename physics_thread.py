@@ -0,0 +1,270 @@
+import queue
+import threading
+import time
+import pygame
+from typing import Union, Dict, List
+import numpy as np
+
+from settings import *
+from particle_store import Particle_Store, allocate_buffers
+from parallel import HEADER_SIZE, _publish, _read_published
+from profiler import Frame_Profiler
+from species import Species_Table
+from checkpoint import save_arrays, load_arrays, get_random_state, set_random_state
+
+class System_Snapshot:
+    """ Copy of the particle arrays, the published scalars and the speed statistics of a system at one step. """
+    def __init__(self, capacity: int = 0) -> None:
+        self.header: np.ndarray = np.zeros(HEADER_SIZE)
+        self.speed_statistics: np.ndarray = np.zeros(0)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int, compact: bool = False) -> None:
+        self.particles: Particle_Store = Particle_Store(buffers=allocate_buffers(capacity, compact))
+
+    def write(self, system) -> None:
+        count = len(system.particles)
+        if count > self.particles.capacity or self.particles.compact != system.particles.compact:
+            # only the physics thread writes, and never to the snapshot being read, so the arrays can be replaced
+            self._allocate(max(count, 2 * self.particles.capacity), system.particles.compact)
+
+        buffers = self.particles.get_buffers()
+        for name, buffer in system.particles.get_buffers().items():
+            buffers[name][:count] = buffer[:count]
+        self.particles.count = count
+        _publish(system, self.header)
+        self.speed_statistics = system.speed_distribution.statistics.copy()
+
+class Snapshot_Buffer:
+    """ Double or triple buffer of System_Snapshots, written by one thread and read by another without locks.
+
+    The writer fills a snapshot that is neither the published one nor the one claimed by the reader, then publishes it
+    by swapping an index. The reader claims the published snapshot and checks it is still the published one, so the
+    writer never touches it while it is read. With two snapshots the writer skips a publish while the reader holds the other one.
+    """
+    def __init__(self, snapshots: int = SNAPSHOT_BUFFERS) -> None:
+        if snapshots not in (2, 3):
+            raise ValueError(f"A snapshot buffer holds 2 or 3 snapshots, not {snapshots}")
+        self.snapshots: List[System_Snapshot] = [System_Snapshot() for _ in range(snapshots)]
+        self.published: Union[int, None] = None
+        self.claimed: Union[int, None] = None
+        self.publishes: int = 0
+        self.skipped_publishes: int = 0
+
+    def publish(self, system) -> bool:
+        """ Writes the system into a free snapshot and publishes it. Returns False when no snapshot was free. """
+        published, claimed = self.published, self.claimed
+        free = [index for index in range(len(self.snapshots)) if index != published and index != claimed]
+        if not free:
+            self.skipped_publishes += 1
+            return False
+
+        self.snapshots[free[0]].write(system)
+        self.published = free[0]
+        self.publishes += 1
+        return True
+
+    def acquire(self) -> Union[System_Snapshot, None]:
+        """ Claims the latest published snapshot for reading, until the next acquire() or release(). Returns None before the first publish. """
+        while True:
+            published = self.published
+            if published is None:
+                return None
+            self.claimed = published
+            # the writer may have published again between the two reads, then the claim moves on to the newer snapshot
+            if self.published == published:
+                return self.snapshots[published]
+
+    def release(self) -> None:
+        self.claimed = None
+
+def _physics_thread_main(system, steps_per_second: float, snapshot_buffer: Snapshot_Buffer, commands: queue.Queue, replies: queue.Queue) -> None:
+    """ Steps a closed system at a fixed rate, handling commands between the steps and publishing a snapshot after each. """
+    step_dt = 1 / steps_per_second
+    update_particles_movement = True
+    moving_steps = 0
+    next_step = time.perf_counter()
+
+    while True:
+        # wait for the next step on the command queue, so commands are handled as soon as they arrive
+        try:
+            command, arguments, reply = commands.get(timeout=max(0.0, next_step - time.perf_counter()))
+        except queue.Empty:
+            command = None
+
+        if command is None:
+            system.update(step_dt, update_particles_movement=update_particles_movement)
+            moving_steps += update_particles_movement
+            snapshot_buffer.publish(system)
+
+            next_step += step_dt
+            # steps missed while the physics ran behind are dropped instead of caught up, so dt stays fixed
+            if time.perf_counter() - next_step > MAX_PHYSICS_LAG_STEPS * step_dt:
+                next_step = time.perf_counter()
+            continue
+
+        if command == "stop":
+            replies.put((True, None))
+            break
+
+        try:
+            if command == "movement":
+                # a frame skip turns the movement on and off again before any step ran, it still moves one step
+                if not arguments[0] and update_particles_movement and moving_steps == 0:
+                    system.update(step_dt, update_particles_movement=True)
+                update_particles_movement = arguments[0]
+                moving_steps = 0
+                result = None
+            elif command == "cap":
+                system.container.set_cap_position(*arguments)
+                result = None
+            else:
+                result = getattr(system, command)(*arguments)
+            succeeded = True
+        except Exception as error:
+            result, succeeded = error, False
+
+        if reply:
+            snapshot_buffer.publish(system)
+            replies.put((succeeded, result))
+        elif not succeeded:
+            raise result
+
+class Threaded_Closed_System:
+    """ Stand-in for a Closed_System whose physics runs on its own thread at a fixed rate.
+
+    The thread steps with a fixed dt of 1 / steps_per_second, whatever the frame rate, and publishes a snapshot of the
+    system after every step into a Snapshot_Buffer. render() draws the latest snapshot without waiting on the physics.
+    Control changes (temperature, cap position, pause and frame skip) go to the thread through a command queue.
+    """
+    def __init__(self, closed_system_render_position: Union[list, tuple], steps_per_second: float = PHYSICS_STEPS_PER_SECOND,
+                 snapshots: int = SNAPSHOT_BUFFERS, **system_arguments) -> None:
+        from closed_system import Closed_System
+
+        system_arguments["closed_system_render_position"] = closed_system_render_position
+        self.physics_system: Closed_System = Closed_System(**system_arguments, headless=True)
+        # the shared frame profiler belongs to the render loop
+        self.physics_system.profiler = Frame_Profiler()
+
+        # local copy for the mouse, the container and the labels, reading its particles from the snapshots
+        self.local_system: Closed_System = Closed_System(**system_arguments)
+        self.temperature_setpoint: Union[float, int] = self.local_system.temperature
+        # the exact cap position, the hitbox is rounded to whole pixels and would make the piston move in jumps
+        self.last_cap_x: float = self.local_system.container.cap_x
+        self.last_update_particles_movement: bool = True
+
+        self.snapshot_buffer: Snapshot_Buffer = Snapshot_Buffer(snapshots)
+        self.snapshot_buffer.publish(self.physics_system)
+        self.commands: queue.Queue = queue.Queue()
+        self.replies: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=_physics_thread_main, args=(self.physics_system, steps_per_second, self.snapshot_buffer, self.commands, self.replies), daemon=True)
+        self.thread.start()
+
+    # the attributes the simulation reads from a system
+    @property
+    def closed_system_render_position(self) -> Union[list, tuple]:
+        return self.local_system.closed_system_render_position
+
+    @property
+    def container(self):
+        return self.local_system.container
+
+    @property
+    def particles(self) -> Particle_Store:
+        return self.local_system.particles
+
+    @property
+    def temperature(self) -> Union[float, int]:
+        # the setpoint is kept here, so it reads back right away while the thread has not applied it yet
+        return self.temperature_setpoint
+
+    def _send(self, command: str, *arguments) -> None:
+        self.commands.put((command, arguments, False))
+
+    def _call(self, command: str, *arguments):
+        """ Runs a method of the physics system on its thread and returns its result, re-raising its exception. """
+        self.commands.put((command, arguments, True))
+        while True:
+            try:
+                succeeded, result = self.replies.get(timeout=0.1)
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    raise RuntimeError("The physics thread of the system has stopped")
+                continue
+            if not succeeded:
+                raise result
+            return result
+
+    def add_species(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255)) -> int:
+        index = self._call("add_species", name, mass, radius, color)
+        self.local_system.add_species(name, mass, radius, color)
+        return index
+
+    def add_particles(self, number_of_particles: int = 10, color = None, tracer: bool = False, species: Union[int, str] = 0) -> None:
+        self._call("add_particles", number_of_particles, color, tracer, species)
+
+    def set_temperature(self, new_temperature: Union[float, int]) -> None:
+        new_temperature = max(0, min(new_temperature, MAX_TEMPERATURE))
+        # the simulation re-applies the entry line value every frame, so only changes are sent
+        if new_temperature == self.temperature_setpoint:
+            return
+        self.temperature_setpoint = new_temperature
+        self._send("set_temperature", new_temperature)
+
+    def adjust_temperature(self, temperature_adjustment: Union[float, int]) -> None:
+        self.set_temperature(max(0, self.temperature_setpoint + temperature_adjustment))
+
+    def start_recording(self, path: str, capacity: Union[int, None] = None) -> None:
+        """ Records every physics step, from the physics thread. """
+        self._call("start_recording", path, capacity)
+
+    def stop_recording(self) -> None:
+        self._call("stop_recording")
+
+    def get_checkpoint_state(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        state = self._call("get_checkpoint_state", prefix)
+        # the arrays are views of the live buffers the thread keeps stepping
+        return {name: array.copy() for name, array in state.items()}
+
+    def set_checkpoint_state(self, state: Dict[str, np.ndarray], prefix: str = "") -> None:
+        self._call("set_checkpoint_state", state, prefix)
+        self.local_system.set_checkpoint_values(state[f"{prefix}system"])
+        self.local_system.set_species_table(Species_Table.from_checkpoint_arrays(state, prefix))
+        self.temperature_setpoint = self.local_system.temperature
+        self.last_cap_x = self.local_system.container.cap_x
+
+    def save_checkpoint(self, path: str) -> None:
+        save_arrays(path, {**self.get_checkpoint_state(), **get_random_state()})
+
+    def load_checkpoint(self, path: str) -> None:
+        state = load_arrays(path)
+        self.set_checkpoint_state(state)
+        set_random_state(state)
+
+    def update(self, dt: float, update_particles_movement: bool = True) -> None:
+        """ Polls the cap and passes control changes to the thread. dt is not used, the thread steps at its own rate. """
+        self.local_system.container.update()
+        cap_x = self.local_system.container.cap_x
+        if cap_x != self.last_cap_x:
+            self.last_cap_x = cap_x
+            self._send("cap", cap_x)
+        if update_particles_movement != self.last_update_particles_movement:
+            self.last_update_particles_movement = update_particles_movement
+            self._send("movement", update_particles_movement)
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        snapshot = self.snapshot_buffer.acquire()
+        self.local_system.particles = snapshot.particles
+        _read_published(self.local_system, snapshot.header)
+        self.local_system.speed_distribution.statistics = snapshot.speed_statistics
+
+        if not self.local_system.headless:
+            self.local_system.update_ui()
+        # the snapshot stays claimed until the next render, so whatever reads the local system in between sees it unchanged
+        self.local_system.render(render_surface)
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.stop_recording()
+            self._call("stop")
+            self.thread.join()
@@ -0,0 +1,157 @@
+from typing import Union, Tuple
+import numpy as np
+
+from settings import *
+
+# densest packing of equal disks, reached by the hexagonal lattice
+HEXAGONAL_PACKING_FRACTION = np.pi / (2 * np.sqrt(3))
+
+def hexagonal_lattice(region: Tuple[float, float, float, float], spacing: float) -> np.ndarray:
+    """ Returns the sites of a hexagonal lattice with the given spacing inside region (left, top, right, bottom), centred in it. """
+    left, top, right, bottom = region
+    width, height = right - left, bottom - top
+    if width < 0 or height < 0:
+        return np.zeros((0, 2))
+
+    row_spacing = spacing * np.sqrt(3) / 2
+    rows = int(np.floor(height / row_spacing + 1e-9)) + 1
+    columns = int(np.floor(width / spacing + 1e-9)) + 1
+    # odd rows are shifted by half a spacing and lose their last site when it would stick out
+    odd_columns = int(np.floor((width - spacing / 2) / spacing + 1e-9)) + 1 if width >= spacing / 2 else 0
+
+    row_indices = np.arange(rows)
+    columns_per_row = np.where(row_indices % 2 == 0, columns, odd_columns)
+    site_rows = np.repeat(row_indices, columns_per_row)
+    site_columns = np.arange(len(site_rows)) - np.repeat(np.cumsum(columns_per_row) - columns_per_row, columns_per_row)
+
+    # spread the unused margin evenly on both sides
+    margin_x = (width - (columns - 1) * spacing - (spacing / 2 if odd_columns == columns else 0)) / 2
+    margin_y = (height - (rows - 1) * row_spacing) / 2
+
+    sites = np.empty((len(site_rows), 2))
+    sites[:, 0] = left + margin_x + site_columns * spacing + (site_rows % 2) * spacing / 2
+    sites[:, 1] = top + margin_y + site_rows * row_spacing
+    return sites
+
+def _blocked_sites(sites: np.ndarray, spacing: float, reach: float, existing_positions: np.ndarray, existing_radii: np.ndarray) -> np.ndarray:
+    """ Marks the sites closer than reach + the existing radius to an existing particle, checking only the sites near each particle. """
+    blocked = np.zeros(len(sites), dtype=bool)
+    if len(sites) == 0 or len(existing_positions) == 0:
+        return blocked
+
+    # the sites are sorted by row, then by x, so the nearest sites of a particle are found by binary search within rows
+    order = np.lexsort((sites[:, 0], sites[:, 1]))
+    site_x, site_y = sites[order, 0], sites[order, 1]
+    row_y, row_starts = np.unique(site_y, return_index=True)
+    row_ends = np.append(row_starts[1:], len(site_y))
+    existing_x, existing_y = existing_positions[:, 0].copy(), existing_positions[:, 1].copy()
+
+    max_distance = reach + float(existing_radii.max())
+    row_spacing = spacing * np.sqrt(3) / 2
+    row_reach = int(np.ceil(max_distance / row_spacing)) + 1
+    column_reach = int(np.ceil(max_distance / spacing)) + 1
+
+    nearest_rows = np.clip(np.searchsorted(row_y, existing_y), 0, len(row_y) - 1)
+    for row_offset in range(-row_reach, row_reach + 1):
+        rows = nearest_rows + row_offset
+        valid = (rows >= 0) & (rows < len(row_y))
+        particles = np.flatnonzero(valid)
+        rows = rows[valid]
+        starts, ends = row_starts[rows], row_ends[rows]
+        particle_x = existing_x[particles]
+        # a particle only reaches the row when it is close enough in y
+        distances_y_squared = (row_y[rows] - existing_y[particles]) ** 2
+        limits_squared = (reach + existing_radii[particles]) ** 2
+        # site of the row closest in x, found from the first site and the spacing
+        nearest_columns = starts + np.rint((particle_x - site_x[starts]) / spacing).astype(np.int64)
+        for column_offset in range(-column_reach, column_reach + 1):
+            candidates = nearest_columns + column_offset
+            inside = (candidates >= starts) & (candidates < ends)
+            candidates = np.where(inside, candidates, starts)
+            too_close = inside & ((site_x[candidates] - particle_x) ** 2 + distances_y_squared < limits_squared)
+            blocked[order[candidates[too_close]]] = True
+    return blocked
+
+def _sample_free_positions(number_of_particles: int, region: Tuple[float, float, float, float], radius: float,
+                           existing_positions: np.ndarray, existing_radii: np.ndarray, rounds: int = 32) -> np.ndarray:
+    """ Random sequential placement: throws batches of random candidates and keeps those clear of the particles placed so far. """
+    from broad_phase import Spatial_Hash_Broad_Phase
+
+    broad_phase = Spatial_Hash_Broad_Phase()
+    bounds = {"left": region[0] - radius, "top": region[1] - radius, "right": region[2] + radius, "bottom": region[3] + radius}
+    placed = np.zeros((0, 2))
+    for _ in range(rounds):
+        missing = number_of_particles - len(placed)
+        if missing <= 0:
+            break
+        # at least about one candidate per radius squared of the region, so small gaps are hit too
+        # more than a few per radius squared would only overlap each other
+        area_candidates = int((region[2] - region[0]) * (region[3] - region[1]) / radius ** 2)
+        number_of_candidates = max(1, min(max(4 * missing, area_candidates), 4 * area_candidates))
+        candidates = np.random.uniform(region[:2], region[2:], (number_of_candidates, 2))
+        positions = np.concatenate((existing_positions, placed, candidates))
+        radii = np.concatenate((existing_radii, np.full(len(placed) + len(candidates), radius)))
+        pairs_i, pairs_j = broad_phase.find_pairs(positions, radii, bounds)
+
+        # a candidate is dropped when it hits anything placed before it (existing, placed or an earlier candidate)
+        first_candidate = len(existing_positions) + len(placed)
+        later = np.maximum(pairs_i, pairs_j)
+        rejected = np.zeros(len(positions), dtype=bool)
+        rejected[later[later >= first_candidate]] = True
+        accepted = np.flatnonzero(~rejected[first_candidate:])[:missing]
+        placed = np.concatenate((placed, candidates[accepted]))
+    return placed
+
+def place_particles(number_of_particles: int, container_bounds: dict, radius: float = PARTICLE_RADIUS,
+                    existing_positions: Union[np.ndarray, None] = None, existing_radii: Union[np.ndarray, None] = None) -> np.ndarray:
+    """ Returns (N, 2) positions for new particles that overlap neither each other, the walls, nor the existing particles.
+
+    The particles go on random sites of a jittered hexagonal lattice, as widely spaced as the free room allows.
+    Raises ValueError when the particles cannot fit, i.e. the packing fraction would exceed what the lattice can hold.
+    """
+    if number_of_particles <= 0:
+        return np.zeros((0, 2))
+    if existing_positions is None:
+        existing_positions, existing_radii = np.zeros((0, 2)), np.zeros(0)
+
+    # region the particle centres can reach
+    region = (container_bounds["left"] + radius, container_bounds["top"] + radius, container_bounds["right"] - radius, container_bounds["bottom"] - radius)
+    width, height = max(0.0, region[2] - region[0]), max(0.0, region[3] - region[1])
+    container_area = (container_bounds["right"] - container_bounds["left"]) * (container_bounds["bottom"] - container_bounds["top"])
+
+    total_particles = number_of_particles + len(existing_positions)
+    packing_fraction = (number_of_particles * np.pi * radius ** 2 + np.sum(np.pi * existing_radii ** 2)) / container_area if container_area > 0 else np.inf
+    if packing_fraction > HEXAGONAL_PACKING_FRACTION:
+        raise ValueError(f"Cannot place {number_of_particles} particles of radius {radius} without overlaps, the packing fraction would be {packing_fraction:.2f} "
+                         f"and a hexagonal lattice holds at most {HEXAGONAL_PACKING_FRACTION:.2f}")
+
+    # start from the spacing that spreads all particles evenly and tighten it until enough sites are free
+    spacing = max(2 * radius, np.sqrt(2 * width * height / (np.sqrt(3) * total_particles)) if width * height > 0 else 0.0)
+    while True:
+        jitter = (spacing - 2 * radius) / 2
+        sites = hexagonal_lattice((region[0] + jitter, region[1] + jitter, region[2] - jitter, region[3] - jitter), spacing)
+        free_sites = np.flatnonzero(~_blocked_sites(sites, spacing, radius + jitter, existing_positions, existing_radii))
+        if len(free_sites) >= number_of_particles:
+            break
+        if spacing <= 2 * radius:
+            break
+        spacing = max(2 * radius, spacing * 0.97)
+
+    if len(free_sites) < number_of_particles:
+        # the existing particles do not sit on this lattice, so the gaps between them are searched at random instead
+        positions = _sample_free_positions(number_of_particles, region, radius, existing_positions, existing_radii) if len(existing_positions) else np.zeros((0, 2))
+        if len(positions) == number_of_particles:
+            return positions
+
+        room = "between the existing particles" if len(existing_positions) else "in the container"
+        raise ValueError(f"Cannot place {number_of_particles} particles of radius {radius} without overlaps, there is only room for {max(len(free_sites), len(positions))} {room} "
+                         f"(packing fraction {packing_fraction:.2f}, a hexagonal lattice holds at most {HEXAGONAL_PACKING_FRACTION:.2f})")
+
+    positions = sites[np.random.choice(free_sites, number_of_particles, replace=False)]
+
+    # every particle moves by at most the jitter, which keeps it clear of its neighbours and of the walls
+    angles = np.random.uniform(0, 2 * np.pi, number_of_particles)
+    distances = jitter * np.sqrt(np.random.uniform(0, 1, number_of_particles))
+    positions[:, 0] += distances * np.cos(angles)
+    positions[:, 1] += distances * np.sin(angles)
+    return positions
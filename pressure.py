@@ -0,0 +1,57 @@
+from typing import Union
+import numpy as np
+
+from settings import *
+from particle_store import WALLS
+
+def ideal_gas_pressure(number_of_particles: int, temperature: Union[float, int], area: float) -> float:
+    """ Ideal 2D gas pressure in simulation units (force per unit wall length) for the velocity scaling used by Closed_System. """
+    if area <= 0:
+        return 0.0
+    # calculate_velocities gives <v^2> = VELOCITY_SCALE^2 * 3kT/m, and in 2D P * A = N * m<v^2> / 2
+    mean_kinetic_energy = 0.5 * VELOCITY_SCALE ** 2 * 3 * BOLTZMANNS_CONSTANT * temperature
+    return number_of_particles * mean_kinetic_energy / area
+
+class Pressure_Gauge:
+    """ Measures the pressure from the momentum the particles transfer to the walls.
+
+    Every step adds one slot to a ring buffer holding the impulse on each wall and the wall length times the step duration.
+    The windowed pressure is the impulse over the whole window divided by the summed length-time.
+    """
+    def __init__(self, window_steps: int = PRESSURE_WINDOW_STEPS) -> None:
+        self.window_steps: int = max(1, window_steps)
+
+        self.impulses: np.ndarray = np.zeros((self.window_steps, len(WALLS)))
+        self.exposures: np.ndarray = np.zeros((self.window_steps, len(WALLS)))
+        self.slot: int = 0
+
+        self.pressure: float = 0.0
+        self.windowed_pressure: float = 0.0
+        self.windowed_wall_pressures: np.ndarray = np.zeros(len(WALLS))
+
+    def reset(self) -> None:
+        self.impulses.fill(0)
+        self.exposures.fill(0)
+        self.slot = 0
+        self.pressure = 0.0
+        self.windowed_pressure = 0.0
+        self.windowed_wall_pressures.fill(0)
+
+    def record(self, wall_impulses: np.ndarray, dt: float, wall_lengths: np.ndarray) -> None:
+        """ Adds the impulse of one step. wall_impulses and wall_lengths are ordered like WALLS. """
+        if dt <= 0:
+            return
+
+        exposures = np.asarray(wall_lengths, dtype=np.float64) * dt
+        self.impulses[self.slot] = wall_impulses
+        self.exposures[self.slot] = exposures
+        self.slot = (self.slot + 1) % self.window_steps
+
+        total_exposure = exposures.sum()
+        self.pressure = float(np.sum(wall_impulses) / total_exposure) if total_exposure > 0 else 0.0
+
+        window_impulses = self.impulses.sum(axis=0)
+        window_exposures = self.exposures.sum(axis=0)
+        self.windowed_wall_pressures = np.divide(window_impulses, window_exposures, out=np.zeros(len(WALLS)), where=window_exposures > 0)
+        total_window_exposure = window_exposures.sum()
+        self.windowed_pressure = float(window_impulses.sum() / total_window_exposure) if total_window_exposure > 0 else 0.0
@@ -0,0 +1,141 @@
+import csv
+import time
+import pygame
+from typing import Union, List, Dict
+import numpy as np
+
+from settings import *
+
+# phases of a frame, in the order they run. Every lap() charges the time since the previous lap to one of them
+PROFILER_PHASES = ("wait", "events", "container", "particles", "observables", "render", "temperature_ui", "ui_update", "ui_draw", "display", "stream")
+PROFILER_COUNTERS = ("particle_count", "substeps", "pairs_tested", "collisions_resolved")
+
+class Frame_Profiler:
+    """ Per-phase frame timer with per-frame counters, kept in a ring buffer.
+
+    Instrumented code calls lap(phase) after each phase and count(counter, value) for counters.
+    While disabled both return right away, so the instrumentation can stay in the frame loop.
+    """
+    def __init__(self, history_frames: int = PROFILER_HISTORY_FRAMES) -> None:
+        self.enabled: bool = False
+        self.history_frames: int = max(1, history_frames)
+
+        self.phase_indices: Dict[str, int] = {phase: index for index, phase in enumerate(PROFILER_PHASES)}
+        self.counter_indices: Dict[str, int] = {counter: index for index, counter in enumerate(PROFILER_COUNTERS)}
+
+        # ring buffer of finished frames, in milliseconds, and the frame being measured
+        self.timings: np.ndarray = np.zeros((self.history_frames, len(PROFILER_PHASES)))
+        self.frame_times: np.ndarray = np.zeros(self.history_frames)
+        self.counters: np.ndarray = np.zeros((self.history_frames, len(PROFILER_COUNTERS)), dtype=np.int64)
+        self.slot: int = 0
+        self.frames_recorded: int = 0
+
+        self.current_timings: List[float] = [0.0] * len(PROFILER_PHASES)
+        self.current_counters: List[int] = [0] * len(PROFILER_COUNTERS)
+        self.frame_start: float = 0.0
+        self.last_time: float = 0.0
+
+        self.csv_file = None
+        self.csv_writer = None
+
+    def set_enabled(self, enabled: bool) -> None:
+        # streaming to CSV keeps the profiler on
+        self.enabled = enabled or self.csv_writer is not None
+        self._reset_frame()
+
+    def begin_frame(self) -> None:
+        if not self.enabled:
+            return
+        self._reset_frame()
+
+    def _reset_frame(self) -> None:
+        self.frame_start = self.last_time = time.perf_counter()
+        self.current_timings = [0.0] * len(PROFILER_PHASES)
+        self.current_counters = [0] * len(PROFILER_COUNTERS)
+
+    def lap(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current_timings[self.phase_indices[phase]] += now - self.last_time
+        self.last_time = now
+
+    def count(self, counter: str, value: int) -> None:
+        if not self.enabled:
+            return
+        self.current_counters[self.counter_indices[counter]] += value
+
+    def end_frame(self) -> None:
+        """ Stores the frame in the ring buffer, and in the CSV file when streaming. """
+        if not self.enabled:
+            return
+        frame_time = (time.perf_counter() - self.frame_start) * 1000
+        timings = [seconds * 1000 for seconds in self.current_timings]
+
+        self.timings[self.slot] = timings
+        self.frame_times[self.slot] = frame_time
+        self.counters[self.slot] = self.current_counters
+        self.slot = (self.slot + 1) % self.history_frames
+        self.frames_recorded += 1
+
+        if self.csv_writer is not None:
+            self.csv_writer.writerow([self.frames_recorded, f"{frame_time:.4f}"] + [f"{timing:.4f}" for timing in timings] + self.current_counters)
+
+    def start_csv(self, path: str) -> None:
+        """ Streams every following frame to a CSV file, one row per frame with the timings in milliseconds. """
+        self.stop_csv()
+        self.csv_file = open(path, "w", newline="")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(["frame", "frame_ms"] + [f"{phase}_ms" for phase in PROFILER_PHASES] + list(PROFILER_COUNTERS))
+        self.set_enabled(True)
+
+    def stop_csv(self) -> None:
+        if self.csv_file is None:
+            return
+        self.csv_file.close()
+        self.csv_file = None
+        self.csv_writer = None
+
+    def averages(self) -> Dict[str, float]:
+        """ Mean of every phase, the frame time and the counters over the frames in the ring buffer. """
+        frames = min(self.frames_recorded, self.history_frames)
+        if frames == 0:
+            return {}
+        averages = {"frame": float(self.frame_times[:frames].mean())}
+        averages.update(zip(PROFILER_PHASES, self.timings[:frames].mean(axis=0).tolist()))
+        averages.update(zip(PROFILER_COUNTERS, self.counters[:frames].mean(axis=0).tolist()))
+        return averages
+
+# profiler shared by the simulation and the closed systems
+FRAME_PROFILER = Frame_Profiler()
+
+class Profiler_Overlay:
+    """ Lines of text listing the average phase timings of a profiler, refreshed a few times per second. """
+    def __init__(self, profiler: Frame_Profiler, position: Union[list, tuple], refresh_frames: int = 15) -> None:
+        from ui.text import Text
+
+        self.profiler: Frame_Profiler = profiler
+        self.refresh_frames: int = refresh_frames
+        self.frames_until_refresh: int = 0
+
+        lines = 1 + len(PROFILER_PHASES) + len(PROFILER_COUNTERS)
+        self.texts = [Text("", 18, (position[0], position[1] + line * 14), color=(90,90,90)) for line in range(lines)]
+
+    def update(self) -> None:
+        self.frames_until_refresh -= 1
+        if self.frames_until_refresh > 0:
+            return
+        self.frames_until_refresh = self.refresh_frames
+
+        averages = self.profiler.averages()
+        if not averages:
+            return
+        lines = [f"frame {averages['frame']:.2f} ms ({1000 / max(averages['frame'], 1e-6):.0f} fps)"]
+        lines += [f"{phase} {averages[phase]:.2f} ms" for phase in PROFILER_PHASES]
+        lines += [f"{counter} {averages[counter]:.0f}" for counter in PROFILER_COUNTERS]
+        for text, line in zip(self.texts, lines):
+            text.set_text(line)
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        for text in self.texts:
+            text.render(render_surface)
@@ -0,0 +1,258 @@
+import csv
+import json
+import time
+from typing import Union, List, Dict, Any
+import numpy as np
+
+from settings import *
+from species import Species
+
+# columns of the protocol log, one row per system and logged time
+PROTOCOL_LOG_COLUMNS = ("time", "step", "step_type", "system", "particles", "volume", "temperature", "kinetic_temperature",
+                        "measured_pressure_windowed", "ideal_pressure", "accurate_pressure", "piston_work")
+
+class Protocol_Step:
+    """ Base of the protocol steps. A step lasts duration simulated seconds, start() runs when the step begins and apply() before every update. """
+    step_type: str = ""
+
+    def __init__(self, duration: float = 0.0) -> None:
+        if duration < 0:
+            raise ValueError(f"A protocol step cannot last {duration} s")
+        self.duration: float = float(duration)
+
+    def start(self, system) -> None:
+        pass
+
+    def apply(self, system, progress: float) -> None:
+        """ Sets the controls of the system for the given progress through the step, from 0 to 1. """
+        pass
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"type": self.step_type, "duration": self.duration}
+
+class Volume_Step(Protocol_Step):
+    """ Moves the cap to the given volume, linearly over duration simulated seconds, or at once for a duration of 0. """
+    step_type = "volume"
+
+    def __init__(self, volume: float, duration: float = 0.0) -> None:
+        super().__init__(duration)
+        self.volume: float = float(volume)
+        # the volume every system started the step from, by id, as one step object runs on all systems of a runner
+        self.start_volumes: Dict[int, float] = {}
+
+    def start(self, system) -> None:
+        container = system.container
+        if not container.min_volume_meters <= self.volume <= container.max_volume_meters:
+            raise ValueError(f"Volume {self.volume} m is outside the limits {container.min_volume_meters} to {container.max_volume_meters} m of the container")
+        self.start_volumes[id(system)] = container.volume_meters
+
+    def apply(self, system, progress: float) -> None:
+        start_volume = self.start_volumes.get(id(system), self.volume)
+        system.container.set_volume_meters(start_volume + (self.volume - start_volume) * progress)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**super().as_dict(), "volume": self.volume}
+
+class Temperature_Step(Protocol_Step):
+    """ Changes the temperature setpoint to the given temperature, linearly over duration simulated seconds, or at once for a duration of 0. """
+    step_type = "temperature"
+
+    def __init__(self, temperature: float, duration: float = 0.0) -> None:
+        super().__init__(duration)
+        if not 0 <= temperature <= MAX_TEMPERATURE:
+            raise ValueError(f"Temperature {temperature} K is outside 0 to MAX_TEMPERATURE ({MAX_TEMPERATURE} K)")
+        self.temperature: float = temperature
+        # the setpoint every system started the step from, by id (see Volume_Step)
+        self.start_temperatures: Dict[int, float] = {}
+
+    def start(self, system) -> None:
+        self.start_temperatures[id(system)] = system.temperature
+
+    def apply(self, system, progress: float) -> None:
+        start_temperature = self.start_temperatures.get(id(system), self.temperature)
+        system.set_temperature(start_temperature + (self.temperature - start_temperature) * progress)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**super().as_dict(), "temperature": self.temperature}
+
+class Add_Species_Step(Protocol_Step):
+    """ Adds a species to the mixture, for the add_particles steps after it, then runs for duration simulated seconds. """
+    step_type = "add_species"
+
+    def __init__(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255), duration: float = 0.0) -> None:
+        super().__init__(duration)
+        self.species: Species = Species(name, mass, radius, color)
+
+    def start(self, system) -> None:
+        species = self.species
+        system.add_species(species.name, species.mass, species.radius, species.color)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**super().as_dict(), **self.species.as_dict()}
+
+class Add_Particles_Step(Protocol_Step):
+    """ Adds particles of a species at the temperature setpoint in the free room of the container, then runs for duration simulated seconds.
+    Without a color they get the color of their species. """
+    step_type = "add_particles"
+
+    def __init__(self, count: int, duration: float = 0.0, color: Union[list, tuple, None] = None, species: Union[int, str] = 0) -> None:
+        super().__init__(duration)
+        if count < 0:
+            raise ValueError(f"Cannot add {count} particles")
+        self.count: int = int(count)
+        self.color: Union[tuple, None] = tuple(color) if color is not None else None
+        self.species: Union[int, str] = species
+
+    def start(self, system) -> None:
+        system.add_particles(number_of_particles=self.count, color=self.color, species=self.species)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**super().as_dict(), "count": self.count, "color": list(self.color) if self.color is not None else None, "species": self.species}
+
+class Pause_Step(Protocol_Step):
+    """ Keeps every control as it is for duration simulated seconds, e.g. to let the gas equilibrate between two changes. """
+    step_type = "pause"
+
+PROTOCOL_STEPS = {
+    "volume": Volume_Step,
+    "temperature": Temperature_Step,
+    "add_species": Add_Species_Step,
+    "add_particles": Add_Particles_Step,
+    "pause": Pause_Step,
+}
+
+def create_protocol_step(description: Dict[str, Any]) -> Protocol_Step:
+    """ Creates a step from its description, e.g. {"type": "volume", "volume": 2, "duration": 5}. """
+    arguments = dict(description)
+    step_type = arguments.pop("type", None)
+    if step_type not in PROTOCOL_STEPS:
+        raise ValueError(f"Unknown protocol step {step_type!r}, expected one of {sorted(PROTOCOL_STEPS)}")
+    try:
+        return PROTOCOL_STEPS[step_type](**arguments)
+    except TypeError as error:
+        raise ValueError(f"Invalid {step_type} step {description}: {error}") from None
+
+class Protocol:
+    """ Schedule of steps run one after the other over simulated time.
+
+    A schedule is a list of step descriptions (see create_protocol_step), for example an isothermal compression:
+
+        [{"type": "pause", "duration": 2},
+         {"type": "volume", "volume": 2, "duration": 10},
+         {"type": "pause", "duration": 2}]
+
+    with the systems run by a thermostat, or the same schedule without one for an adiabatic compression.
+    """
+    def __init__(self, steps: List[Union[Protocol_Step, Dict[str, Any]]]) -> None:
+        self.steps: List[Protocol_Step] = [step if isinstance(step, Protocol_Step) else create_protocol_step(step) for step in steps]
+
+    @property
+    def duration(self) -> float:
+        return sum(step.duration for step in self.steps)
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [step.as_dict() for step in self.steps]
+
+def load_protocol(path: str) -> Protocol:
+    """ Reads a protocol from a JSON file holding the list of steps, or an object with the list under "steps". """
+    with open(path) as file:
+        schedule = json.load(file)
+    return Protocol(schedule["steps"] if isinstance(schedule, dict) else schedule)
+
+class Protocol_Runner:
+    """ Runs a protocol on every system of a Headless_Runner as fast as possible and logs the observables.
+
+    The controls are set before every update from the progress through the current step, so a ramp moves in dt sized
+    steps. A row per system is logged every log_interval simulated seconds and at the end of every step.
+    """
+    def __init__(self, runner, protocol: Protocol, dt: float = 1 / TARGET_FPS, log_interval: float = PROTOCOL_LOG_INTERVAL) -> None:
+        if dt <= 0:
+            raise ValueError(f"A protocol needs a positive time step, not {dt}")
+        self.runner = runner
+        self.protocol: Protocol = protocol
+        self.dt: float = dt
+        self.log_interval: float = log_interval
+
+        self.rows: List[Dict[str, Any]] = []
+        self.log_file = None
+        self.log_writer = None
+        self.next_log_time: float = 0.0
+        self.last_logged: Union[tuple, None] = None
+        self.wall_time: float = 0.0
+
+    def start_log(self, path: str) -> None:
+        """ Also writes the log rows to a CSV file as they are taken. """
+        self.stop_log()
+        self.log_file = open(path, "w", newline="")
+        self.log_writer = csv.DictWriter(self.log_file, PROTOCOL_LOG_COLUMNS)
+        self.log_writer.writeheader()
+
+    def stop_log(self) -> None:
+        if self.log_file is None:
+            return
+        self.log_file.close()
+        self.log_file = None
+        self.log_writer = None
+
+    def log(self, step_index: int, step_type: str) -> None:
+        # the end of a step often falls on a logged time already
+        if self.last_logged == (step_index, self.runner.simulated_time):
+            return
+        self.last_logged = (step_index, self.runner.simulated_time)
+
+        for index, system in enumerate(self.runner.systems):
+            row = {
+                "time": self.runner.simulated_time,
+                "step": step_index,
+                "step_type": step_type,
+                "system": index,
+                "particles": len(system.particles),
+                "volume": system.container.volume_meters,
+                "temperature": system.temperature,
+                "kinetic_temperature": system.speed_distribution.kinetic_temperature,
+                "measured_pressure_windowed": system.measured_pressure_windowed,
+                "ideal_pressure": system.ideal_pressure,
+                "accurate_pressure": float(system.accurate_pressure),
+                "piston_work": system.piston_work,
+            }
+            self.rows.append(row)
+            if self.log_writer is not None:
+                self.log_writer.writerow(row)
+
+    def run_step(self, step_index: int, step: Protocol_Step) -> None:
+        for system in self.runner.systems:
+            step.start(system)
+
+        if step.duration == 0:
+            # steps without a duration take effect at once
+            for system in self.runner.systems:
+                step.apply(system, 1.0)
+
+        updates = int(np.ceil(step.duration / self.dt - 1e-9))
+        for index in range(updates):
+            # the controls are set for the end of the update, and the last update is shortened so the step lasts exactly its duration
+            end_time = min((index + 1) * self.dt, step.duration)
+            for system in self.runner.systems:
+                step.apply(system, end_time / step.duration)
+            self.runner.step(end_time - index * self.dt)
+
+            if self.log_interval > 0 and self.runner.simulated_time >= self.next_log_time - 1e-9:
+                self.log(step_index, step.step_type)
+                while self.next_log_time <= self.runner.simulated_time + 1e-9:
+                    self.next_log_time += self.log_interval
+
+        self.log(step_index, step.step_type)
+
+    def run(self) -> List[Dict[str, Any]]:
+        """ Runs the whole protocol and returns the log rows. """
+        start = time.perf_counter()
+        self.next_log_time = self.runner.simulated_time + self.log_interval
+        # the state the protocol starts from
+        self.log(-1, "start")
+        for step_index, step in enumerate(self.protocol.steps):
+            self.run_step(step_index, step)
+
+        wall_time = time.perf_counter() - start
+        self.wall_time += wall_time
+        self.runner.wall_time += wall_time
+        return self.rows
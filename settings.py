@@ -12,11 +12,68 @@ CLOSED_SYSTEM_RENDER_SURFACE_SIZE = (900, 400)
 # simulation
 PARTICLE_RADIUS = 7
 PARTICLE_MASS = 1e-26
+DEFAULT_SPECIES_NAME = "gas" # the species of PARTICLE_MASS and PARTICLE_RADIUS every closed system starts with (see species.py)
 NUMBER_OF_PARTICLES = 175
 
 TEMPERATURE_ADJUSTMENT = 10
 MAX_TEMPERATURE = 100000
 
+BROAD_PHASE = "spatial_hash" # "spatial_hash" or "brute_force"
+INTEGRATOR = "time_step" # "time_step" or "event_driven"
+
+VELOCITY_SCALE = 0.2 # scales the physical speeds down to pixels per second
+PRESSURE_WINDOW_STEPS = 120 # steps in the rolling window of the measured pressure
+MAX_SUBSTEPS = 16 # most substeps a frame is split into for fast particles (1 or None for one step per frame)
+COMPACT_PARTICLES = False # store positions and velocities in single precision, for systems of a million particles
+PARTICLE_MEMORY_BUDGET = None # most bytes of particle and scratch buffers per closed system, add_particles refuses to go past it (None for no limit)
+SUBSTEP_MAX_DISPLACEMENT = 2.0 # radii of the smallest particle two particles may close in by per substep (at most 2, one diameter, keeps them from passing through each other)
+
+THERMOSTAT = None # None, "instant", "berendsen" or "andersen" (holds the temperature setpoint during long runs)
+THERMOSTAT_INTERVAL_STEPS = 1 # the thermostat acts every this many steps
+BERENDSEN_TIME_CONSTANT = 0.5 # seconds for the kinetic temperature to relax toward the setpoint
+ANDERSEN_COLLISION_FREQUENCY = 1.0 # velocity resamplings per particle per second
+
+EXECUTION_MODE = "serial" # "serial", "processes" (every closed system steps in its own worker process) or "threads" (every closed system steps on its own thread)
+WORKER_PARTICLE_CAPACITY = 100000 # particles that fit in the shared memory of one worker
+PHYSICS_STEPS_PER_SECOND = TARGET_FPS # fixed step rate of the physics threads
+MAX_PHYSICS_LAG_STEPS = 5 # a physics thread further behind than this drops the missed steps
+SNAPSHOT_BUFFERS = 3 # 2 or 3 snapshots between a physics thread and the render loop
+
+# trajectories
+RECORD_TRAJECTORIES = False # record both closed systems to TRAJECTORY_PATHS while running
+REPLAY_TRAJECTORIES = False # play TRAJECTORY_PATHS back instead of simulating
+TRAJECTORY_PATHS = ("top_system.traj", "bottom_system.traj")
+TRAJECTORY_DTYPE = "<f4" # dtype of the recorded positions and velocities
+TRAJECTORY_CHUNK_FRAMES = 64 # frames buffered in memory before they are handed to the writer thread
+
+# checkpoints
+CHECKPOINT_PATH = "simulation.ckpt" # saved with F5 and loaded with F9
+
+# streaming
+STREAM_ADDRESS = None # publish live frames for viewer.py and other subscribers, ("127.0.0.1", 5757) for TCP or a path for a Unix socket
+
+# protocols
+PROTOCOL_LOG_INTERVAL = 0.1 # simulated seconds between two rows of the protocol log (rows are also logged at the end of every step)
+
+# profiling
+PROFILER_HISTORY_FRAMES = 240 # frames kept in the ring buffer of the profiler (the overlay toggles with F3)
+PROFILER_CSV_PATH = None # stream the per-frame timings to this CSV file, e.g. "profile.csv"
+
+# analytics
+SPEED_HISTOGRAM_BINS = 32
+SPEED_HISTOGRAM_MAX_SPEED = 1200 # faster particles are counted in the last bin
+SPEED_DISTRIBUTION_DECAY = 0.05 # weight of the newest step in the moving averages of the speed distribution
+SPEED_DISTRIBUTION_WINDOW = None # average over this many steps instead of the exponential decay
+
+# rendering
+COLOR_BUCKETS = 64 # number of precomputed particle colors between blue and red
+COLOR_SCALE_MAX_SPEED = 600 # speed shown as fully red
+PARTICLE_COLOR_MODE = "speed" # "speed" draws particles on the blue to red speed scale, "species" in the color of their species
+LOD_PARTICLE_THRESHOLD = 50000 # from this many particles a system is drawn as a density field (None to always draw every particle)
+LOD_CELL_SIZE = 8 # pixels per cell of the density field
+LOD_SAMPLE_SIZE = 50000 # particles binned into the density field, larger systems are sampled
+LOD_FULL_PACKING_FRACTION = 0.3 # packing fraction of a cell drawn in full color, emptier cells fade toward the background
+
 GAS_CONSTANT = 8.314
 BOLTZMANNS_CONSTANT = 1.38e-23
 AVOGADROS_CONSTANT = 6.022*10**23
@@ -1,15 +1,20 @@
+import importlib
 import pygame
 import pygame_gui
 from sys import exit
 from typing import Union
-
-import pygame_gui.ui_manager
+import numpy as np
 
 from settings import *
 from closed_system import Closed_System
+from checkpoint import save_arrays, load_arrays, get_random_state, set_random_state
+from profiler import FRAME_PROFILER, Profiler_Overlay
 from ui.segmented_buttun import Segmented_Button
 from ui.text import Text
 
+# module and class of the systems for every EXECUTION_MODE, only the module of the selected mode is imported
+SYSTEM_CLASSES = {"serial": ("closed_system", "Closed_System"), "processes": ("parallel", "Remote_Closed_System"), "threads": ("physics_thread", "Threaded_Closed_System")}
+
 class Simulation:
     def __init__(self) -> None:
         self.display = pygame.display.get_surface()
@@ -18,15 +23,29 @@ class Simulation:
         self.paused = False
         self.update_particle_movement = True
 
-        self.top_system = Closed_System((40,75), container_min_volume_meters=1.5, container_max_volume_meters=10, container_start_volume_meters=10, closed_system_start_temperature=800)
+        system_arguments = dict(container_min_volume_meters=1.5, container_max_volume_meters=10, container_start_volume_meters=10, closed_system_start_temperature=800)
 
-        self.top_system.add_particles(number_of_particles=NUMBER_OF_PARTICLES)
-        self.top_system.add_particles(number_of_particles=1, color=(255,0,0))
-        
-        self.bottom_system = Closed_System((40,425), container_min_volume_meters=1.5, container_max_volume_meters=10, container_start_volume_meters=10, closed_system_start_temperature=800)
+        if REPLAY_TRAJECTORIES:
+            from trajectory import Replay_System
+            self.top_system = Replay_System((40,75), TRAJECTORY_PATHS[0], **system_arguments)
+            self.bottom_system = Replay_System((40,425), TRAJECTORY_PATHS[1], **system_arguments)
+        else:
+            module_name, class_name = SYSTEM_CLASSES[EXECUTION_MODE]
+            system_class = getattr(importlib.import_module(module_name), class_name)
+
+            self.top_system = system_class((40,75), **system_arguments)
+
+            self.top_system.add_particles(number_of_particles=NUMBER_OF_PARTICLES)
+            self.top_system.add_particles(number_of_particles=1, color=(255,0,0), tracer=True)
+            
+            self.bottom_system = system_class((40,425), **system_arguments)
+
+            self.bottom_system.add_particles(number_of_particles=NUMBER_OF_PARTICLES)
+            self.bottom_system.add_particles(number_of_particles=1, color=(255,0,0), tracer=True)
 
-        self.bottom_system.add_particles(number_of_particles=NUMBER_OF_PARTICLES)
-        self.bottom_system.add_particles(number_of_particles=1, color=(255,0,0))
+            if RECORD_TRAJECTORIES:
+                self.top_system.start_recording(TRAJECTORY_PATHS[0])
+                self.bottom_system.start_recording(TRAJECTORY_PATHS[1])
 
         # ui
         self.ui_manager = pygame_gui.UIManager(self.display.get_size(), UI_THEME_PATH)
@@ -66,6 +85,32 @@ class Simulation:
 
         self.made_by_text = Text("A Proud Macca® Production.", 30, (920, 720), color=(100,100,100,100))
 
+        # rendering layers: static labels are composited once onto the background and only changed areas are sent to the display
+        self.static_texts = [self.system_switch_text, self.change_temperature_text, self.frame_skip_text, self.play_pause_text, self.made_by_text]
+        self.background = pygame.Surface(self.display.get_size())
+        self.background.fill(BACKGROUND_COLOR)
+        self.draw_text(self.background)
+
+        self.system_rects = [pygame.Rect(system.closed_system_render_position, CLOSED_SYSTEM_RENDER_SURFACE_SIZE) for system in (self.top_system, self.bottom_system)]
+        self.ui_rect = self.system_switch.buttons[0].rect.unionall([element.rect for element in self.system_switch.buttons + 
+                                                                     [self.decrease_temperature_button, self.increase_temperature_button, self.temperature_entry_line, 
+                                                                      self.frame_skip_button, self.play_pause_button]])
+        # static labels drawn over a system surface have to be blitted again after the system is rendered
+        self.overlay_texts = [text for text in self.static_texts if text.rect.collidelist(self.system_rects) != -1]
+        self.full_redraw = True
+
+        # profiling
+        self.profiler_overlay = Profiler_Overlay(FRAME_PROFILER, (50, 90))
+        self.show_profiler = False
+        if PROFILER_CSV_PATH is not None:
+            FRAME_PROFILER.start_csv(PROFILER_CSV_PATH)
+
+        # live frames for external viewers
+        self.stream_server = None
+        if STREAM_ADDRESS is not None:
+            from stream import Stream_Server
+            self.stream_server = Stream_Server(STREAM_ADDRESS)
+
     def adjust_temperature(self, temperature_adjustment: Union[float, int]) -> None:
         if self.selected_system == "Top System" or self.selected_system == "Both Systems":
             self.top_system.adjust_temperature(temperature_adjustment)
@@ -100,12 +145,31 @@ class Simulation:
         self.top_system_update_particle_movement = self.top_system_skip_frame
         self.bottom_system_update_particle_movement = self.bottom_system_skip_frame
     
-    def draw_text(self) -> None:
-        self.system_switch_text.render(self.display)
-        self.change_temperature_text.render(self.display)
-        self.frame_skip_text.render(self.display)
-        self.play_pause_text.render(self.display)
-        self.made_by_text.render(self.display)
+    def get_flags(self) -> np.ndarray:
+        return np.array((self.paused, self.top_system_paused, self.bottom_system_paused, self.top_system_skip_frame, self.bottom_system_skip_frame,
+                         self.top_system_update_particle_movement, self.bottom_system_update_particle_movement), dtype=np.uint8)
+
+    def set_flags(self, flags: np.ndarray) -> None:
+        (self.paused, self.top_system_paused, self.bottom_system_paused, self.top_system_skip_frame, self.bottom_system_skip_frame,
+         self.top_system_update_particle_movement, self.bottom_system_update_particle_movement) = (bool(flag) for flag in flags)
+
+    def save_checkpoint(self, path: str = CHECKPOINT_PATH) -> None:
+        """ Saves both systems, the pause and frame skip flags and the random generator state to one binary file. """
+        save_arrays(path, {**self.top_system.get_checkpoint_state("top_system."), **self.bottom_system.get_checkpoint_state("bottom_system."),
+                           "simulation.flags": self.get_flags(), **get_random_state()})
+
+    def load_checkpoint(self, path: str = CHECKPOINT_PATH) -> None:
+        state = load_arrays(path)
+        self.top_system.set_checkpoint_state(state, "top_system.")
+        self.bottom_system.set_checkpoint_state(state, "bottom_system.")
+        self.set_flags(state["simulation.flags"])
+        set_random_state(state)
+
+        self.temperature_entry_line.set_text(str(self.bottom_system.temperature if self.selected_system == "Bottom System" else self.top_system.temperature))
+
+    def draw_text(self, render_surface: pygame.Surface) -> None:
+        for text in self.static_texts:
+            text.render(render_surface)
     
     def handle_temperature_ui(self) -> None:
         temperature_text = self.temperature_entry_line.get_text()
@@ -127,10 +191,31 @@ class Simulation:
         
         self.set_temperature(temperature)
     
-    def run(self) -> None:
-        
-        while True:
+    def toggle_profiler(self) -> None:
+        self.show_profiler = not self.show_profiler
+        FRAME_PROFILER.set_enabled(self.show_profiler)
+
+    def quit(self) -> None:
+        FRAME_PROFILER.stop_csv()
+        if self.stream_server is not None:
+            self.stream_server.close()
+        for system in (self.top_system, self.bottom_system):
+            # systems stepping in a worker process or on a physics thread have to stop it
+            if hasattr(system, "close"):
+                system.close()
+            elif isinstance(system, Closed_System):
+                system.stop_recording()
+        pygame.quit()
+        exit()
+
+    def run(self, frames: Union[int, None] = None) -> None:
+        """ Runs the frame loop until the window is closed, or for the given number of frames (see startup.py). """
+        frame = 0
+        while frames is None or frame < frames:
+            frame += 1
+            FRAME_PROFILER.begin_frame()
             dt = self.clock.tick(TARGET_FPS) / 1000
+            FRAME_PROFILER.lap("wait")
             self.last_selected_system = self.selected_system
             self.selected_system = self.system_switch.selected_value
 
@@ -139,12 +224,10 @@ class Simulation:
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    exit()
+                    self.quit()
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_q:
-                        pygame.quit() 
-                        exit()
+                        self.quit()
                     if event.key == pygame.K_SPACE:
                         self.pause_resume()
                     if event.key == pygame.K_RIGHT:
@@ -153,6 +236,12 @@ class Simulation:
                         self.adjust_temperature(TEMPERATURE_ADJUSTMENT)
                     if event.key == pygame.K_DOWN:
                         self.adjust_temperature(-TEMPERATURE_ADJUSTMENT)
+                    if event.key == pygame.K_F3:
+                        self.toggle_profiler()
+                    if event.key == pygame.K_F5 and not REPLAY_TRAJECTORIES:
+                        self.save_checkpoint()
+                    if event.key == pygame.K_F9 and not REPLAY_TRAJECTORIES:
+                        self.load_checkpoint()
                 
                 if event.type == pygame_gui.UI_BUTTON_PRESSED:
                     pressed_button = event.ui_element
@@ -169,23 +258,48 @@ class Simulation:
                 self.system_switch.handle_events(event)
                 
                 self.ui_manager.process_events(event)
+            FRAME_PROFILER.lap("events")
 
-            self.display.fill(BACKGROUND_COLOR)
+            if self.full_redraw:
+                self.display.blit(self.background, (0, 0))
+            else:
+                self.display.blit(self.background, self.ui_rect, self.ui_rect)
+            FRAME_PROFILER.lap("render")
 
             dt = 0.007 if self.paused else dt
 
+            # all systems are updated before any is rendered, so systems running in worker processes step in parallel
+            # (systems on physics threads step on their own and only receive the control changes here)
             self.top_system.update(dt, update_particles_movement=self.top_system_update_particle_movement)
-            self.top_system.render(self.display)
-
             self.bottom_system.update(dt, update_particles_movement=self.bottom_system_update_particle_movement)
+
+            self.top_system.render(self.display)
             self.bottom_system.render(self.display)
 
             self.handle_temperature_ui()
+            FRAME_PROFILER.lap("temperature_ui")
 
             # ui
             self.ui_manager.update(dt)
+            FRAME_PROFILER.lap("ui_update")
             self.ui_manager.draw_ui(self.display)
 
-            self.draw_text()
+            for text in self.overlay_texts:
+                text.render(self.display)
+
+            if self.show_profiler:
+                self.profiler_overlay.update()
+                self.profiler_overlay.render(self.display)
+            FRAME_PROFILER.lap("ui_draw")
+
+            if self.full_redraw:
+                pygame.display.update()
+                self.full_redraw = False
+            else:
+                pygame.display.update(self.system_rects + [self.ui_rect])
+            FRAME_PROFILER.lap("display")
 
-            pygame.display.update()
+            if self.stream_server is not None:
+                self.stream_server.publish([self.top_system, self.bottom_system])
+            FRAME_PROFILER.lap("stream")
+            FRAME_PROFILER.end_frame()
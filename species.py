@@ -0,0 +1,88 @@
+from typing import Union, List, Dict
+import numpy as np
+
+from settings import *
+
+# particles store their species as one byte
+MAX_SPECIES = 256
+
+class Species:
+    """ A kind of particle in a mixture, with the mass, radius and color every particle of it gets. """
+    def __init__(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255)) -> None:
+        if mass <= 0 or radius <= 0:
+            raise ValueError(f"Species {name!r} needs a positive mass and radius, not {mass} and {radius}")
+        self.name: str = name
+        self.mass: float = float(mass)
+        self.radius: float = float(radius)
+        self.color: tuple = tuple(color)
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "mass": self.mass, "radius": self.radius, "color": list(self.color)}
+
+class Species_Table:
+    """ The species of a closed system. Particles refer to them by their index, the first species is the default one. """
+    def __init__(self, species: Union[List[Species], None] = None) -> None:
+        self.species: List[Species] = []
+        for entry in species if species is not None else [Species(DEFAULT_SPECIES_NAME)]:
+            self.add(entry)
+
+    def __len__(self) -> int:
+        return len(self.species)
+
+    def __getitem__(self, key: Union[int, str]) -> Species:
+        return self.species[self.index(key)]
+
+    def __iter__(self):
+        return iter(self.species)
+
+    def add(self, species: Species) -> int:
+        """ Adds a species and returns its index. """
+        if any(entry.name == species.name for entry in self.species):
+            raise ValueError(f"There is already a species named {species.name!r}")
+        if len(self.species) >= MAX_SPECIES:
+            raise ValueError(f"A system holds at most {MAX_SPECIES} species")
+        self.species.append(species)
+        return len(self.species) - 1
+
+    def index(self, key: Union[int, str]) -> int:
+        """ Returns the index of a species given by index or name. """
+        if isinstance(key, str):
+            for index, species in enumerate(self.species):
+                if species.name == key:
+                    return index
+            raise ValueError(f"Unknown species {key!r}, expected one of {sorted(species.name for species in self.species)}")
+        if not 0 <= key < len(self.species):
+            raise ValueError(f"Unknown species {key}, the table holds {len(self.species)}")
+        return int(key)
+
+    @property
+    def names(self) -> List[str]:
+        return [species.name for species in self.species]
+
+    # checkpoints hold the table as two arrays, the names and one row of mass, radius and color per species
+    def get_checkpoint_arrays(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        return {f"{prefix}species.names": np.array([species.name.encode() for species in self.species], dtype="S32"),
+                f"{prefix}species.values": np.array([(species.mass, species.radius) + species.color[:3] for species in self.species], dtype=np.float64)}
+
+    @classmethod
+    def from_checkpoint_arrays(cls, state: Dict[str, np.ndarray], prefix: str = "") -> "Species_Table":
+        """ Reads a table written by get_checkpoint_arrays. Checkpoints from before species existed get the default table. """
+        if f"{prefix}species.names" not in state:
+            return cls()
+        return cls([Species(name.decode(), mass, radius, tuple(int(channel) for channel in color))
+                    for name, (mass, radius, *color) in zip(state[f"{prefix}species.names"].tolist(), state[f"{prefix}species.values"].tolist())])
+
+def species_kinetic_temperatures(velocities: np.ndarray, masses: np.ndarray, species: np.ndarray, number_of_species: int) -> np.ndarray:
+    """ Kinetic temperature of every species (see analytics.kinetic_temperature), 0 for species without particles. """
+    counts = np.bincount(species, minlength=number_of_species)
+    mass_speeds_squared = np.bincount(species, weights=masses * np.einsum("ij,ij->i", velocities, velocities), minlength=number_of_species)
+    mean_mass_speeds_squared = np.divide(mass_speeds_squared, counts, out=np.zeros(number_of_species), where=counts > 0)
+    return mean_mass_speeds_squared / (3 * BOLTZMANNS_CONSTANT * VELOCITY_SCALE ** 2)
+
+def partial_pressures(velocities: np.ndarray, masses: np.ndarray, species: np.ndarray, number_of_species: int, area: float) -> np.ndarray:
+    """ Kinetic pressure of every species on its own, in the units of ideal_gas_pressure. By Dalton's law they add up to the pressure of the mixture. """
+    if area <= 0:
+        return np.zeros(number_of_species)
+    # in 2D P * A = N * m<v^2> / 2 (see ideal_gas_pressure)
+    mass_speeds_squared = np.bincount(species, weights=masses * np.einsum("ij,ij->i", velocities, velocities), minlength=number_of_species)
+    return 0.5 * mass_speeds_squared / area
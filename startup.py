@@ -0,0 +1,77 @@
+import time
+
+# taken before anything else is imported, so the imports count towards the startup time
+PROCESS_START = time.perf_counter()
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Union, List, Dict
+
+PHASES = ("imports", "window_and_simulation", "first_frame")
+
+def measure_launch() -> Dict[str, float]:
+    """ Starts the simulation in this process and returns the seconds from the start of the process to the end of every phase. """
+    from main import Main
+    imports = time.perf_counter()
+
+    app = Main()
+    window_and_simulation = time.perf_counter()
+
+    app.simulation.run(frames=1)
+    first_frame = time.perf_counter()
+
+    return {"imports": imports - PROCESS_START, "window_and_simulation": window_and_simulation - PROCESS_START, "first_frame": first_frame - PROCESS_START}
+
+def run_launch(dummy_video: bool) -> Dict[str, float]:
+    """ Launches the simulation in a fresh interpreter, as a cold start would, and returns the times it reports. """
+    environment = dict(os.environ)
+    if dummy_video:
+        environment["SDL_VIDEODRIVER"] = "dummy"
+    launched = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--launch"], env=environment, capture_output=True, text=True, check=True).stdout
+    exited = time.perf_counter()
+
+    times = json.loads(output.splitlines()[-1])
+    # the interpreter start and the shutdown are outside the measured process, the total covers them
+    times["total"] = exited - launched
+    return times
+
+def summarize(launches: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for phase in PHASES + ("total",):
+        values = sorted(launch[phase] for launch in launches)
+        summary[phase] = {"min": values[0], "median": values[len(values) // 2], "max": values[-1]}
+    return summary
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the time from launching the simulation to its first frame.")
+    parser.add_argument("--launches", type=int, default=5, help="cold launches to measure, each in a fresh interpreter")
+    parser.add_argument("--dummy-video", action="store_true", help="use the SDL dummy video driver instead of opening a window")
+    parser.add_argument("--output", default=None, help="also write the results as JSON to this file")
+    parser.add_argument("--launch", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+
+    if arguments.launch:
+        # the launched interpreter reports its times as the last line of its output
+        times = measure_launch()
+        sys.stdout.write(json.dumps(times) + "\n")
+        return 0
+
+    launches = []
+    for launch in range(arguments.launches):
+        times = run_launch(arguments.dummy_video)
+        launches.append(times)
+        sys.stdout.write(f"launch {launch + 1}: " + ", ".join(f"{phase} {times[phase] * 1000:.0f} ms" for phase in PHASES + ("total",)) + "\n")
+
+    results = {"launches": launches, "summary": summarize(launches)}
+    sys.stdout.write(f"median time to first frame {results['summary']['first_frame']['median'] * 1000:.0f} ms\n")
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            file.write(json.dumps(results, indent=4) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import os
+import socket
+import threading
+from typing import Union, List, Tuple, Dict
+import numpy as np
+
+from settings import *
+
+STREAM_MAGIC = b"GASFRAM2"
+
+# header in front of every frame, size is the number of bytes that follow it
+STREAM_FRAME_HEADER = np.dtype([
+    ("magic", "S8"),
+    ("frame", "<u8"),
+    ("systems", "<u8"),
+    ("size", "<u8"),
+])
+
+# header of every closed system in a frame, followed by count positions (<f4 x, y), count radii (<f4), count color buckets (u1)
+# and count tracer flags (u1), padded to 8 bytes
+STREAM_SYSTEM_HEADER = np.dtype([
+    ("count", "<u8"),
+    ("render_position", "<i8", (2,)),
+    ("container_bounds", "<f8", (4,)),    # left, top, right, bottom, in the coordinates of the positions
+    ("volume", "<f8"),
+    ("temperature", "<f8"),
+    ("measured_pressure", "<f8"),
+    ("ideal_pressure", "<f8"),
+    ("accurate_pressure", "<f8"),
+])
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 8)
+
+def encode_frame(frame: int, systems: list) -> bytes:
+    """ Packs the particles and observables of the systems into one frame. The arrays go in as raw buffers. """
+    parts = []
+    for system in systems:
+        # stand-ins for systems stepping elsewhere keep what they display in a local system
+        system = getattr(system, "local_system", system)
+        particles = system.particles
+        render_position = system.closed_system_render_position
+        container_bounds = system.container.get_container_bounds((-render_position[0], -render_position[1]))
+
+        header = np.zeros(1, dtype=STREAM_SYSTEM_HEADER)
+        header["count"] = len(particles)
+        header["render_position"] = render_position
+        header["container_bounds"] = (container_bounds["left"], container_bounds["top"], container_bounds["right"], container_bounds["bottom"])
+        header["volume"] = system.volume
+        header["temperature"] = system.temperature
+        header["measured_pressure"] = system.measured_pressure_windowed
+        header["ideal_pressure"] = system.ideal_pressure
+        header["accurate_pressure"] = float(system.accurate_pressure)
+
+        radii = particles.radii.astype("<f4")
+        color_buckets = particles.color_buckets
+        parts += [header.tobytes(), particles.positions.astype("<f4"), radii, color_buckets, particles.tracers.view(np.uint8),
+                  _padding(radii.nbytes + 2 * color_buckets.nbytes)]
+
+    size = sum(memoryview(part).nbytes for part in parts)
+    frame_header = np.zeros(1, dtype=STREAM_FRAME_HEADER)
+    frame_header["magic"] = STREAM_MAGIC
+    frame_header["frame"] = frame
+    frame_header["systems"] = len(systems)
+    frame_header["size"] = size
+    return b"".join([frame_header.tobytes()] + parts)
+
+def decode_frame(header: np.void, payload: Union[bytes, bytearray]) -> Dict[str, Union[int, list]]:
+    """ Unpacks a frame into a dict of the frame number and one dict per system. The arrays are views of the payload. """
+    systems = []
+    offset = 0
+    for _ in range(int(header["systems"])):
+        system_header = np.frombuffer(payload, dtype=STREAM_SYSTEM_HEADER, count=1, offset=offset)[0]
+        offset += STREAM_SYSTEM_HEADER.itemsize
+        count = int(system_header["count"])
+
+        positions = np.frombuffer(payload, dtype="<f4", count=2 * count, offset=offset).reshape(count, 2)
+        offset += positions.nbytes
+        radii = np.frombuffer(payload, dtype="<f4", count=count, offset=offset)
+        offset += radii.nbytes
+        color_buckets = np.frombuffer(payload, dtype=np.uint8, count=count, offset=offset)
+        offset += color_buckets.nbytes
+        tracers = np.frombuffer(payload, dtype=np.bool_, count=count, offset=offset)
+        offset += tracers.nbytes + len(_padding(radii.nbytes + 2 * count))
+
+        system = {name: system_header[name] for name in STREAM_SYSTEM_HEADER.names if name != "count"}
+        system.update(count=count, positions=positions, radii=radii, color_buckets=color_buckets, tracers=tracers)
+        systems.append(system)
+    return {"frame": int(header["frame"]), "systems": systems}
+
+def _socket_family(address: Union[str, Tuple[str, int]]) -> int:
+    # a path is a Unix socket, a (host, port) pair a TCP socket
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+class _Subscriber:
+    """ One connected viewer with its own writer thread. Only the newest frame waits to be sent, older ones are dropped. """
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection: socket.socket = connection
+        self.condition = threading.Condition()
+        self.pending_frame: Union[bytes, None] = None
+        self.closed: bool = False
+        self.frames_sent: int = 0
+        self.frames_dropped: int = 0
+
+        self.writer = threading.Thread(target=self._write_frames, daemon=True)
+        self.writer.start()
+
+    def offer(self, frame: bytes) -> None:
+        with self.condition:
+            if self.pending_frame is not None:
+                self.frames_dropped += 1
+            self.pending_frame = frame
+            self.condition.notify()
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def _write_frames(self) -> None:
+        while True:
+            with self.condition:
+                while self.pending_frame is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    break
+                frame, self.pending_frame = self.pending_frame, None
+            try:
+                self.connection.sendall(frame)
+            except OSError:
+                # the viewer went away
+                break
+            self.frames_sent += 1
+
+        self.closed = True
+        self.connection.close()
+
+class Stream_Server:
+    """ Publishes frames of the closed systems to any number of local subscribers over a Unix or TCP socket.
+
+    publish() encodes a frame only when someone is subscribed and hands it to the writer thread of every subscriber,
+    so the frame loop never waits on a socket. A subscriber that reads slower than frames are published misses frames.
+    """
+    def __init__(self, address: Union[str, Tuple[str, int]] = STREAM_ADDRESS) -> None:
+        self.address: Union[str, Tuple[str, int]] = address
+        self.subscribers: List[_Subscriber] = []
+        self.lock = threading.Lock()
+        self.frames_published: int = 0
+
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+        self.listener = socket.socket(_socket_family(address), socket.SOCK_STREAM)
+        if not isinstance(address, str):
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen()
+
+        self.acceptor = threading.Thread(target=self._accept_subscribers, daemon=True)
+        self.acceptor.start()
+
+    def _accept_subscribers(self) -> None:
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                # the listener was closed
+                break
+            if connection.family == socket.AF_INET:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.subscribers.append(_Subscriber(connection))
+
+    def publish(self, systems: list) -> None:
+        with self.lock:
+            self.subscribers = [subscriber for subscriber in self.subscribers if not subscriber.closed]
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+
+        frame = encode_frame(self.frames_published, systems)
+        self.frames_published += 1
+        for subscriber in subscribers:
+            subscriber.offer(frame)
+
+    def close(self) -> None:
+        self.listener.close()
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.close()
+            self.subscribers = []
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+class Stream_Client:
+    """ Subscribes to a Stream_Server and reads its frames, e.g. for a viewer or an analysis process. """
+    def __init__(self, address: Union[str, Tuple[str, int]] = STREAM_ADDRESS) -> None:
+        self.connection = socket.socket(_socket_family(address), socket.SOCK_STREAM)
+        self.connection.connect(address)
+
+    def _receive(self, size: int) -> Union[bytearray, None]:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            length = self.connection.recv_into(view[received:])
+            if length == 0:
+                return None
+            received += length
+        return buffer
+
+    def read_frame(self) -> Union[Dict[str, Union[int, list]], None]:
+        """ Blocks until the next frame arrives and returns it decoded (see decode_frame), or None once the server is gone. """
+        header_bytes = self._receive(STREAM_FRAME_HEADER.itemsize)
+        if header_bytes is None:
+            return None
+        header = np.frombuffer(header_bytes, dtype=STREAM_FRAME_HEADER)[0]
+        if header["magic"] != STREAM_MAGIC:
+            raise ValueError("The stream is out of sync or does not come from a Stream_Server")
+
+        payload = self._receive(int(header["size"]))
+        if payload is None:
+            return None
+        return decode_frame(header, payload)
+
+    def close(self) -> None:
+        self.connection.close()
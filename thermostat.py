@@ -0,0 +1,114 @@
+from abc import ABC, abstractmethod
+from typing import Union
+import numpy as np
+
+from settings import *
+from analytics import kinetic_temperature
+from species import species_kinetic_temperatures
+
+def sample_velocities(temperature: Union[float, int], masses: np.ndarray) -> np.ndarray:
+    """ Draws (N, 2) Maxwell-Boltzmann velocities for the given temperature, on the velocity scale of generate_velocities. """
+    # generate_velocities gives <v^2> = VELOCITY_SCALE^2 * 3kT/m, split evenly over the two components
+    deviations = VELOCITY_SCALE * np.sqrt(1.5 * BOLTZMANNS_CONSTANT * max(temperature, 0) / masses)
+    return np.random.normal(size=(len(masses), 2)) * deviations[:, None]
+
+class Thermostat(ABC):
+    """ Base of the thermostats. step() is called every simulation step and applies the thermostat every interval_steps steps.
+
+    Given the species index of every particle, each species is measured and moved toward the setpoint on its own, so
+    a mixture started with one species hot and one cold ends with both at the setpoint rather than only their mean.
+    """
+    def __init__(self, interval_steps: int = THERMOSTAT_INTERVAL_STEPS) -> None:
+        self.interval_steps: int = max(1, interval_steps)
+        self.steps: int = 0
+        self.elapsed: float = 0.0
+        self.measured_temperature: float = 0.0
+        # per species, a single entry without species
+        self.measured_temperatures: np.ndarray = np.zeros(1)
+        self.species: Union[np.ndarray, None] = None
+
+    def step(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], dt: float,
+             species: Union[np.ndarray, None] = None, number_of_species: int = 1) -> bool:
+        """ Moves the velocities toward the temperature setpoint in place. Returns whether they were changed. """
+        self.steps += 1
+        self.elapsed += dt
+        if self.steps % self.interval_steps != 0 or len(velocities) == 0:
+            return False
+
+        elapsed = self.elapsed
+        self.elapsed = 0.0
+        self.measured_temperature = kinetic_temperature(velocities, masses)
+        self.species = species
+        if species is None:
+            self.measured_temperatures = np.array([self.measured_temperature])
+        else:
+            self.measured_temperatures = species_kinetic_temperatures(velocities, np.broadcast_to(masses, (len(velocities),)), species, number_of_species)
+        return self.apply(velocities, masses, temperature, elapsed)
+
+    @abstractmethod
+    def apply(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], dt: float) -> bool:
+        """ Moves the velocities toward the temperature over dt seconds, the time since the thermostat last acted. """
+
+    def _rescale(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], scalings: np.ndarray) -> bool:
+        """ Scales the velocities of every species by its entry of scalings. """
+        cold = self.measured_temperatures == 0
+        if self.species is None:
+            velocities *= scalings[0]
+        else:
+            velocities *= scalings[self.species][:, None]
+        if not cold.any() or temperature <= 0:
+            return not cold.all()
+
+        # species at rest have nothing to scale, they start over from a fresh distribution
+        selected = np.arange(len(velocities)) if self.species is None else np.flatnonzero(cold[self.species])
+        velocities[selected] = sample_velocities(temperature, np.broadcast_to(masses, (len(velocities),))[selected])
+        return True
+
+    def _temperature_ratios(self, temperature: Union[float, int]) -> np.ndarray:
+        # setpoint over the measured temperature of every species, 0 for species at rest
+        measured = self.measured_temperatures
+        return np.divide(max(temperature, 0), measured, out=np.zeros(len(measured)), where=measured > 0)
+
+class Instant_Thermostat(Thermostat):
+    """ Rescales the velocities so the kinetic temperature of every species equals the setpoint exactly. """
+    def apply(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], dt: float) -> bool:
+        return self._rescale(velocities, masses, temperature, np.sqrt(self._temperature_ratios(temperature)))
+
+class Berendsen_Thermostat(Thermostat):
+    """ Rescales the velocities so the kinetic temperature of every species relaxes exponentially toward the setpoint with time_constant seconds. """
+    def __init__(self, time_constant: float = BERENDSEN_TIME_CONSTANT, interval_steps: int = THERMOSTAT_INTERVAL_STEPS) -> None:
+        super().__init__(interval_steps)
+        self.time_constant: float = time_constant
+
+    def apply(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], dt: float) -> bool:
+        coupling = min(1.0, dt / self.time_constant)
+        scalings = np.sqrt(np.maximum(0.0, 1 + coupling * (self._temperature_ratios(temperature) - 1)))
+        return self._rescale(velocities, masses, temperature, scalings)
+
+class Andersen_Thermostat(Thermostat):
+    """ Gives every particle, with probability collision_frequency * dt, a new velocity drawn at the setpoint temperature. """
+    def __init__(self, collision_frequency: float = ANDERSEN_COLLISION_FREQUENCY, interval_steps: int = THERMOSTAT_INTERVAL_STEPS) -> None:
+        super().__init__(interval_steps)
+        self.collision_frequency: float = collision_frequency
+
+    def apply(self, velocities: np.ndarray, masses: np.ndarray, temperature: Union[float, int], dt: float) -> bool:
+        probability = min(1.0, self.collision_frequency * dt)
+        selected = np.flatnonzero(np.random.random(len(velocities)) < probability)
+        if len(selected) == 0:
+            return False
+        velocities[selected] = sample_velocities(temperature, np.broadcast_to(masses, (len(velocities),))[selected])
+        return True
+
+THERMOSTATS = {
+    "instant": Instant_Thermostat,
+    "berendsen": Berendsen_Thermostat,
+    "andersen": Andersen_Thermostat,
+}
+
+def create_thermostat(name: Union[str, None]) -> Union[Thermostat, None]:
+    """ Creates a thermostat by name ("instant", "berendsen" or "andersen"), or returns None for no thermostat. """
+    if name is None:
+        return None
+    if name not in THERMOSTATS:
+        raise ValueError(f"Unknown thermostat {name!r}, expected one of {sorted(THERMOSTATS)} or None")
+    return THERMOSTATS[name]()
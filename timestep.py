@@ -0,0 +1,51 @@
+from typing import Union
+import numpy as np
+
+from settings import *
+
+class Substep_Controller:
+    """ Splits a frame into the fewest substeps that keep any two particles from closing in by more than max_displacement radii per substep.
+
+    The bound comes from the fastest particle: two particles close in at most at twice its speed, a particle and the moving cap
+    at its speed plus the speed of the cap. A cold gas runs one step per frame and only hot gases pay for substeps.
+    With the default of two radii, one diameter of the smallest particle, two particles that are apart before a substep cannot
+    get past each other without overlapping after it, so every collision is seen by an overlap test.
+    """
+    def __init__(self, max_displacement: float = SUBSTEP_MAX_DISPLACEMENT, max_substeps: int = MAX_SUBSTEPS) -> None:
+        self.max_displacement: float = max_displacement
+        self.max_substeps: int = max(1, max_substeps)
+
+        # statistics
+        self.last_substeps: int = 1
+        self.total_substeps: int = 0
+        self.steps: int = 0
+        self.capped_steps: int = 0
+
+    def substeps(self, velocities: np.ndarray, radii: np.ndarray, container_bounds: dict, dt: float, wall_speed: float = 0.0) -> int:
+        """ Returns the number of substeps for a step of dt and counts it in the statistics. wall_speed is the speed of a moving wall (the cap). """
+        substeps = 1
+        if len(velocities) and dt > 0:
+            # two particles moving head on close in at twice the largest speed, a particle and a wall at the sum of their speeds
+            max_particle_speed = float(np.sqrt(np.max(np.einsum("ij,ij->i", velocities, velocities))))
+            max_speed = max(2 * max_particle_speed, max_particle_speed + abs(wall_speed))
+            # a particle must not cross a whole container either, which matters for containers squeezed below a particle radius
+            container_size = min(container_bounds["right"] - container_bounds["left"], container_bounds["bottom"] - container_bounds["top"])
+            max_step = min(self.max_displacement * float(radii.min()), max(container_size, 1.0))
+            needed = int(np.ceil(max_speed * dt / max_step)) if max_step > 0 else 1
+            substeps = max(1, min(needed, self.max_substeps))
+            self.capped_steps += needed > self.max_substeps
+
+        self.last_substeps = substeps
+        self.total_substeps += substeps
+        self.steps += 1
+        return substeps
+
+    @property
+    def mean_substeps(self) -> float:
+        return self.total_substeps / self.steps if self.steps else 1.0
+
+def create_substep_controller(max_substeps: Union[int, None]) -> Union[Substep_Controller, None]:
+    """ Creates a controller allowing up to max_substeps substeps, or returns None (one step per frame) for None or 1. """
+    if max_substeps is None or max_substeps <= 1:
+        return None
+    return Substep_Controller(max_substeps=max_substeps)
@@ -0,0 +1,285 @@
+import queue
+import threading
+import pygame
+from typing import Union
+import numpy as np
+
+from settings import *
+
+TRAJECTORY_MAGIC = b"GASTRAJ2"
+
+# fixed-size header at the start of every trajectory file, padded to TRAJECTORY_HEADER_SIZE bytes
+TRAJECTORY_HEADER = np.dtype([
+    ("magic", "S8"),
+    ("capacity", "<u8"),       # particles per frame (frames with fewer particles leave the rest unused)
+    ("dtype", "S8"),           # dtype of the position and velocity arrays, e.g. "<f4"
+    ("frame_stride", "<u8"),   # bytes per frame
+    ("frame_count", "<u8"),    # frames completely written
+])
+TRAJECTORY_HEADER_SIZE = 64
+
+def frame_dtype(capacity: int, dtype: Union[str, np.dtype] = TRAJECTORY_DTYPE) -> np.dtype:
+    """ Returns the record layout of one frame holding up to capacity particles. """
+    dtype = np.dtype(dtype)
+    return np.dtype([
+        ("time", "<f8"),
+        ("count", "<i8"),
+        ("temperature", "<f8"),
+        ("volume", "<f8"),
+        ("measured_pressure", "<f8"),
+        ("measured_pressure_windowed", "<f8"),
+        ("ideal_pressure", "<f8"),
+        ("accurate_pressure", "<f8"),
+        ("positions", dtype, (capacity, 2)),
+        ("velocities", dtype, (capacity, 2)),
+        ("color_buckets", "u1", (capacity,)),
+        ("radii", dtype, (capacity,)),
+        ("species", "u1", (capacity,)),
+        ("tracers", "?", (capacity,)),
+    ])
+
+def _read_header(path: str) -> np.void:
+    header = np.fromfile(path, dtype=TRAJECTORY_HEADER, count=1)
+    if len(header) != 1 or not header[0]["magic"].startswith(TRAJECTORY_MAGIC[:7]):
+        raise ValueError(f"{path!r} is not a trajectory file")
+    if header[0]["magic"] != TRAJECTORY_MAGIC:
+        raise ValueError(f"{path!r} was recorded in an older trajectory format without radii, species and tracers, record it again")
+    return header[0]
+
+class Trajectory_Recorder:
+    """ Appends frames of a closed system to a memory-mapped trajectory file.
+
+    record() only copies the arrays into an in-memory chunk. Full chunks go to a writer thread,
+    which grows the file and copies the chunk into a memory map of the new region, so the frame loop never waits on the disk.
+    """
+    def __init__(self, path: str, capacity: int, dtype: Union[str, np.dtype] = TRAJECTORY_DTYPE, chunk_frames: int = TRAJECTORY_CHUNK_FRAMES) -> None:
+        self.path: str = path
+        self.capacity: int = capacity
+        self.frame_dtype: np.dtype = frame_dtype(capacity, dtype)
+        self.chunk_frames: int = max(1, chunk_frames)
+
+        self.header: np.ndarray = np.zeros(1, dtype=TRAJECTORY_HEADER)
+        self.header["magic"] = TRAJECTORY_MAGIC
+        self.header["capacity"] = capacity
+        self.header["dtype"] = np.dtype(dtype).str.encode()
+        self.header["frame_stride"] = self.frame_dtype.itemsize
+        with open(self.path, "wb") as file:
+            file.write(self.header.tobytes().ljust(TRAJECTORY_HEADER_SIZE, b"\0"))
+
+        # chunks cycle between the recorder and the writer thread, a few of them keep the recorder from waiting on a busy disk
+        self.free_chunks: queue.Queue = queue.Queue()
+        for _ in range(3):
+            self.free_chunks.put(np.zeros(self.chunk_frames, dtype=self.frame_dtype))
+        self.full_chunks: queue.Queue = queue.Queue()
+
+        self.chunk: np.ndarray = self.free_chunks.get()
+        self.chunk_length: int = 0
+        self.frames_recorded: int = 0
+        self.time: float = 0.0
+
+        self.writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self.writer.start()
+
+    def _write_chunks(self) -> None:
+        frames_written = 0
+        while True:
+            chunk, length = self.full_chunks.get()
+            if chunk is None:
+                break
+
+            offset = TRAJECTORY_HEADER_SIZE + frames_written * self.frame_dtype.itemsize
+            with open(self.path, "r+b") as file:
+                file.truncate(offset + length * self.frame_dtype.itemsize)
+            frames = np.memmap(self.path, dtype=self.frame_dtype, mode="r+", offset=offset, shape=(length,))
+            frames[:] = chunk[:length]
+            frames.flush()
+            del frames
+            frames_written += length
+
+            # the frame count goes in last, so readers never see frames that are not written yet
+            header = np.memmap(self.path, dtype=TRAJECTORY_HEADER, mode="r+", shape=(1,))
+            header["frame_count"] = frames_written
+            header.flush()
+            del header
+
+            self.free_chunks.put(chunk)
+
+    def record(self, system, dt: float) -> None:
+        """ Copies the current state of a closed system into the next frame. """
+        particles = system.particles
+        count = len(particles)
+        if count > self.capacity:
+            raise ValueError(f"The trajectory holds at most {self.capacity} particles per frame, the system has {count}")
+
+        self.time += dt
+        frame = self.chunk[self.chunk_length]
+        frame["time"] = self.time
+        frame["count"] = count
+        frame["temperature"] = system.temperature
+        frame["volume"] = system.volume
+        frame["measured_pressure"] = system.measured_pressure
+        frame["measured_pressure_windowed"] = system.measured_pressure_windowed
+        frame["ideal_pressure"] = system.ideal_pressure
+        frame["accurate_pressure"] = float(system.accurate_pressure)
+
+        chunk_index = self.chunk_length
+        self.chunk["positions"][chunk_index, :count] = particles.positions
+        self.chunk["velocities"][chunk_index, :count] = particles.velocities
+        self.chunk["color_buckets"][chunk_index, :count] = particles.color_buckets
+        self.chunk["radii"][chunk_index, :count] = particles.radii
+        self.chunk["species"][chunk_index, :count] = particles.species
+        self.chunk["tracers"][chunk_index, :count] = particles.tracers
+
+        self.chunk_length += 1
+        self.frames_recorded += 1
+        if self.chunk_length == self.chunk_frames:
+            self._submit_chunk()
+
+    def _submit_chunk(self) -> None:
+        if self.chunk_length == 0:
+            return
+        self.full_chunks.put((self.chunk, self.chunk_length))
+        self.chunk = self.free_chunks.get()
+        self.chunk_length = 0
+
+    def close(self) -> None:
+        """ Writes the frames still buffered and waits for the writer thread to finish. """
+        if not self.writer.is_alive():
+            return
+        self._submit_chunk()
+        self.full_chunks.put((None, 0))
+        self.writer.join()
+
+class Trajectory:
+    """ Read-only memory map of a trajectory file. Every array it returns is a view of the file, nothing is copied. """
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        header = _read_header(path)
+        self.capacity: int = int(header["capacity"])
+        self.dtype: np.dtype = np.dtype(header["dtype"].decode())
+        self.frame_dtype: np.dtype = frame_dtype(self.capacity, self.dtype)
+        if self.frame_dtype.itemsize != int(header["frame_stride"]):
+            raise ValueError(f"{path!r} has a frame stride of {int(header['frame_stride'])} bytes, expected {self.frame_dtype.itemsize}")
+
+        self.frame_count: int = int(header["frame_count"])
+        if self.frame_count > 0:
+            self.frames: np.ndarray = np.memmap(path, dtype=self.frame_dtype, mode="r", offset=TRAJECTORY_HEADER_SIZE, shape=(self.frame_count,))
+        else:
+            self.frames = np.zeros(0, dtype=self.frame_dtype)
+
+        # per-field views over all frames, indexing them gives views of a single frame
+        self.times: np.ndarray = self.frames["time"]
+        self.counts: np.ndarray = self.frames["count"]
+        self.temperatures: np.ndarray = self.frames["temperature"]
+        self.volumes: np.ndarray = self.frames["volume"]
+        self.measured_pressures: np.ndarray = self.frames["measured_pressure"]
+        self.measured_pressures_windowed: np.ndarray = self.frames["measured_pressure_windowed"]
+        self.ideal_pressures: np.ndarray = self.frames["ideal_pressure"]
+        self.accurate_pressures: np.ndarray = self.frames["accurate_pressure"]
+        self._positions: np.ndarray = self.frames["positions"]
+        self._velocities: np.ndarray = self.frames["velocities"]
+        self._color_buckets: np.ndarray = self.frames["color_buckets"]
+        self._radii: np.ndarray = self.frames["radii"]
+        self._species: np.ndarray = self.frames["species"]
+        self._tracers: np.ndarray = self.frames["tracers"]
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def positions(self, frame: int) -> np.ndarray:
+        return self._positions[frame, :self.counts[frame]]
+
+    def velocities(self, frame: int) -> np.ndarray:
+        return self._velocities[frame, :self.counts[frame]]
+
+    def color_buckets(self, frame: int) -> np.ndarray:
+        return self._color_buckets[frame, :self.counts[frame]]
+
+    def radii(self, frame: int) -> np.ndarray:
+        return self._radii[frame, :self.counts[frame]]
+
+    def species(self, frame: int) -> np.ndarray:
+        """ Species index of every particle, into the species table of the recorded system. """
+        return self._species[frame, :self.counts[frame]]
+
+    def tracers(self, frame: int) -> np.ndarray:
+        return self._tracers[frame, :self.counts[frame]]
+
+class Replay_System:
+    """ Stand-in for a Closed_System that plays a recorded trajectory back instead of simulating.
+
+    The particle arrays of the current frame are passed from the memory map straight to the renderer.
+    Pausing and frame skipping work as for a live system, temperature changes are ignored.
+    """
+    def __init__(self, closed_system_render_position: Union[list, tuple], path: str, **system_arguments) -> None:
+        from closed_system import Closed_System
+
+        self.trajectory: Trajectory = Trajectory(path)
+        self.frame: int = 0
+
+        # local system for the container, the labels and the background
+        self.local_system: Closed_System = Closed_System(closed_system_render_position, **system_arguments)
+        self.local_system.container.interactive = False
+        self._show_frame()
+
+    @property
+    def closed_system_render_position(self) -> Union[list, tuple]:
+        return self.local_system.closed_system_render_position
+
+    @property
+    def container(self):
+        return self.local_system.container
+
+    @property
+    def temperature(self) -> Union[float, int]:
+        return self.local_system.temperature
+
+    def _show_frame(self) -> None:
+        if len(self.trajectory) == 0:
+            return
+
+        trajectory = self.trajectory
+        frame = self.frame
+        system = self.local_system
+        temperature = float(trajectory.temperatures[frame])
+        system.temperature = int(temperature) if temperature.is_integer() else temperature
+        system.volume = round(float(trajectory.volumes[frame]), 2)
+        system.measured_pressure = float(trajectory.measured_pressures[frame])
+        system.measured_pressure_windowed = float(trajectory.measured_pressures_windowed[frame])
+        system.ideal_pressure = float(trajectory.ideal_pressures[frame])
+        system.accurate_pressure = f"{trajectory.accurate_pressures[frame]:.{2}e}"
+        system.container.set_volume_meters(system.volume)
+
+    def add_species(self, name: str, mass: float = PARTICLE_MASS, radius: float = PARTICLE_RADIUS, color: Union[list, tuple] = (0,0,255)) -> int:
+        raise ValueError("A replayed trajectory cannot take new species")
+
+    def add_particles(self, number_of_particles: int = 10, color = None, tracer: bool = False, species: Union[int, str] = 0) -> None:
+        pass
+
+    def set_temperature(self, new_temperature: Union[float, int]) -> None:
+        pass
+
+    def adjust_temperature(self, temperature_adjustment: Union[float, int]) -> None:
+        pass
+
+    def update(self, dt: float, update_particles_movement: bool = True) -> None:
+        """ Moves on to the next recorded frame, stopping at the last one. """
+        if update_particles_movement and self.frame < len(self.trajectory) - 1:
+            self.frame += 1
+            self._show_frame()
+
+        if not self.local_system.headless:
+            self.local_system.update_ui()
+
+    def render(self, render_surface: pygame.Surface) -> None:
+        system = self.local_system
+        system.render_surface.fill(system.closed_system_background_color)
+        system.container.render(system.render_surface, offset=(-system.closed_system_render_position[0], -system.closed_system_render_position[1]))
+
+        if len(self.trajectory) > 0:
+            trajectory, frame = self.trajectory, self.frame
+            system.render_particles(trajectory.positions(frame), trajectory.velocities(frame), trajectory.radii(frame), trajectory.color_buckets(frame),
+                                    trajectory.tracers(frame))
+
+        system.render_ui(system.render_surface)
+        render_surface.blit(system.render_surface, system.closed_system_render_position)
@@ -1,5 +1,15 @@
 import pygame
-from typing import Union
+from typing import Union, Dict, Tuple
+
+# fonts shared by every Text of the same face and size, loading a font file is the slow part of creating a label
+FONT_CACHE: Dict[Tuple[Union[str, None], int], pygame.font.Font] = {}
+
+def get_font(face: Union[str, None], size: int) -> pygame.font.Font:
+    """ Returns the font of the given face (a file path, or None for the default font) and size, loading it only the first time. """
+    key = (face, size)
+    if key not in FONT_CACHE:
+        FONT_CACHE[key] = pygame.font.Font(face, size)
+    return FONT_CACHE[key]
 
 class Text:
     def __init__(self, text: str, size: int, position: Union[list, tuple], font: Union[str, None] = None, color: Union[list, tuple] = (0,0,0)) -> None:
@@ -9,12 +19,17 @@ class Text:
         self.color = color
         self.position = position
 
-        self.font = pygame.font.Font(self.font, self.size)
+        self.font = get_font(self.font, self.size)
         self.rendered_text = self.font.render(self.text, True, self.color)
         self.rect = self.rendered_text.get_rect(midleft = self.position)
     
     def set_text(self, new_text: str) -> None:
-        self.text = str(new_text)
+        new_text = str(new_text)
+        # only re-render when the string actually changed
+        if new_text == self.text:
+            return
+
+        self.text = new_text
         self.rendered_text = self.font.render(self.text, True, self.color)
         self.rect = self.rendered_text.get_rect(midleft = self.position)
 
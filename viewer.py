@@ -0,0 +1,90 @@
+import argparse
+import sys
+from typing import Union, List, Dict
+import pygame
+import numpy as np
+
+from settings import *
+from particle_renderer import Particle_Renderer
+from stream import Stream_Client
+from ui.text import Text
+
+class Stream_Viewer:
+    """ Window drawing the closed systems of a simulation from its stream, laid out like the simulation. """
+    def __init__(self, client: Stream_Client) -> None:
+        self.client: Stream_Client = client
+        self.display = pygame.display.get_surface()
+        self.particle_renderer: Particle_Renderer = Particle_Renderer()
+        self.render_surface: pygame.Surface = pygame.Surface(CLOSED_SYSTEM_RENDER_SURFACE_SIZE)
+        self.labels: List[List[Text]] = []
+
+    def render_system(self, system: Dict[str, Union[int, np.ndarray]], labels: List[Text]) -> None:
+        self.render_surface.fill(BACKGROUND_COLOR)
+
+        left, top, right, bottom = system["container_bounds"].tolist()
+        pygame.draw.line(self.render_surface, (0,0,0), (left, top), (left, bottom))
+        pygame.draw.line(self.render_surface, (0,0,0), (left, top), (right, top))
+        pygame.draw.line(self.render_surface, (0,0,0), (left, bottom), (right, bottom))
+        pygame.draw.line(self.render_surface, (255,0,0), (right, top), (right, bottom))
+
+        self.particle_renderer.render(self.render_surface, system["positions"], system["radii"], system["color_buckets"])
+
+        labels[0].set_text(f"Volume: {system['volume']:.2f} m")
+        labels[1].set_text(f"Pressure: {system['accurate_pressure']:.2e} Pa")
+        labels[2].set_text(f"Temperature: {system['temperature']:g} K")
+        labels[3].set_text(f"Measured Pressure: {system['measured_pressure']:.2e} (ideal {system['ideal_pressure']:.2e})")
+        for label in labels:
+            label.render(self.render_surface)
+
+        self.display.blit(self.render_surface, system["render_position"].tolist())
+
+    def run(self) -> None:
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
+                    return
+
+            frame = self.client.read_frame()
+            if frame is None:
+                # the simulation has quit
+                return
+
+            while len(self.labels) < len(frame["systems"]):
+                self.labels.append([Text("", 26, position) for position in ((100,320), (300,320), (550,320), (100,340))])
+
+            self.display.fill(BACKGROUND_COLOR)
+            for system, labels in zip(frame["systems"], self.labels):
+                self.render_system(system, labels)
+            pygame.display.update()
+
+def parse_address(address: str) -> Union[str, tuple]:
+    """ Reads "host:port" as a TCP address and anything else as the path of a Unix socket. """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return (host, int(port))
+    return address
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show a running simulation from its stream (see STREAM_ADDRESS in settings.py).")
+    parser.add_argument("--address", default=None, help="host:port of a TCP stream or the path of a Unix socket, default STREAM_ADDRESS")
+    arguments = parser.parse_args(argv)
+
+    address = parse_address(arguments.address) if arguments.address is not None else STREAM_ADDRESS
+    if address is None:
+        sys.stdout.write("No stream address, pass --address or set STREAM_ADDRESS in settings.py\n")
+        return 1
+
+    pygame.init()
+    pygame.display.set_mode((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    pygame.display.set_caption("Ideal Gas Simulation Viewer")
+
+    client = Stream_Client(address)
+    try:
+        Stream_Viewer(client).run()
+    finally:
+        client.close()
+        pygame.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())